@@ -9,6 +9,7 @@ import streamlit as st
 import src.Pages.NewUserPage as NewUserPage
 import src.Pages.ReturningUserPage as ReturningUserPage
 import src.SessionState as SessionState
+import src.Metrics as Metrics
 from PIL import Image
 
 COVID_IMAGE_URL = './assets/covid.png'
@@ -114,6 +115,7 @@ def information_section(session_state):
 if __name__ == '__main__':
   logger = logging.getLogger()
   logger.setLevel(logging.INFO) 
+  Metrics.from_environment()
 
   setup_page()
   session_state = SessionState.get(recording_hash=None,
@@ -0,0 +1,389 @@
+import os
+import csv
+import time
+import sqlite3
+import logging
+import tempfile
+from itertools import islice, repeat
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from scipy.io import wavfile
+
+from .. import ModelRegistry
+from ..CoughDetector import CoughDetector
+from ..CovidClassifier import CovidClassifier
+
+CLINICAL_FIELDS = ['age', 'respiratory_condition', 'fever_muscle_pain']
+COLUMNS = ['file', 'cough_conf', 'prob_healthy', 'prob_symptomatic', 'prob_covid',
+           'decode_seconds', 'cough_seconds', 'covid_seconds', 'error']
+DEFAULT_BATCH_SIZE = 16
+
+_cough_detector = None
+_covid_classifier = None
+
+def iter_inputs(source):
+    """Streams the recordings to score from a directory of WAV files or a CSV manifest.
+
+    A manifest needs a 'path' column (relative paths are resolved against the manifest's
+    directory) and may provide the clinical fields age, respiratory_condition and fever_muscle_pain.
+
+    Args:
+        source (str): directory or manifest path
+
+    Returns:
+        generator of (path, clinical_features) tuples
+    """
+    if os.path.isdir(source):
+        for entry in sorted(os.scandir(source), key=lambda entry: entry.name):
+            if entry.is_file() and entry.name.lower().endswith('.wav'):
+                yield entry.path, {}
+        return
+
+    base_dir = os.path.dirname(os.path.abspath(source))
+    with open(source, newline='') as f:
+        for row in csv.DictReader(f):
+            path = row['path'] if os.path.isabs(row['path']) else os.path.join(base_dir, row['path'])
+            clinical_features = {field: row[field] for field in CLINICAL_FIELDS if row.get(field, '') != ''}
+            yield path, clinical_features
+
+def score_file(path, clinical_features):
+    """Scores one WAV file with the cough detector and the Covid-19 classifier.
+
+    Args:
+        path (str): WAV file
+        clinical_features (dict): clinical fields, missing fields are treated like in the app
+
+    Returns:
+        (dict): output row with cough confidence, class probabilities and timings
+    """
+    return score_files([(path, clinical_features)])[0]
+
+def score_files(items):
+    """Scores WAV files with one batch call of the cough detector and one of the Covid-19 classifier.
+
+    Every file is decoded and its features extracted on its own, while the scaler and model calls
+    and the VGGish round trip are shared by all files. The time of the shared calls is split
+    evenly between the rows they scored.
+
+    Args:
+        items (list): (path, clinical_features) tuples, see score_file
+
+    Returns:
+        (list): output rows as returned by score_file, in the order of items
+    """
+    global _cough_detector, _covid_classifier
+    if _cough_detector is None:
+        _cough_detector, _covid_classifier = CoughDetector(), CovidClassifier()
+
+    rows, recordings = [], []
+    for path, clinical_features in items:
+        row = dict.fromkeys(COLUMNS, '')
+        row['file'] = path
+        rows.append(row)
+        try:
+            start = time.perf_counter()
+            rate, audio = wavfile.read(path)
+            row['decode_seconds'] = time.perf_counter() - start
+            recordings.append((row, audio, rate, clinical_features))
+        except Exception as e:
+            _fail(row, f'{type(e).__name__}: {e}')
+
+    if recordings:
+        start = time.perf_counter()
+        try:
+            features, errors = _cough_detector.extract_features_batch([audio for _, audio, _, _ in recordings],
+                                                                      [rate for _, _, rate, _ in recordings])
+            cough_confs = _cough_detector.classify_cough_batch(features, errors)
+        except Exception as e:
+            errors = [f'{type(e).__name__}: {e}'] * len(recordings)
+        cough_seconds = (time.perf_counter() - start) / len(recordings)
+        for i, (row, *_) in enumerate(recordings):
+            row['cough_seconds'] = cough_seconds
+            if errors[i] is None:
+                row['cough_conf'] = float(cough_confs[i])
+            else:
+                _fail(row, errors[i])
+        recordings = [recording for recording in recordings if not recording[0]['error']]
+
+    prepared = []
+    for row, audio, rate, clinical_features in recordings:
+        start = time.perf_counter()
+        try:
+            prepared.append((row, _covid_classifier.prepare(audio, rate, clinical_features)))
+        except Exception as e:
+            _fail(row, f'{type(e).__name__}: {e}')
+        row['covid_seconds'] = time.perf_counter() - start
+
+    if prepared:
+        start = time.perf_counter()
+        try:
+            probabilities = _covid_classifier.classify_prepared_batch([inputs for _, inputs in prepared])
+        except Exception as e:
+            probabilities = None
+            for row, _ in prepared:
+                _fail(row, f'{type(e).__name__}: {e}')
+        covid_seconds = (time.perf_counter() - start) / len(prepared)
+        for i, (row, _) in enumerate(prepared):
+            row['covid_seconds'] += covid_seconds
+            if probabilities is not None:
+                row['prob_healthy'], row['prob_symptomatic'], row['prob_covid'] = (float(p) for p in probabilities[i])
+    return rows
+
+def _fail(row, error):
+    logging.error('Could not score %s: %s', row['file'], error)
+    row['error'] = error
+
+class _RowIndex:
+    """Position of the latest output row of every file and whether it failed, kept on disk.
+
+    A temporary SQLite database stands in for a dict of all rows, so resuming and compacting a
+    large output never hold it in memory. Rows are added in output order, a later row of a file
+    replaces the earlier one.
+    """
+    def __init__(self):
+        self._dir = tempfile.TemporaryDirectory(prefix='batch_scoring_')
+        self._connection = sqlite3.connect(os.path.join(self._dir.name, 'index.sqlite'))
+        # Rebuilt from the output on every run, so it needs no durability
+        self._connection.execute('PRAGMA journal_mode=OFF')
+        self._connection.execute('PRAGMA synchronous=OFF')
+        self._connection.execute('CREATE TABLE rows (file TEXT PRIMARY KEY, position INTEGER, failed INTEGER)')
+
+    def add(self, rows):
+        """Adds (file, position, failed) tuples, position being where the row is in the output."""
+        self._connection.executemany('INSERT OR REPLACE INTO rows VALUES (?, ?, ?)', rows)
+
+    def clear(self):
+        self._connection.execute('DELETE FROM rows')
+
+    def latest(self, file, position):
+        """Whether the row at position is the latest row of the file."""
+        row = self._connection.execute('SELECT position FROM rows WHERE file = ?', (file,)).fetchone()
+        return row is not None and row[0] == position
+
+    def completed(self, file):
+        """Whether the latest row of the file scored it successfully."""
+        row = self._connection.execute('SELECT failed FROM rows WHERE file = ?', (file,)).fetchone()
+        return row is not None and not row[0]
+
+    def n_completed(self):
+        return self._connection.execute('SELECT COUNT(*) FROM rows WHERE NOT failed').fetchone()[0]
+
+    def __len__(self):
+        return self._connection.execute('SELECT COUNT(*) FROM rows').fetchone()[0]
+
+    def close(self):
+        self._connection.close()
+        self._dir.cleanup()
+
+class CsvOutput:
+    """Appends output rows to a CSV file, flushing after every row.
+
+    Only the latest row of every file is kept: when a file that failed before is scored again, its
+    error row is replaced once the run ends (or when the next run starts, after a crash). A row cut
+    off by a crash is dropped and scored again. The file is streamed against a _RowIndex rather
+    than read into memory.
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def completed(self, file):
+        """Whether the file was already scored successfully in a previous run."""
+        return self._index.completed(file)
+
+    def n_completed(self):
+        """Gets the number of files already scored successfully in a previous run."""
+        return self._index.n_completed()
+
+    def __enter__(self):
+        self._index = _RowIndex()
+        self.__compact()
+        new_file = not os.path.isfile(self.path) or os.path.getsize(self.path) == 0
+        self._file = open(self.path, 'a', newline='')
+        self._writer = csv.DictWriter(self._file, fieldnames=COLUMNS)
+        if new_file:
+            self._writer.writeheader()
+        return self
+
+    def write(self, row):
+        self._writer.writerow(row)
+        self._file.flush()
+
+    def __exit__(self, *exc):
+        self._file.close()
+        try:
+            self.__compact()
+        finally:
+            self._index.close()
+
+    def __rows(self):
+        """Streams the position and fields of every row, None for rows cut off by a crash."""
+        with open(self.path, newline='') as f:
+            for position, row in enumerate(csv.DictReader(f)):
+                # Rows cut off by a crash lack fields, DictReader fills them with None
+                yield position, row if None not in row.values() and None not in row else None
+
+    def __compact(self):
+        """Indexes the latest complete row of every file and rewrites the file with them, if it holds anything else."""
+        self._index.clear()
+        if not os.path.isfile(self.path) or os.path.getsize(self.path) == 0:
+            return
+        # A crash can leave the last row without its line break; new rows must not continue it
+        with open(self.path, 'rb+') as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                f.seek(0)
+                f.truncate(f.read().rfind(b'\n') + 1)
+        with open(self.path, newline='') as f:
+            n_lines = sum(1 for _ in csv.reader(f)) - 1
+        self._index.add((row['file'], position, bool(row['error'])) for position, row in self.__rows() if row is not None)
+        n_rows = len(self._index)
+        if n_rows == n_lines:
+            return
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=COLUMNS)
+            writer.writeheader()
+            writer.writerows(row for position, row in self.__rows()
+                             if row is not None and self._index.latest(row['file'], position))
+        os.replace(tmp_path, self.path)
+        logging.info('Dropped %d superseded or incomplete rows from %s.', n_lines - n_rows, self.path)
+
+class ParquetOutput:
+    """Writes output rows to a directory of Parquet files, one finished file per row group.
+
+    Every part file appears under its final name only once it is complete, so a crash loses at
+    most the rows of the unfinished row group, which are scored again on resume. Part files
+    that cannot be read, e.g. left by older versions after a crash, are moved aside. Like
+    CsvOutput, only the latest row of every file is kept, and part files are read one at a time.
+    """
+    def __init__(self, path, row_group_size=256):
+        self.path = path
+        self.row_group_size = row_group_size
+
+    def completed(self, file):
+        """Whether the file was already scored successfully in a previous run."""
+        return self._index.completed(file)
+
+    def n_completed(self):
+        """Gets the number of files already scored successfully in a previous run."""
+        return self._index.n_completed()
+
+    def __enter__(self):
+        import pyarrow as pa
+        os.makedirs(self.path, exist_ok=True)
+        self._schema = pa.schema([(column, pa.string() if column in ('file', 'error') else pa.float64()) for column in COLUMNS])
+        self._rows = []
+        self._index = _RowIndex()
+        self.__drop_superseded()
+        return self
+
+    def write(self, row):
+        self._rows.append(row)
+        if len(self._rows) >= self.row_group_size:
+            self.__flush()
+
+    def __flush(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        if self._rows:
+            columns = {column: [row[column] if row[column] != '' else None for row in self._rows] for column in COLUMNS}
+            # Names sort by creation time, which tells later rows of a file from earlier ones
+            name = f'part-{time.time_ns():020d}-{os.getpid()}.parquet'
+            tmp_path = os.path.join(self.path, f'.{name}.tmp')
+            pq.write_table(pa.table(columns, schema=self._schema), tmp_path)
+            os.replace(tmp_path, os.path.join(self.path, name))
+            self._rows = []
+
+    def __exit__(self, *exc):
+        try:
+            self.__flush()
+            self.__drop_superseded()
+        finally:
+            self._index.close()
+
+    def __parts(self):
+        """Reads the file and error columns of every part file, one part at a time in creation order."""
+        import pyarrow.parquet as pq
+        for name in sorted(os.listdir(self.path)):
+            if not name.endswith('.parquet') or name.startswith(('.', '_')):
+                continue
+            part_path = os.path.join(self.path, name)
+            try:
+                table = pq.read_table(part_path, columns=['file', 'error'])
+            except Exception as e:
+                logging.warning('Moving aside unreadable part file %s, its recordings are scored again: %s', part_path, e)
+                os.replace(part_path, os.path.join(self.path, f'.{name}.corrupt'))
+                continue
+            yield part_path, table
+
+    def __drop_superseded(self):
+        """Indexes the latest row of every file and removes the other rows, rewriting only the part files holding them."""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self._index.clear()
+        part_paths = []
+        for index, (part_path, table) in enumerate(self.__parts()):
+            part_paths.append(part_path)
+            failed = (bool(error) for error in table.column('error').to_pylist())
+            self._index.add(zip(table.column('file').to_pylist(), repeat(index), failed))
+        for index, part_path in enumerate(part_paths):
+            files = pq.read_table(part_path, columns=['file']).column('file').to_pylist()
+            keep = [self._index.latest(file, index) for file in files]
+            if all(keep):
+                continue
+            if not any(keep):
+                os.remove(part_path)
+                continue
+            full = pq.read_table(part_path).filter(pa.array(keep, type=pa.bool_()))
+            tmp_path = os.path.join(self.path, f'.{os.path.basename(part_path)}.tmp')
+            pq.write_table(full, tmp_path)
+            os.replace(tmp_path, part_path)
+
+def score_corpus(source, output, workers=1, max_in_flight=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Scores every recording of a directory or manifest, writing results incrementally.
+
+    Recordings already present in the output are skipped, so an interrupted run resumes where it
+    stopped. Recordings are scored in batches of batch_size, see score_files. Workers read the
+    audio themselves and at most max_in_flight recordings are queued at once, which keeps memory
+    bounded regardless of the corpus size.
+
+    Args:
+        source (str): directory of WAV files or CSV manifest, see iter_inputs
+        output (str): output path, a directory of Parquet files if it ends in .parquet, a CSV file otherwise
+        workers (int): number of worker processes, 1 scores in the calling process
+        max_in_flight (int): maximum number of recordings queued for the workers, 2 batches per worker by default
+        batch_size (int): number of recordings scored by one worker call
+
+    Returns:
+        (int): number of recordings scored
+    """
+    writer = ParquetOutput(output) if output.endswith('.parquet') else CsvOutput(output)
+    n_scored = 0
+    with writer:
+        n_completed = writer.n_completed()
+        if n_completed:
+            logging.info('Resuming, %d recordings already scored.', n_completed)
+        pending = ((path, clinical) for path, clinical in iter_inputs(source) if not writer.completed(path))
+        batches = iter(lambda: list(islice(pending, batch_size)), [])
+
+        if workers <= 1:
+            for batch in batches:
+                for row in score_files(batch):
+                    writer.write(row)
+                n_scored += len(batch)
+            return n_scored
+
+        # Load the models once before forking so the workers share them
+        ModelRegistry.preload()
+        max_batches = max(1, (max_in_flight or 2 * workers * batch_size) // batch_size)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(score_files, batch) for batch in islice(batches, max_batches)}
+            while futures:
+                done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    rows = future.result()
+                    for row in rows:
+                        writer.write(row)
+                    n_scored += len(rows)
+                futures |= {executor.submit(score_files, batch) for batch in islice(batches, len(done))}
+
+    return n_scored
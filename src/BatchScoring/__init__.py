@@ -0,0 +1,3 @@
+from .BatchScoring import score_corpus
+from .BatchScoring import score_file
+from .BatchScoring import score_files
\ No newline at end of file
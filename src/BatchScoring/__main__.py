@@ -0,0 +1,26 @@
+import logging
+import argparse
+
+from .BatchScoring import score_corpus, DEFAULT_BATCH_SIZE
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog='python -m src.BatchScoring',
+        description='Scores a directory or manifest of WAV recordings with the cough detector and the Covid-19 classifier.')
+    parser.add_argument('source', help='directory of WAV files or CSV manifest with a path column and optional '
+                                       'age, respiratory_condition and fever_muscle_pain columns')
+    parser.add_argument('output', help='output CSV file, or a directory of Parquet files if it ends in .parquet; '
+                                       'recordings already in the output are skipped')
+    parser.add_argument('--workers', type=int, default=1, help='number of worker processes (default: 1)')
+    parser.add_argument('--max-in-flight', type=int, default=None,
+                        help='maximum number of recordings queued for the workers (default: 2 batches per worker)')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f'recordings scored by one worker call (default: {DEFAULT_BATCH_SIZE})')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    n_scored = score_corpus(args.source, args.output, args.workers, args.max_in_flight, args.batch_size)
+    logging.info('Scored %d recordings.', n_scored)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+import os
+import json
+import time
+import logging
+import platform
+import statistics
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+import scipy
+import librosa
+
+from .signals import SAMPLE_RATES, synthetic_cough
+from ..CoughDetector import CoughDetector
+from ..CoughDetector.CoughDetector import FREQ_CUTS, FEATURES_FCT_LIST, _preprocess_cough
+from ..CoughDetector.feature_class import features
+from ..CoughDetector.spectral_context import SpectralContext
+from ..CovidClassifier import CovidClassifier
+from .. import Utils
+
+GOLDEN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'golden_outputs.json')
+RTOL = 1e-5
+ATOL = 1e-8
+CLINICAL_FEATURES = {'age': 35, 'respiratory_condition': 0, 'fever_muscle_pain': 1}
+
+BenchmarkInput = namedtuple('BenchmarkInput', ['x', 'fs', 'preprocessed', 'float_audio', 'normalized'])
+BenchmarkResult = namedtuple('BenchmarkResult', ['name', 'fs', 'first_seconds', 'best_seconds', 'median_seconds',
+                                                 'max_abs_error', 'status'])
+
+_feature_extractor = features(FREQ_CUTS)
+_cough_detector = CoughDetector()
+_covid_classifier = CovidClassifier()
+
+def _feature_benchmark(feature):
+    def run(inputs):
+        # A fresh context per call so every feature pays for the spectra it needs
+        return getattr(_feature_extractor, feature)(SpectralContext(*inputs.preprocessed))[0]
+    return run
+
+def _segment_cough(inputs):
+    segments, cough_mask = Utils.segment_cough(inputs.normalized, inputs.fs)
+    return [len(segments)] + [len(segment) for segment in segments] + [np.count_nonzero(cough_mask)]
+
+def _normalize_audio(inputs):
+    y = Utils.normalize_audio(inputs.float_audio, inputs.fs)
+    return _summary(y)
+
+def _resample(inputs):
+    return _summary(Utils.Resample.resample(inputs.float_audio, inputs.fs, 16000, quality='best'))
+
+def _covid_prepare(inputs):
+    # From the int16 samples like in the app; the VGGish column of the row stays NaN until the endpoint is called
+    window, row = _covid_classifier.prepare(inputs.x, inputs.fs, CLINICAL_FEATURES)
+    return np.concatenate((_summary(np.asarray(window)), row))
+
+def _summary(y):
+    return np.concatenate(([len(y), np.sum(y), np.sum(np.abs(y)), np.sum(np.square(y))], y[::1000]))
+
+BENCHMARKS = OrderedDict(
+    [(f'features.{feature}', _feature_benchmark(feature)) for feature in FEATURES_FCT_LIST] + [
+    ('CoughDetector.extract_features', lambda inputs: _cough_detector.extract_features(inputs.x, inputs.fs)),
+    ('CovidClassifier.__extract_audio_features',
+        lambda inputs: _covid_classifier._CovidClassifier__extract_audio_features(inputs.x, inputs.fs)),
+    ('Utils.segment_cough', _segment_cough),
+    ('Utils.normalize_audio', _normalize_audio),
+    ('Utils.Resample.resample', _resample),
+    ('CovidClassifier.prepare', _covid_prepare),
+])
+
+def library_versions():
+    """Gets the versions of Python and the numerical libraries the outputs depend on."""
+    return {'python': platform.python_version(), 'numpy': np.__version__, 'scipy': scipy.__version__,
+            'librosa': librosa.__version__}
+
+def benchmark_inputs(fs, seed=0):
+    """Builds the synthetic recording of a sample rate and the views of it each function receives in the app.
+
+    Args:
+        fs (int): sample rate
+        seed (int): seed of the synthetic recording
+
+    Returns:
+        (BenchmarkInput): int16 samples, sample rate, cough detector preprocessed (fs, x) pair, float
+            samples and the normalized float samples the segmentation view runs on
+    """
+    x = synthetic_cough(fs, seed=seed)
+    x_preprocessed, fs_preprocessed = _preprocess_cough(x, fs)
+    float_audio = x.astype(np.float32) / 32768
+    normalized = Utils.normalize_audio(float_audio, fs, shouldTrim=False)
+    return BenchmarkInput(x, fs, (fs_preprocessed, x_preprocessed), float_audio, normalized)
+
+def load_golden(path=GOLDEN_PATH):
+    """Loads the stored golden outputs, or None if there are none yet."""
+    if not os.path.isfile(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def run_benchmarks(rates=SAMPLE_RATES, names=None, repeat=5, golden=None, rtol=RTOL, atol=ATOL):
+    """Times every benchmarked function on the synthetic recordings and checks its outputs.
+
+    Example Usage:
+    >>> results, outputs = run_benchmarks(golden=load_golden())
+
+    Args:
+        rates (list): sample rates of the synthetic recordings
+        names (list): benchmarks to run, all of BENCHMARKS by default
+        repeat (int): number of timed calls after the first one
+        golden (dict): golden outputs as returned by load_golden, None skips the comparison
+        rtol (float): relative tolerance of the comparison
+        atol (float): absolute tolerance of the comparison
+
+    Returns:
+        (tuple): list of BenchmarkResult and dictionary of outputs keyed by name@fs
+    """
+    golden_outputs = golden['outputs'] if golden else {}
+    results = []
+    outputs = {}
+    for fs in rates:
+        inputs = benchmark_inputs(fs)
+        for name in names or BENCHMARKS:
+            run = BENCHMARKS[name]
+            start = time.perf_counter()
+            output = np.asarray(run(inputs), dtype=float).ravel()
+            first_seconds = time.perf_counter() - start
+
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                run(inputs)
+                timings.append(time.perf_counter() - start)
+
+            key = f'{name}@{fs}'
+            outputs[key] = output.tolist()
+            max_abs_error, status = _compare(output, golden_outputs.get(key), rtol, atol)
+            results.append(BenchmarkResult(name, fs, first_seconds, min(timings, default=first_seconds),
+                                           statistics.median(timings) if timings else first_seconds,
+                                           max_abs_error, status))
+    return results, outputs
+
+def write_golden(outputs, path=GOLDEN_PATH):
+    """Stores outputs of run_benchmarks as the new golden outputs.
+
+    Args:
+        outputs (dict): outputs keyed by name@fs
+        path (str): golden file
+    """
+    golden = load_golden(path) or {'outputs': {}}
+    golden['libraries'] = library_versions()
+    golden['outputs'].update(outputs)
+    golden['outputs'] = OrderedDict(sorted(golden['outputs'].items()))
+    with open(path, 'w') as f:
+        json.dump(golden, f, indent=1)
+        f.write('\n')
+
+def format_results(results):
+    """Formats benchmark results as a text table."""
+    lines = [f'{"benchmark":<44}{"fs":>7}{"first ms":>11}{"best ms":>10}{"median ms":>11}{"max err":>11}  status']
+    for r in results:
+        max_abs_error = '' if r.max_abs_error is None else f'{r.max_abs_error:.1e}'
+        lines.append(f'{r.name:<44}{r.fs:>7}{1000 * r.first_seconds:>11.2f}{1000 * r.best_seconds:>10.2f}'
+                     f'{1000 * r.median_seconds:>11.2f}{max_abs_error:>11}  {r.status}')
+    return '\n'.join(lines)
+
+def _compare(output, expected, rtol, atol):
+    if expected is None:
+        return None, 'no golden'
+    expected = np.asarray(expected, dtype=float)
+    if expected.shape != output.shape:
+        logging.error('Output shape %s differs from golden shape %s.', output.shape, expected.shape)
+        return None, 'FAIL'
+    max_abs_error = float(np.max(np.abs(output - expected), initial=0))
+    ok = np.allclose(output, expected, rtol=rtol, atol=atol, equal_nan=True)
+    return max_abs_error, 'ok' if ok else 'FAIL'
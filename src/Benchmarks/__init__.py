@@ -0,0 +1,5 @@
+from .Benchmarks import run_benchmarks
+from .Benchmarks import load_golden
+from .Benchmarks import write_golden
+from .Benchmarks import format_results
+from .signals import synthetic_cough
\ No newline at end of file
@@ -0,0 +1,38 @@
+import sys
+import logging
+import argparse
+
+from .Benchmarks import BENCHMARKS, GOLDEN_PATH, RTOL, ATOL, run_benchmarks, load_golden, write_golden, \
+    format_results, library_versions
+from .signals import SAMPLE_RATES
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog='python -m src.Benchmarks',
+        description='Times the feature extractors on synthetic cough recordings and compares their outputs to golden values.')
+    parser.add_argument('--rates', type=int, nargs='+', default=SAMPLE_RATES, help='sample rates to benchmark')
+    parser.add_argument('--only', nargs='+', default=None, choices=list(BENCHMARKS), metavar='NAME',
+                        help='benchmarks to run (default: all)')
+    parser.add_argument('--repeat', type=int, default=5, help='timed calls per benchmark after the first (default: 5)')
+    parser.add_argument('--rtol', type=float, default=RTOL, help=f'relative tolerance (default: {RTOL})')
+    parser.add_argument('--atol', type=float, default=ATOL, help=f'absolute tolerance (default: {ATOL})')
+    parser.add_argument('--golden', default=GOLDEN_PATH, help='golden outputs file')
+    parser.add_argument('--update-golden', action='store_true', help='store the outputs as the new golden values')
+    args = parser.parse_args()
+
+    golden = load_golden(args.golden)
+    if golden and golden.get('libraries') != library_versions():
+        logging.warning('Golden outputs were recorded with %s, running with %s; small differences are expected.',
+                        golden.get('libraries'), library_versions())
+
+    results, outputs = run_benchmarks(args.rates, args.only, args.repeat, golden, args.rtol, args.atol)
+    print(format_results(results))
+
+    if args.update_golden:
+        write_golden(outputs, args.golden)
+        print(f'Golden outputs written to {args.golden}.')
+    elif any(result.status == 'FAIL' for result in results):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
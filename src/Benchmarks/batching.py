@@ -0,0 +1,100 @@
+# Latency and throughput of the inference service's batch stages for several batch window settings
+#
+# Usage:
+#   python -m src.Benchmarks.batching --vggish-delay-ms 80 --concurrency 1 8 32
+
+import io
+import os
+import time
+import asyncio
+import argparse
+import threading
+import numpy as np
+from scipy.io import wavfile
+from concurrent.futures import ThreadPoolExecutor
+
+from .signals import synthetic_cough
+from ..CovidClassifier import vggish_stub, gcp_inference
+from ..CovidClassifier.embedding_cache import EmbeddingCache
+from ..InferenceService.batching import MicroBatcher
+from ..InferenceService import InferenceService
+
+SETTINGS = [('no batching', 0.0, 1), ('window 0 ms', 0.0, 32), ('window 2 ms', 0.002, 32),
+            ('window 5 ms', 0.005, 32), ('window 20 ms', 0.02, 32)]
+CLINICAL_FEATURES = {'age': 35, 'respiratory_condition': 0, 'fever_muscle_pain': 1}
+
+def prepared_request(fs=44100, seed=0):
+    """Runs the per-request stage once on a synthetic recording, as a worker of the service would."""
+    x = synthetic_cough(fs, seed=seed)
+    return InferenceService.prepare(_wav_bytes(x, fs), CLINICAL_FEATURES)
+
+def run_setting(prepared, window, max_batch_size, concurrency, n_requests):
+    """Sends n_requests prepared requests from `concurrency` closed-loop callers through the batch stages.
+
+    Every request gets a distinct VGGish window so that neither the embedding cache nor the
+    deduplication within a batch saves round trips.
+
+    Returns:
+        (dict): throughput in requests per second, latency percentiles in milliseconds and mean batch size
+    """
+    async def benchmark():
+        cough_batcher = MicroBatcher(InferenceService.classify_cough_batch, ThreadPoolExecutor(max_workers=1),
+                                     window, max_batch_size, name='cough')
+        covid_batcher = MicroBatcher(_counting(InferenceService.classify_covid_batch, batch_sizes),
+                                     ThreadPoolExecutor(max_workers=1), window, max_batch_size, name='covid')
+        base_window, row = prepared['covid']
+
+        async def caller(first):
+            for i in range(first, n_requests, concurrency):
+                covid_input = ([base_window[0] + 1e-6 * (i + 1)] + base_window[1:], row)
+                start = time.perf_counter()
+                await asyncio.gather(cough_batcher.submit(prepared['cough_features']),
+                                     covid_batcher.submit(covid_input))
+                latencies.append(time.perf_counter() - start)
+
+        await asyncio.gather(*(caller(first) for first in range(concurrency)))
+
+    latencies = []
+    batch_sizes = []
+    start = time.perf_counter()
+    asyncio.run(benchmark())
+    elapsed = time.perf_counter() - start
+
+    p50, p95 = 1000 * np.percentile(latencies, [50, 95])
+    return {'throughput': n_requests / elapsed, 'p50': p50, 'p95': p95, 'batch_size': np.mean(batch_sizes)}
+
+def _counting(process_batch, batch_sizes):
+    def run(items):
+        batch_sizes.append(len(items))
+        return process_batch(items)
+    return run
+
+def _wav_bytes(x, fs):
+    buffer = io.BytesIO()
+    wavfile.write(buffer, fs, x)
+    return buffer.getvalue()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Latency and throughput of the batch stages per batch window setting.')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--requests', type=int, default=128, help='requests per concurrency level')
+    parser.add_argument('--vggish-delay-ms', type=float, default=80,
+                        help='latency of the local VGGish stand-in, ignored if VGGISH_ENDPOINT is set')
+    args = parser.parse_args()
+
+    if not os.environ.get(gcp_inference.VGGISH_ENDPOINT_ENV):
+        server = vggish_stub.serve('127.0.0.1', 0, args.vggish_delay_ms / 1000)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        gcp_inference.set_transport(gcp_inference.HttpTransport(f'http://127.0.0.1:{server.server_port}'))
+        os.environ.setdefault('GCP_PROJECT', 'local')
+        os.environ.setdefault('GCP_MODEL', 'vggish')
+
+    prepared = prepared_request()
+    InferenceService._classifiers()[1].embedding_cache = EmbeddingCache(max_entries=0)
+
+    print(f'{"setting":<14}{"clients":>8}{"req/s":>9}{"p50 ms":>9}{"p95 ms":>9}{"batch":>7}')
+    for label, window, max_batch_size in SETTINGS:
+        for concurrency in args.concurrency:
+            result = run_setting(prepared, window, max_batch_size, concurrency, args.requests)
+            print(f'{label:<14}{concurrency:>8}{result["throughput"]:>9.1f}{result["p50"]:>9.1f}'
+                  f'{result["p95"]:>9.1f}{result["batch_size"]:>7.1f}')
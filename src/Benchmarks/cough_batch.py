@@ -0,0 +1,106 @@
+# Agreement and speed of CoughDetector's batch scoring against scoring the recordings one by one
+#
+# Usage:
+#   python -m src.Benchmarks.cough_batch --workers 1 4
+
+import sys
+import time
+import argparse
+import numpy as np
+
+from .signals import SAMPLE_RATES, synthetic_cough
+from ..CoughDetector import CoughDetector
+
+def check_recordings(fs):
+    """Gets the recordings the batch is checked on: synthetic coughs and the edge cases of a real backlog.
+
+    Silent and constant recordings give infinite features, which classify_cough rejects, and a
+    recording too short to preprocess fails to extract.
+
+    Returns:
+        (list): (name, int16 samples) per recording
+    """
+    return [('cough', synthetic_cough(fs)), ('cough seed 1', synthetic_cough(fs, seed=1)),
+            ('silent', np.zeros(3 * fs, dtype=np.int16)), ('constant', np.full(3 * fs, 1000, dtype=np.int16)),
+            ('too short', np.zeros(8, dtype=np.int16))]
+
+def single_scores(cough_detector, recordings, fs):
+    """Scores every recording like the app does, None where extract_features or classify_cough fails."""
+    scores = []
+    for _, x in recordings:
+        features = cough_detector.extract_features(x, fs)
+        try:
+            scores.append(float(cough_detector.classify_cough(features)[0]))
+        except ValueError:
+            scores.append(None)
+    return scores
+
+def check_batch(cough_detector, fs, n_jobs=1):
+    """Compares classify_batch to extract_features and classify_cough on check_recordings(fs).
+
+    A row with the NaN features of the silent recording and the finite ones of a cough, which
+    classify_cough scores, is also checked through classify_cough_batch.
+
+    Returns:
+        (list): (name, single score, batch score, batch error, ok) per recording
+    """
+    recordings = check_recordings(fs)
+    expected = single_scores(cough_detector, recordings, fs)
+    scores, errors = cough_detector.classify_batch([x for _, x in recordings], fs, n_jobs=n_jobs)
+    scores, errors = list(scores), list(errors)
+
+    features = cough_detector.extract_features(recordings[0][1], fs)
+    features[np.isnan(cough_detector.extract_features(recordings[2][1], fs))] = np.nan
+    recordings.append(('NaN features', None))
+    expected.append(float(cough_detector.classify_cough(features)[0]))
+    scores.append(cough_detector.classify_cough_batch(np.vstack([features, features]), [None, 'failed'])[0])
+    errors.append(None)
+
+    results = []
+    for (name, _), single, score, error in zip(recordings, expected, scores, errors):
+        if single is None:
+            ok = error is not None and np.isnan(score)
+        else:
+            ok = error is None and np.isclose(score, single, rtol=0, atol=1e-6)
+        results.append((name, single, float(score), error, bool(ok)))
+    return results
+
+def time_batch(cough_detector, fs, n_recordings=32, n_jobs=1):
+    """Times scoring n_recordings synthetic recordings one by one and as one batch.
+
+    Returns:
+        (tuple): seconds one by one, seconds as a batch
+    """
+    recordings = [('cough', synthetic_cough(fs, seed=seed)) for seed in range(n_recordings)]
+    start = time.perf_counter()
+    single_scores(cough_detector, recordings, fs)
+    single_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    cough_detector.classify_batch([x for _, x in recordings], fs, n_jobs=n_jobs)
+    return single_seconds, time.perf_counter() - start
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Checks the batch cough scoring against scoring one by one and times both.')
+    parser.add_argument('--rates', type=int, nargs='+', default=SAMPLE_RATES, help='sample rates to check')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1], help='feature extraction processes (default: 1)')
+    parser.add_argument('--recordings', type=int, default=32, help='recordings per timed batch (default: 32)')
+    args = parser.parse_args()
+
+    cough_detector = CoughDetector()
+    failed = False
+    print(f'{"recording":<12}{"fs":>7}{"workers":>9}{"single":>10}{"batch":>10}  status')
+    for fs in args.rates:
+        for n_jobs in args.workers:
+            for name, single, score, error, ok in check_batch(cough_detector, fs, n_jobs):
+                failed = failed or not ok
+                single = 'error' if single is None else f'{single:.6f}'
+                print(f'{name:<12}{fs:>7}{n_jobs:>9}{single:>10}{score:>10.6f}  {"ok" if ok else "FAIL"}')
+
+    print(f'{"fs":>7}{"workers":>9}{"single ms":>11}{"batch ms":>10}')
+    for fs in args.rates:
+        for n_jobs in args.workers:
+            single_seconds, batch_seconds = time_batch(cough_detector, fs, args.recordings, n_jobs)
+            print(f'{fs:>7}{n_jobs:>9}{1000 * single_seconds:>11.1f}{1000 * batch_seconds:>10.1f}')
+
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,88 @@
+# Accuracy of Utils.Resample against the resampy filters librosa used before, on the synthetic recordings
+#
+# Usage:
+#   python -m src.Benchmarks.resampling --rates 22050 44100 48000
+
+import sys
+import argparse
+import numpy as np
+from scipy import signal
+from scipy.signal import butter, filtfilt, sosfiltfilt
+
+from .signals import SAMPLE_RATES, synthetic_cough
+from ..CovidClassifier import CovidClassifier
+from ..Utils import Resample, to_float
+
+# resampy filter each quality tier follows
+REFERENCE_FILTERS = {'best': 'kaiser_best', 'fast': 'kaiser_fast'}
+# The filters' transition bands differ, so the error is measured below this share of the target
+# Nyquist frequency. Within it the error is flat, a gain difference of the filter designs: about
+# 2e-4 for 'best' and 3e-3 for 'fast' relative to the signal.
+PASSBAND = 0.75
+MAX_PASSBAND_ERROR = {'best': 5e-4, 'fast': 5e-3}
+VGGISH_RATE = 16000
+VGGISH_SAMPLES = int(4.2 * VGGISH_RATE)
+CLINICAL_FEATURES = {'age': 35, 'respiratory_condition': 0, 'fever_muscle_pain': 1}
+
+def passband_error(output, reference):
+    """Gets the RMS of the difference below PASSBAND of the Nyquist frequency, relative to the reference RMS."""
+    sos = butter(8, PASSBAND, output='sos')
+    difference = sosfiltfilt(sos, np.asarray(output, dtype=float) - reference)
+    return np.sqrt(np.mean(np.square(difference)) / np.mean(np.square(reference)))
+
+def check_resampling(rates=SAMPLE_RATES):
+    """Compares the resampling call sites to resampy on the synthetic recording of every sample rate.
+
+    Checks Resample.resample for every quality tier, the VGGish window of CovidClassifier.prepare
+    (computed from the int16 samples, as in the app) against librosa's former kaiser_best
+    resampling, and the legacy cough detector decimation against its original two filters.
+
+    Returns:
+        (list): (check, sample rate, passband error, full band error, ok) per check and sample rate
+    """
+    import resampy  # librosa's resampling backend before Resample, only needed here
+
+    covid_classifier = CovidClassifier()
+    results = []
+    for fs in rates:
+        x = synthetic_cough(fs)
+        float_audio = to_float(x).astype(np.float64)
+        for quality, reference_filter in REFERENCE_FILTERS.items():
+            reference = resampy.resample(float_audio, fs, VGGISH_RATE, filter=reference_filter)
+            output = Resample.resample(float_audio, fs, VGGISH_RATE, quality=quality)
+            max_error = MAX_PASSBAND_ERROR[quality]
+            results.append(_result(f'Resample.resample {quality}', fs, output, reference, max_error))
+
+        reference = resampy.resample(float_audio, fs, VGGISH_RATE, filter='kaiser_best')[-VGGISH_SAMPLES:]
+        window, _ = covid_classifier.prepare(x, fs, CLINICAL_FEATURES)
+        max_error = MAX_PASSBAND_ERROR['best']
+        results.append(_result('CovidClassifier.prepare window', fs, window, reference, max_error))
+
+        if fs >= 24000:
+            b, a = butter(4, 12000 / fs, btype='lowpass')
+            reference = signal.decimate(filtfilt(b, a, float_audio), int(fs / 12000))
+            output = Resample.decimate(float_audio, fs, 12000, quality='legacy')
+            error = float(np.max(np.abs(output - reference)))
+            results.append(('Resample.decimate legacy', fs, error, error, error == 0))
+    return results
+
+def _result(name, fs, output, reference, max_error):
+    output = np.asarray(output, dtype=float)
+    if output.shape != reference.shape:
+        return name, fs, np.inf, np.inf, False
+    error = passband_error(output, reference)
+    full_band_error = np.sqrt(np.mean(np.square(output - reference)) / np.mean(np.square(reference)))
+    return name, fs, error, full_band_error, error <= max_error
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compares Resample to the resampy filters librosa used before.')
+    parser.add_argument('--rates', type=int, nargs='+', default=SAMPLE_RATES, help='sample rates to check')
+    args = parser.parse_args()
+
+    results = check_resampling(args.rates)
+    print(f'{"check":<34}{"fs":>7}{"passband err":>14}{"full err":>11}  status')
+    for name, fs, error, full_band_error, ok in results:
+        print(f'{name:<34}{fs:>7}{error:>14.1e}{full_band_error:>11.1e}  {"ok" if ok else "FAIL"}')
+
+    if not all(ok for *_, ok in results):
+        sys.exit(1)
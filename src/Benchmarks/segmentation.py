@@ -0,0 +1,157 @@
+# Equivalence and speed of the vectorized cough segmentation against the original per-sample loop
+#
+# Usage:
+#   python -m src.Benchmarks.segmentation --cases 500 --repeat 5
+
+import sys
+import time
+import argparse
+import numpy as np
+
+from .signals import SAMPLE_RATES, synthetic_cough
+from .. import Utils
+
+def reference_segment_cough(x, fs, cough_padding=0.2, min_cough_len=0.1, th_l_multiplier=0.1, th_h_multiplier=0.5):
+    """The original per-sample implementation of Utils.segment_cough, kept as the reference it must match."""
+    cough_mask = np.array([False] * len(x))
+
+    # Define hysteresis thresholds
+    rms = np.sqrt(np.mean(np.square(x)))
+    seg_th_l = th_l_multiplier * rms
+    seg_th_h = th_h_multiplier * rms
+
+    # Segment coughs
+    coughSegments = []
+    padding = round(fs * cough_padding)
+    min_cough_samples = round(fs * min_cough_len)
+    cough_start = 0
+    cough_end = 0
+    cough_in_progress = False
+    tolerance = round(0.01 * fs)
+    below_th_counter = 0
+
+    for i, sample in enumerate(x ** 2):
+        if cough_in_progress:
+            if sample < seg_th_l:
+                below_th_counter += 1
+                if below_th_counter > tolerance:
+                    cough_end = i + padding if (i + padding < len(x)) else len(x) - 1
+                    cough_in_progress = False
+                    if (cough_end + 1 - cough_start - 2 * padding > min_cough_samples):
+                        coughSegments.append(x[cough_start:cough_end + 1])
+                        cough_mask[cough_start:cough_end + 1] = True
+            elif i == (len(x) - 1):
+                cough_end = i
+                cough_in_progress = False
+                if (cough_end + 1 - cough_start - 2 * padding > min_cough_samples):
+                    coughSegments.append(x[cough_start:cough_end + 1])
+            else:
+                below_th_counter = 0
+        else:
+            if sample > seg_th_h:
+                cough_start = i - padding if (i - padding >= 0) else 0
+                cough_in_progress = True
+
+    return coughSegments, cough_mask
+
+def random_case(rng):
+    """Draws a random bursty signal and segmentation parameters.
+
+    Low sample rates keep the reference loop fast while covering the same code paths; the cases
+    include empty bursts, bursts at both ends of the signal and degenerate parameters.
+
+    Returns:
+        (tuple): signal, sample rate and keyword arguments of segment_cough
+    """
+    fs = int(rng.choice([800, 1000, 2000, 8000]))
+    n = int(rng.integers(1, 3 * fs))
+    x = rng.standard_normal(n) * (rng.random(n) < rng.random()) * rng.choice([0.01, 1, 10])
+    envelope = np.zeros(n)
+    for _ in range(rng.integers(0, 6)):
+        start = rng.integers(0, n)
+        envelope[start:start + rng.integers(1, fs // 2 + 2)] = 5 * rng.random()
+    x = x + rng.standard_normal(n) * envelope
+    if rng.random() < 0.2:
+        x[-1] = 100.0
+    kwargs = {'cough_padding': float(rng.choice([0, 0.01, 0.2])), 'min_cough_len': float(rng.choice([0, 0.01, 0.1])),
+              'th_l_multiplier': float(rng.random()), 'th_h_multiplier': float(2 * rng.random())}
+    return x, fs, kwargs
+
+def check_equivalence(n_cases=500, seed=0):
+    """Compares segment_cough and CoughSegmenter (fed in random chunks) to the reference on random cases.
+
+    Args:
+        n_cases (int): number of random cases
+        seed (int): seed of the cases
+
+    Returns:
+        (list): (case, implementation, sample rate, length, parameters) of every mismatch
+    """
+    rng = np.random.default_rng(seed)
+    mismatches = []
+    for case in range(n_cases):
+        x, fs, kwargs = random_case(rng)
+        expected = reference_segment_cough(x, fs, **kwargs)
+
+        segmenter = Utils.CoughSegmenter(fs, np.sqrt(np.mean(np.square(x))), **kwargs)
+        position = 0
+        while position < len(x):
+            size = int(rng.integers(1, max(2, len(x) // 3)))
+            segmenter.push(x[position:position + size])
+            position += size
+        segmenter.finish()
+
+        implementations = [('segment_cough', Utils.segment_cough(x, fs, **kwargs)),
+                           ('CoughSegmenter', (segmenter.segments, segmenter.cough_mask()))]
+        for name, result in implementations:
+            if not _same_segmentation(expected, result):
+                mismatches.append((case, name, fs, len(x), kwargs))
+    return mismatches
+
+def time_segmentation(rates=SAMPLE_RATES, repeat=5):
+    """Times the reference loop and segment_cough on the normalized synthetic recording of every sample rate.
+
+    Returns:
+        (list): (sample rate, best reference seconds, best segment_cough seconds) per sample rate
+    """
+    timings = []
+    for fs in rates:
+        x = Utils.normalize_audio(synthetic_cough(fs).astype(np.float32) / 32768, fs, shouldTrim=False)
+        if not _same_segmentation(reference_segment_cough(x, fs), Utils.segment_cough(x, fs)):
+            raise AssertionError(f'segment_cough differs from the reference at {fs} Hz.')
+        timings.append((fs, _best_time(reference_segment_cough, x, fs, repeat),
+                        _best_time(Utils.segment_cough, x, fs, repeat)))
+    return timings
+
+def _same_segmentation(expected, result):
+    (expected_segments, expected_mask), (segments, mask) = expected, result
+    return len(expected_segments) == len(segments) and np.array_equal(expected_mask, mask) and \
+        all(np.array_equal(a, b) for a, b in zip(expected_segments, segments))
+
+def _best_time(function, x, fs, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(x, fs)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Checks the cough segmentation against the original loop and times both.')
+    parser.add_argument('--cases', type=int, default=500, help='random equivalence cases (default: 500)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random cases')
+    parser.add_argument('--rates', type=int, nargs='+', default=SAMPLE_RATES, help='sample rates to time')
+    parser.add_argument('--repeat', type=int, default=5, help='timed calls per implementation (default: 5)')
+    args = parser.parse_args()
+
+    mismatches = check_equivalence(args.cases, args.seed)
+    for case, name, fs, n, kwargs in mismatches:
+        print(f'MISMATCH case {case}: {name} at {fs} Hz, {n} samples, {kwargs}')
+    print(f'{args.cases - len({case for case, *_ in mismatches})}/{args.cases} random cases identical.')
+
+    print(f'{"rate":>7}{"loop ms":>10}{"vectorized ms":>15}{"speedup":>9}')
+    for fs, reference_seconds, seconds in time_segmentation(args.rates, args.repeat):
+        print(f'{fs:>7}{1000 * reference_seconds:>10.1f}{1000 * seconds:>15.2f}{reference_seconds / seconds:>8.0f}x')
+
+    if mismatches:
+        sys.exit(1)
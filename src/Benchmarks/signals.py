@@ -0,0 +1,47 @@
+import numpy as np
+
+SAMPLE_RATES = [16000, 22050, 44100, 48000]
+
+def synthetic_cough(fs, duration=3.0, n_coughs=3, seed=0):
+    """Generates a deterministic cough-like recording.
+
+    Each cough is an explosive burst of broadband noise with a fast attack and an exponential
+    decay, followed by a shorter voiced tail with a few harmonics, on top of low background
+    noise. The same seed gives the same recording on every machine.
+
+    Example Usage:
+    >>> x = synthetic_cough(44100)
+
+    Args:
+        fs (int): sample rate
+        duration (float): length of the recording in seconds
+        n_coughs (int): number of coughs, spread evenly over the recording
+        seed (int): seed of the random number generator
+
+    Returns:
+        (np.array): int16 samples, as decoded from the app's WAV recordings
+    """
+    rng = np.random.RandomState(seed)
+    n = int(duration * fs)
+    t = np.arange(n) / fs
+    x = 0.005 * rng.standard_normal(n)
+
+    for i in range(n_coughs):
+        onset = (i + 0.5) * duration / n_coughs - 0.15 + 0.05 * rng.uniform(-1, 1)
+        local = t - onset
+        active = (local >= 0) & (local < 0.4)
+        tau = 0.05 + 0.02 * rng.uniform()
+        envelope = (1 - np.exp(-local[active] / 0.004)) * np.exp(-local[active] / tau)
+
+        burst = rng.standard_normal(active.sum())
+        # First order smoothing colours the noise towards the low frequencies like a real cough
+        burst = np.convolve(burst, np.ones(4) / 4, mode='same')
+        f0 = 180 + 60 * rng.uniform()
+        voiced = sum(np.sin(2 * np.pi * k * f0 * local[active]) / k for k in range(1, 5))
+        voiced_envelope = np.exp(-np.square(local[active] - 0.12) / 0.003)
+
+        amplitude = 0.6 + 0.3 * rng.uniform()
+        x[active] += amplitude * (envelope * burst + 0.3 * voiced_envelope * voiced)
+
+    x = x / np.max(np.abs(x)) * 0.9
+    return np.round(x * 32767).astype(np.int16)
@@ -0,0 +1,72 @@
+# Time from the end of a streamed recording to its cough detection features, with and without CoughStream
+#
+# Usage:
+#   python -m src.Benchmarks.streaming --chunk-ms 1000 --delay-ms 200
+
+import sys
+import time
+import argparse
+import numpy as np
+
+from .signals import SAMPLE_RATES, synthetic_cough
+from ..CoughDetector import CoughDetector, CoughStream
+from ..Metrics import enable, collect
+
+def stream_recording(x, fs, chunk_ms=1000, chunk_interval=0.1, delay=0.2, cough_detector=None):
+    """Pushes a recording to a CoughStream chunk by chunk, like the record button, and finishes it.
+
+    Args:
+        x (np.array): int16 samples of the recording
+        fs (int): sample rate
+        chunk_ms (int): milliseconds of audio per chunk
+        chunk_interval (float): seconds between two chunks
+        delay (float): seconds between the last chunk and the final recording
+        cough_detector (CoughDetector): detector, a new one by default
+
+    Returns:
+        (tuple): features returned by finish(), whether they were reused from the background
+            scoring, and the seconds finish() took
+    """
+    cough_detector = cough_detector or CoughDetector()
+    stream = CoughStream(cough_detector, fs)
+    step = int(fs * chunk_ms / 1000)
+    starts = range(0, len(x), step)
+    for seq, start in enumerate(starts):
+        time.sleep(chunk_interval)
+        stream.push(seq, x[start:start + step], last=seq == len(starts) - 1)
+    time.sleep(delay)
+
+    enable()
+    collect()
+    start = time.perf_counter()
+    features = stream.finish(x)
+    seconds = time.perf_counter() - start
+    reused = collect()[1].get('cough_stream_features_reused', 0) > 0
+    return features, reused, seconds
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Checks that streamed recordings reuse their background features.')
+    parser.add_argument('--rates', type=int, nargs='+', default=SAMPLE_RATES, help='sample rates to check')
+    parser.add_argument('--chunk-ms', type=int, default=1000, help='milliseconds of audio per chunk (default: 1000)')
+    parser.add_argument('--interval-ms', type=float, default=100, help='milliseconds between chunks (default: 100)')
+    parser.add_argument('--delay-ms', type=float, default=200,
+                        help='milliseconds between the last chunk and the final recording (default: 200)')
+    args = parser.parse_args()
+
+    cough_detector = CoughDetector()
+    failed = False
+    print(f'{"rate":>7}{"reused":>8}{"identical":>11}{"stop ms":>9}{"direct ms":>11}')
+    for fs in args.rates:
+        x = synthetic_cough(fs)
+        cough_detector.extract_features(x, fs)  # Warm up, so that neither path pays for the first call
+        start = time.perf_counter()
+        expected = cough_detector.extract_features(x, fs)
+        direct_seconds = time.perf_counter() - start
+        features, reused, seconds = stream_recording(x, fs, args.chunk_ms, args.interval_ms / 1000,
+                                                     args.delay_ms / 1000, cough_detector)
+        identical = np.array_equal(features, expected)
+        failed = failed or not (reused and identical)
+        print(f'{fs:>7}{str(reused):>8}{str(identical):>11}{1000 * seconds:>9.1f}{1000 * direct_seconds:>11.1f}')
+
+    if failed:
+        sys.exit(1)
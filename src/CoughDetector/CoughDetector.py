@@ -15,13 +15,28 @@ from scipy.signal import spectrogram
 from scipy.signal.windows import get_window
 
 import os
-import pickle
+from concurrent.futures import ProcessPoolExecutor
 from .feature_class import features 
+from .spectral_context import SpectralContext
+from ..Utils import Resample
+from ..ModelRegistry import get_model
+from ..Metrics import timer, count, enable, enabled, reset, collect, merge
+
+FREQ_CUTS = [(0,200),(300,425),(500,650),(950,1150),(1400,1800),(2300,2400),(2850,2950),(3800,3900)]
+FEATURES_FCT_LIST = ['EEPD','ZCR','RMSP','DF','spectral_features','SF_SSTD','SSL_SD','MFCC','CF','LGTH','PSD']
+# The cough classifier was trained on the legacy two-filter preprocessing, see Resample.decimate
+RESAMPLE_QUALITY = 'legacy'
+N_FEATURES = sum(getattr(features, f'n_{feature}') for feature in FEATURES_FCT_LIST if feature != 'PSD') + len(FREQ_CUTS)
+FEATURE_STAGES = {feature: f'features.{feature}' for feature in FEATURES_FCT_LIST}
 
 class CoughDetector:
-    def __init__(self):
-        self.model = pickle.load(open(os.path.join('models', 'cough_classifier'), 'rb'))
-        self.scaler = pickle.load(open(os.path.join('models','cough_classification_scaler'), 'rb'))
+    @property
+    def model(self):
+        return get_model('cough_classifier')
+
+    @property
+    def scaler(self):
+        return get_model('cough_classification_scaler')
 
     def classify_cough(self, features):
         """Classify whether an inputted signal is a cough or not using filtering, feature extraction, and ML classification
@@ -30,8 +45,10 @@ class CoughDetector:
         Outputs:
             result: (float) probability that a given file is a cough 
         """
-        feature_values_scaled = self.scaler.transform(features)
-        result = self.model.predict_proba(feature_values_scaled)[:,1]
+        with timer('cough_predict_proba'):
+            feature_values_scaled = self.scaler.transform(features)
+            result = self.model.predict_proba(feature_values_scaled)[:,1]
+        count('cough_detections')
         return result
 
     def extract_features(self, x, fs):
@@ -43,53 +60,160 @@ class CoughDetector:
             result: (np.array) extracted features
         """
         try: 
-            x,fs = self.__preprocess_cough(x,fs)
-            data = (fs,x)
-            FREQ_CUTS = [(0,200),(300,425),(500,650),(950,1150),(1400,1800),(2300,2400),(2850,2950),(3800,3900)]
-            features_fct_list = ['EEPD','ZCR','RMSP','DF','spectral_features','SF_SSTD','SSL_SD','MFCC','CF','LGTH','PSD']
-            feature_values_vec = []
-            obj = features(FREQ_CUTS)
-            for feature in features_fct_list:
-                feature_values, feature_names = getattr(obj,feature)(data)
-                for value  in feature_values:
-                    if isinstance(value,np.ndarray):
-                        feature_values_vec.append(value[0])
-                    else:
-                        feature_values_vec.append(value)
-            return np.array(feature_values_vec).reshape(1,-1)
-
-        except:
-            logging.error('Error extracting cough detection audio features.')
+            return _compute_features(x, fs).reshape(1,-1)
+
+        except Exception:
+            logging.exception('Error extracting cough detection audio features.')
             return 0
 
-    def __preprocess_cough(self, x, fs, cutoff = 6000, normalize = True, filter_ = True, downsample = True):
+    def extract_features_batch(self, signals, fs, n_jobs=1):
+        """Feature extraction for many recordings at once
+        Inputs: 
+            signals: (list of float arrays) raw cough signals
+            fs: (int or list of ints) sampling rate of all signals, or one per signal
+            n_jobs: (int) number of worker processes, 1 extracts in the calling process
+        Outputs:
+            features: (np.array) (N, N_FEATURES) matrix of extracted features, rows that failed are NaN; rows that
+                succeeded may contain NaN features too, so failures are only told apart by errors
+            errors: (list) None for every successful row, otherwise the error message of the row
         """
-        Normalize, lowpass filter, and downsample cough samples in a given data folder 
-        
-        Inputs: x*: (float array) time series cough signal
-        fs*: (int) sampling frequency of the cough signal in Hz
-        cutoff: (int) cutoff frequency of lowpass filter
-        normalize: (bool) normailzation on or off
-        filter: (bool) filtering on or off
-        downsample: (bool) downsampling on or off
-        *: mandatory input
-        
-        Outputs: x: (float32 array) new preprocessed cough signal
-        fs: (int) new sampling frequency
+        n_signals = len(signals)
+        rates = list(fs) if np.ndim(fs) > 0 else [fs] * n_signals
+        feature_matrix = np.full((n_signals, N_FEATURES), np.nan)
+        errors = [None] * n_signals
+
+        if n_jobs > 1 and n_signals > 1:
+            # Workers hand their stage timings back with every row, see Metrics.collect
+            with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=(enabled(),)) as executor:
+                chunksize = max(1, n_signals // (4 * n_jobs))
+                rows = executor.map(_compute_features_worker_row, signals, rates, chunksize=chunksize)
+                for i, (feature_values, error, metrics) in enumerate(rows):
+                    merge(metrics)
+                    self.__store_row(feature_matrix, errors, i, feature_values, error)
+        else:
+            for i, (x, rate) in enumerate(zip(signals, rates)):
+                feature_values, error = _compute_features_row(x, rate)
+                self.__store_row(feature_matrix, errors, i, feature_values, error)
+
+        return feature_matrix, errors
+
+    def classify_cough_batch(self, features, errors=None):
+        """Classify many recordings with a single scaler and model call
+        Inputs: 
+            features: (np.array) (N, N_FEATURES) matrix as returned by extract_features_batch
+            errors: (list) per-row errors as returned by extract_features_batch, None if every row was extracted
+        Outputs:
+            result: (np.array) probability that each recording is a cough, NaN for failed rows and infinite features
         """
-        
-        fs_downsample = cutoff*2
-        
-        #Preprocess Data
-        if len(x.shape)>1:
-            x = np.mean(x,axis=1)                          # Convert to mono
-        if normalize:
-            x = x/(np.max(np.abs(x))+1e-17)                # Norm to range between -1 to 1
-        if filter_:
-            b, a = butter(4, fs_downsample/fs, btype='lowpass') # 4th order butter lowpass filter
-            x = filtfilt(b, a, x)
-        if downsample:
-            x = signal.decimate(x, int(fs/fs_downsample)) # Downsample for anti-aliasing
-        
-        fs_new = fs_downsample
-        return np.float32(x), fs_new
\ No newline at end of file
+        result = np.full(features.shape[0], np.nan)
+        # NaN features of successful rows are scored like in classify_cough, infinite ones would fail the whole batch
+        valid = np.array([error is None for error in errors], dtype=bool) if errors is not None \
+            else np.ones(features.shape[0], dtype=bool)
+        valid &= ~np.isinf(features).any(axis=1)
+        if valid.any():
+            with timer('cough_predict_proba'):
+                feature_values_scaled = self.scaler.transform(features[valid])
+                result[valid] = self.model.predict_proba(feature_values_scaled)[:,1]
+        count('cough_detections', features.shape[0])
+        return result
+
+    def classify_batch(self, signals, fs, n_jobs=1):
+        """Extract features of many recordings and classify them
+        Inputs: 
+            signals: (list of float arrays) raw cough signals
+            fs: (int or list of ints) sampling rate of all signals, or one per signal
+            n_jobs: (int) number of worker processes used for feature extraction
+        Outputs:
+            result: (np.array) probability that each recording is a cough, NaN for failed rows
+            errors: (list) None for every successful row, otherwise the error message of the row
+        """
+        feature_matrix, errors = self.extract_features_batch(signals, fs, n_jobs=n_jobs)
+        return self.classify_cough_batch(feature_matrix, errors), errors
+
+    def __store_row(self, feature_matrix, errors, i, feature_values, error):
+        if error is not None:
+            logging.error('Error extracting cough detection audio features of recording %d: %s', i, error)
+            errors[i] = error
+        else:
+            feature_matrix[i] = feature_values
+
+def _compute_features(x, fs):
+    """Preprocesses a raw cough signal and computes its cough detection features
+    Inputs: 
+        x: (float array) raw cough signal
+        fs: (int) sampling rate of raw signal
+    Outputs:
+        result: (np.array) 1-D array of N_FEATURES extracted features
+    """
+    with timer('cough_preprocess'):
+        x,fs = _preprocess_cough(x,fs)
+    data = SpectralContext(fs,x)
+    feature_values_vec = []
+    obj = features(FREQ_CUTS)
+    for feature in FEATURES_FCT_LIST:
+        with timer(FEATURE_STAGES[feature]):
+            feature_values, feature_names = getattr(obj,feature)(data)
+        for value  in feature_values:
+            if isinstance(value,np.ndarray):
+                feature_values_vec.append(value[0])
+            else:
+                feature_values_vec.append(value)
+    return np.array(feature_values_vec)
+
+def _compute_features_row(x, fs):
+    """Computes the features of one recording of a batch, returning the error message instead of raising"""
+    try:
+        feature_values = _compute_features(x, fs)
+        if len(feature_values) != N_FEATURES:
+            raise ValueError(f'Expected {N_FEATURES} features, got {len(feature_values)}.')
+        if np.isinf(feature_values).any():
+            # classify_cough raises for these
+            raise ValueError('Infinite cough detection features, e.g. of a silent or constant recording.')
+        return feature_values, None
+    except Exception as e:
+        return None, f'{type(e).__name__}: {e}'
+
+def _init_worker(metrics_enabled):
+    """Starts a feature extraction worker with the parent's metrics setting and none of its data"""
+    enable(metrics_enabled)
+    reset()
+
+def _compute_features_worker_row(x, fs):
+    """Computes one row in a worker process, together with the metrics recorded for it"""
+    feature_values, error = _compute_features_row(x, fs)
+    return feature_values, error, collect()
+
+def _preprocess_cough(x, fs, cutoff = 6000, normalize = True, filter_ = True, downsample = True, quality = RESAMPLE_QUALITY):
+    """
+    Normalize, lowpass filter, and downsample cough samples in a given data folder 
+    
+    Inputs: x*: (float array) time series cough signal
+    fs*: (int) sampling frequency of the cough signal in Hz
+    cutoff: (int) cutoff frequency of lowpass filter
+    normalize: (bool) normailzation on or off
+    filter: (bool) filtering on or off
+    downsample: (bool) downsampling on or off
+    quality: (str) resampling quality tier used when filtering and downsampling, see Resample.decimate
+    *: mandatory input
+    
+    Outputs: x: (float32 array) new preprocessed cough signal
+    fs: (int) new sampling frequency
+    """
+    
+    fs_downsample = cutoff*2
+    
+    #Preprocess Data
+    if len(x.shape)>1:
+        x = np.mean(x,axis=1)                          # Convert to mono
+    if normalize:
+        x = x/(np.max(np.abs(x))+1e-17)                # Norm to range between -1 to 1
+    if filter_ and downsample:
+        x = Resample.decimate(x, fs, fs_downsample, quality=quality) # Lowpass and downsample for anti-aliasing
+    elif filter_:
+        b, a = butter(4, fs_downsample/fs, btype='lowpass') # 4th order butter lowpass filter
+        x = filtfilt(b, a, x)
+    elif downsample:
+        x = signal.decimate(x, int(fs/fs_downsample)) # Downsample for anti-aliasing
+    
+    fs_new = fs_downsample
+    return np.float32(x), fs_new
\ No newline at end of file
@@ -1 +1,2 @@
-from .CoughDetector import CoughDetector
\ No newline at end of file
+from .CoughDetector import CoughDetector
+from .streaming import CoughStream
\ No newline at end of file
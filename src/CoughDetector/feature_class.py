@@ -8,6 +8,8 @@ from scipy.signal import butter,filtfilt
 from scipy.stats import kurtosis
 import scipy.signal as signal
 from scipy.integrate import simps
+from .filterbank import get_filterbank
+from .spectral_context import spectral_context
 
 # Class that contains the feature computation functions 
 
@@ -50,30 +52,17 @@ class features:
         """
         Compute the spectrum using FFT
         """
-        fs, cough = data
-        fftdata = np.fft.rfft(cough)
-        return fftdata
+        return spectral_context(data).rfft
     
     # Envelope Energy Peak Detection
     def EEPD(self, data):
         # data: wav file of segment; fs, signal = wavfile.read(file)
         # output: value of the feature
-        names = []
         fs,cough = data
-        fNyq = fs/2
-        nPeaks = []
-        freq_step = 50
-        for fcl in range(50,1000,freq_step):
-            names = names + ['EEPD'+str(fcl)+'_'+str(fcl+freq_step)]
-            fc = [fcl/fNyq, (fcl+50)/fNyq]
-            b, a = butter(1, fc, btype='bandpass')
-            bpFilt = filtfilt(b, a, cough)
-            b,a = butter(2, 10/fNyq, btype='lowpass')
-            eed = filtfilt(b, a, bpFilt**2)
-            eed = eed/np.max(eed+1e-17)
-            peaks,_ = signal.find_peaks(eed)
-            nPeaks.append(peaks.shape[0])
-        return np.array(nPeaks), names
+        filterbank = get_filterbank(fs)
+        names = ['EEPD'+str(fcl)+'_'+str(fch) for fcl, fch in filterbank.bands]
+        nPeaks = filterbank.count_peaks(cough)
+        return nPeaks, names
 
     # Phase Power Ratio Estimation
     def PRE(self, data):
@@ -118,18 +107,15 @@ class features:
         # data: wav file of segment; fs, signal = wavfile.read(file)
         # output: value of the feature
         names = ['Dominant_Freq']
-        fs,cough = data
-        cough_fortan = np.asfortranarray(cough)
-        freqs, psd = signal.welch(cough_fortan)
+        freqs, psd = spectral_context(data).welch
         DF = freqs[np.argmax(psd)]
         return  np.ones((1,1))*DF, names
     
     def spectral_features(self, data):
         names = ["Spectral_Centroid","Spectral_Rolloff","Spectral_Spread","Spectral_Skewness","Spectral_Kurtosis","Spectral_Bandwidth"]
-        fs, x = data
-        magnitudes = np.abs(np.fft.rfft(x)) # magnitudes of positive frequencies
-        length = len(x)
-        freqs = np.abs(np.fft.fftfreq(length, 1.0/fs)[:length//2+1]) # positive frequencies
+        context = spectral_context(data)
+        magnitudes = context.rfft_magnitude # magnitudes of positive frequencies
+        freqs = context.rfft_freqs # positive frequencies
         sum_mag = np.sum(magnitudes)
         
         # spectral centroid = weighted mean of frequencies wrt FFT value at each frequency
@@ -159,10 +145,7 @@ class features:
         # data: wav file of segment; fs, signal = wavfile.read(file)
         # output: value of the feature
         names = ['Spectral_Flatness', 'Spectral_StDev']
-        fs,sig = data
-        nperseg = min(900,len(sig))
-        noverlap = min(600,int(nperseg/2))
-        freqs, psd = signal.welch(sig, fs, nperseg=nperseg, noverlap=noverlap)
+        freqs, psd = spectral_context(data).welch_bands
         psd_len = len(psd)
         gmean = np.exp((1/psd_len)*np.sum(np.log(psd + 1e-17)))
         amean = (1/psd_len)*np.sum(psd)
@@ -176,9 +159,9 @@ class features:
         b1=0
         b2=8000
         
-        Fs, x = data
-        s = np.absolute(np.fft.fft(x))
-        s = s[:s.shape[0]//2]
+        context = spectral_context(data)
+        Fs, x = context
+        s = context.rfft_magnitude[:len(x)//2]
         muS = np.mean(s)
         f = np.linspace(0,Fs/2,s.shape[0])
         muF = np.mean(f)
@@ -227,10 +210,7 @@ class features:
     # Power spectral Density 
     def PSD(self,data):
         feat = []
-        fs,sig = data
-        nperseg = min(900,len(sig))
-        noverlap=min(600,int(nperseg/2))
-        freqs, psd = signal.welch(sig, fs, nperseg=nperseg, noverlap=noverlap)
+        freqs, psd = spectral_context(data).welch_bands
         dx_freq = freqs[1]-freqs[0]
         total_power = simps(psd, dx=dx_freq)
         for lf, hf in self.FREQ_CUTS:
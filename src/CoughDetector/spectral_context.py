@@ -0,0 +1,85 @@
+# Spectral representations shared between the feature computation functions
+
+import numpy as np
+import scipy.signal as signal
+
+class SpectralContext:
+    """Signal with lazily computed, memoized spectral representations.
+
+    Unpacks like the (fs, signal) tuple the feature functions take, so it can be passed
+    wherever data is expected. Each spectrum is computed at most once per signal.
+
+    Example Usage:
+    >>> data = SpectralContext(fs, x)
+    >>> fs, x = data
+    >>> freqs, psd = data.welch_bands
+    """
+    def __init__(self, fs, x):
+        self.fs = fs
+        self.x = x
+        self._rfft = None
+        self._rfft_magnitude = None
+        self._rfft_freqs = None
+        self._welch = None
+        self._welch_bands = None
+
+    def __iter__(self):
+        return iter((self.fs, self.x))
+
+    def __len__(self):
+        return 2
+
+    def __getitem__(self, index):
+        return (self.fs, self.x)[index]
+
+    @property
+    def rfft(self):
+        """(np.array) spectrum of the positive frequencies"""
+        if self._rfft is None:
+            self._rfft = np.fft.rfft(self.x)
+        return self._rfft
+
+    @property
+    def rfft_magnitude(self):
+        """(np.array) magnitudes of the positive frequencies"""
+        if self._rfft_magnitude is None:
+            self._rfft_magnitude = np.abs(self.rfft)
+        return self._rfft_magnitude
+
+    @property
+    def rfft_freqs(self):
+        """(np.array) positive frequencies in Hz"""
+        if self._rfft_freqs is None:
+            length = len(self.x)
+            self._rfft_freqs = np.abs(np.fft.fftfreq(length, 1.0/self.fs)[:length//2+1])
+        return self._rfft_freqs
+
+    @property
+    def welch(self):
+        """(tuple) frequencies in cycles per sample and Welch PSD with scipy's default segments"""
+        if self._welch is None:
+            self._welch = signal.welch(np.asfortranarray(self.x))
+        return self._welch
+
+    @property
+    def welch_bands(self):
+        """(tuple) frequencies in Hz and Welch PSD with the segments used for the band features"""
+        if self._welch_bands is None:
+            nperseg = min(900,len(self.x))
+            noverlap = min(600,int(nperseg/2))
+            self._welch_bands = signal.welch(self.x, self.fs, nperseg=nperseg, noverlap=noverlap)
+        return self._welch_bands
+
+def spectral_context(data):
+    """Gets the SpectralContext of data, creating one if a plain (fs, signal) tuple is given.
+
+    Args:
+        data (tuple or SpectralContext): (fs, signal)
+
+    Returns:
+        (SpectralContext): spectral context of the signal
+    """
+    if isinstance(data, SpectralContext):
+        return data
+    fs, x = data
+    return SpectralContext(fs, x)
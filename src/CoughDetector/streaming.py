@@ -0,0 +1,212 @@
+# Cough detection on a recording that arrives in chunks while it is being made
+
+import time
+import logging
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+from ..Utils import CoughSegmenter
+from ..Metrics import count
+
+DEFAULT_CALIBRATION = 0.5
+DEFAULT_MIN_INTERVAL = 0.5
+# Streams whose scoring may wait for the worker at once, further scorings are dropped until it catches up
+MAX_PENDING_SCORINGS = 4
+
+# One worker for all streams of the process, so provisional scoring never competes with itself
+_executor = ThreadPoolExecutor(max_workers=1)
+_pending_scorings = threading.BoundedSemaphore(MAX_PENDING_SCORINGS)
+
+class CoughStream:
+    """Incremental cough detection state of a recording in progress.
+
+    Every pushed chunk updates running accumulators (samples, peak, energy) and a CoughSegmenter
+    whose thresholds are calibrated on the first `calibration` seconds. From then on, the audio
+    received so far is re-scored on a background thread at most every `min_interval` seconds, so a
+    provisional cough confidence and the coughs segmented so far are available while the user is
+    still recording, and the latest ones the moment recording stops.
+
+    Every stream has at most one scoring waiting or running. A waiting scoring takes the audio
+    received by the time it starts, so it never scores stale audio, and once MAX_PENDING_SCORINGS
+    streams wait for the shared worker, further scorings are dropped instead of queued.
+
+    Only the accumulators and the segmentation are incremental. Every scoring extracts the features
+    of all audio received so far again, since each of them depends on the end of the recording:
+    preprocessing normalizes it by its peak and low-pass filters it forwards and backwards, so every
+    preprocessed sample changes with each chunk. The same holds for the Covid features (trimming
+    relative to the loudest frame, onsets normalized by the strongest one, RMS medians and
+    percentiles), which are therefore only computed from the final recording. min_interval and the
+    single worker bound the cost of the repeated extraction. finish() reuses the features of the
+    last scoring if it covered the complete recording, and otherwise computes them like
+    CoughDetector.extract_features.
+
+    Example Usage:
+    >>> stream = CoughStream(cough_detector, fs)
+    >>> stream.push(seq, chunk)
+    >>> n_samples, cough_conf = stream.provisional
+    >>> features = stream.finish(rec.audio)
+
+    Args:
+        cough_detector (CoughDetector): detector scoring the audio
+        fs (int): sample rate of the chunks
+        calibration (float): seconds of audio the segmenter's thresholds are derived from
+        min_interval (float): minimum seconds between two provisional scorings
+    """
+    def __init__(self, cough_detector, fs, calibration=DEFAULT_CALIBRATION, min_interval=DEFAULT_MIN_INTERVAL):
+        self.cough_detector = cough_detector
+        self.fs = fs
+        self.calibration = calibration
+        self.min_interval = min_interval
+
+        self.n_samples = 0
+        self.peak = 0.0
+        self.energy = 0.0
+        self.last_seq = -1
+        self.complete = True  # False once a chunk was missed
+
+        self._chunks = []
+        self._segmenter = None
+        self._provisional = None
+        self._scoring = None
+        self._scoring_samples = 0
+        self._scored = None
+        self._rescore = False
+        self._last_scored = 0.0
+        self._finished = False
+        self._lock = threading.Lock()
+
+    @property
+    def rms(self):
+        """(float) RMS of the samples received so far"""
+        return np.sqrt(self.energy / self.n_samples) if self.n_samples else 0.0
+
+    @property
+    def provisional(self):
+        """(tuple) number of samples scored and the cough confidence of those samples, None before the first scoring"""
+        return self._provisional
+
+    @property
+    def segments(self):
+        """(list) cough signal arrays completed so far, with thresholds from the calibration audio"""
+        return self._segmenter.segments if self._segmenter is not None else []
+
+    def audio(self):
+        """Gets the samples received so far."""
+        return np.concatenate(self._chunks) if self._chunks else np.empty(0)
+
+    def push(self, seq, chunk, last=False):
+        """Adds the next chunk of the recording.
+
+        Chunks are numbered from 0. Repeated chunks and chunks arriving after finish() are ignored;
+        after a missed chunk the stream stops updating, since the audio would no longer line up.
+        The last chunk is scored right away, so finish() finds the features of the complete recording.
+
+        Args:
+            seq (int): sequence number of the chunk
+            chunk (np.array): 1-D samples of the chunk
+            last (bool): True for the final chunk of the recording
+
+        Returns:
+            (bool): True if the chunk was added
+        """
+        if seq <= self.last_seq or not self.complete or self._finished:
+            return False
+        if seq != self.last_seq + 1:
+            logging.warning('Missed audio chunks %d to %d, stopping incremental cough detection.',
+                            self.last_seq + 1, seq - 1)
+            self.complete = False
+            return False
+        self.last_seq = seq
+
+        chunk = np.asarray(chunk)
+        if len(chunk) == 0:
+            if last and self._segmenter is not None:
+                self._schedule(force=True)
+            return True
+        # Scored in the sample type of the recording, so the features match those of the final WAV
+        self._chunks.append(chunk)
+        samples = chunk.astype(np.float64)
+        self.n_samples += len(samples)
+        self.peak = max(self.peak, np.max(np.abs(samples)))
+        self.energy += np.dot(samples, samples)
+        count('cough_stream_chunks')
+
+        if self._segmenter is not None:
+            self._segmenter.push(samples)
+        elif self.n_samples >= self.calibration * self.fs and self.energy > 0:
+            self._segmenter = CoughSegmenter(self.fs, self.rms)
+            self._segmenter.push(self.audio().astype(np.float64))
+
+        if self._segmenter is not None:
+            self._schedule(force=last)
+        return True
+
+    def finish(self, audio):
+        """Computes the exact cough detection features of the complete recording.
+
+        Args:
+            audio (np.array): the complete recording, as decoded from the final WAV
+
+        Returns:
+            (np.array): (1, N_FEATURES) features as returned by CoughDetector.extract_features
+        """
+        with self._lock:
+            running = None
+            self._rescore = False
+            if self._scoring is not None and not self._scoring.cancel() and not self._scoring.done():
+                running = self._scoring
+            if not self._finished and self._segmenter is not None:
+                self._segmenter.finish()
+            self._finished = True
+
+        # A scoring of the complete recording is as far along as a new extraction would be
+        if running is not None and self._scoring_samples == len(audio):
+            running.result()
+        scored = self._scored
+        received = self.audio()
+        same_audio = audio.dtype == received.dtype and np.array_equal(audio, received)
+        if scored is not None and scored[0] == len(audio) and same_audio:
+            count('cough_stream_features_reused')
+            return scored[1]
+        return self.cough_detector.extract_features(audio, self.fs)
+
+    def _schedule(self, force=False):
+        """Submits a scoring of the audio received so far; force skips min_interval, e.g. for the last chunk."""
+        with self._lock:
+            if self._finished:
+                return
+            if self._scoring is not None and not self._scoring.done():
+                # A waiting scoring picks up the audio pushed since, a running one is followed by another
+                if self._scoring.running():
+                    self._rescore = self._rescore or force
+                return
+            if not force and time.monotonic() - self._last_scored < self.min_interval:
+                return
+            if not _pending_scorings.acquire(blocking=False):
+                count('cough_stream_scorings_dropped')
+                return
+            self._last_scored = time.monotonic()
+            self._scoring = _executor.submit(self._score)
+            self._scoring.add_done_callback(self._scored_callback)
+
+    def _scored_callback(self, _):
+        # Also called for scorings cancelled by finish(), which holds the lock and clears _rescore first
+        _pending_scorings.release()
+        if self._rescore:
+            self._rescore = False
+            self._schedule(force=True)
+
+    def _score(self):
+        with self._lock:
+            if self._finished:
+                return
+            audio = self.audio()
+            self._scoring_samples = len(audio)
+        try:
+            features = self.cough_detector.extract_features(audio, self.fs)
+            if np.ndim(features) == 2:
+                self._scored = (len(audio), features)
+                self._provisional = (len(audio), float(self.cough_detector.classify_cough(features)[0]))
+        except Exception as e:
+            logging.warning('Could not score %d streamed samples: %s', len(audio), e)
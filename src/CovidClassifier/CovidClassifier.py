@@ -1,5 +1,4 @@
 import os
-import pickle
 import logging
 import librosa
 import numpy as np
@@ -7,14 +6,29 @@ import pandas as pd
 from math import pi
 from scipy.fftpack import fft, hilbert
 from sklearn.ensemble import GradientBoostingClassifier
-from .gcp_inference import get_vggish_embedding
+from .gcp_inference import get_vggish_embedding, get_vggish_embeddings, vggish_model, GCP_MODEL_VERSION_ENV
+from .embedding_cache import EmbeddingCache
+from .audio_analysis import AudioAnalysis
+from ..Utils import Resample, to_float
+from ..ModelRegistry import get_model
+from ..Metrics import timer, timed, count
 
 MEAN_VGGISH_EMBEDDING = 0.63299006
 VGGISH_EMBEDDING_INDEX = 33
+N_VGGISH_FEATURES = 1
+N_AUDIO_FEATURES = 8
+N_CLINICAL_FEATURES = 3
+# Columns of the model input, in order
+FEATURE_NAMES = ['vggish', 'duration', 'onsets', 'period', 'rms_max', 'rms_median', 'rms_p25', 'rms_skew',
+                 'spectral_bandwidth', 'age', 'respiratory_condition', 'fever_muscle_pain']
 
 class CovidClassifier:
     def __init__(self):
-        self.model = pickle.load(open(os.path.join('models', 'gbc_ovo_roc_70_5'), 'rb'))
+        self.embedding_cache = EmbeddingCache.from_environment()
+
+    @property
+    def model(self):
+        return get_model('gbc_ovo_roc_70_5')
 
     def classify_cough(self, audio, fs, clinical_features):
         """Classify whether an inputted signal is a cough or not using filtering, feature extraction, and ML classification
@@ -27,12 +41,93 @@ class CovidClassifier:
         audio_features = self.__extract_audio_features(audio, fs)
         clinical_features = self.__extract_clinical_features(clinical_features)
 
-        logging.debug('VGGish Features:', vggish_features)
-        logging.debug('Audio Features:', audio_features)
-        logging.debug('Clinical Features:', clinical_features)
+        logging.debug('VGGish Features: %s', vggish_features)
+        logging.debug('Audio Features: %s', audio_features)
+        logging.debug('Clinical Features: %s', clinical_features)
 
         features = np.concatenate((vggish_features, audio_features, clinical_features))
-        result = self.model.predict_proba(np.array([features]))
+        with timer('covid_predict_proba'):
+            result = self.model.predict_proba(np.array([features]))
+        count('covid_predictions')
+        return result
+
+    def classify_batch(self, recordings):
+        """Classify many recordings with one VGGish round trip and a single model call.
+
+        Args:
+            recordings (list): (audio, fs, clinical_features) tuples as taken by classify_cough
+
+        Returns:
+            (np.array): (N, n_classes) class probabilities, one row per recording
+        """
+        return self.classify_prepared_batch([self.prepare(audio, fs, clinical_features)
+                                             for audio, fs, clinical_features in recordings])
+
+    def prepare(self, audio, fs, clinical_features, analysis=None):
+        """Computes the per-recording part of classify_batch: the VGGish window and the local features.
+
+        This is the CPU-bound share of the work; it can run in another process than
+        classify_prepared_batch, which only needs its return value.
+
+        Args:
+            audio (np.array): audio
+            fs (int): sample rate
+            clinical_features (dict): clinical features
+            analysis (AudioAnalysis): analysis of the audio to reuse, e.g. for the mel-spectrogram view
+
+        Returns:
+            (tuple): VGGish window (None if the audio cannot be resampled) and feature row whose
+                VGGish features are filled in by classify_prepared_batch
+        """
+        try:
+            window = self.__vggish_window(audio, fs)
+        except Exception:
+            window = None
+
+        vggish_end = N_VGGISH_FEATURES
+        audio_end = vggish_end + N_AUDIO_FEATURES
+        row = np.full(audio_end + N_CLINICAL_FEATURES, np.nan)
+        row[vggish_end:audio_end] = self.__extract_audio_features(audio, fs, analysis)
+        row[audio_end:] = self.__extract_clinical_features(clinical_features)
+        return window, row
+
+    def classify_prepared_batch(self, prepared):
+        """Classify recordings prepared by prepare with one VGGish round trip and a single model call.
+
+        Args:
+            prepared (list): (window, row) tuples returned by prepare
+
+        Returns:
+            (np.array): (N, n_classes) class probabilities, one row per recording
+        """
+        return self.classify_features(self.complete_features(prepared))
+
+    def complete_features(self, prepared):
+        """Fills in the VGGish features of recordings prepared by prepare, with one VGGish round trip.
+
+        Args:
+            prepared (list): (window, row) tuples returned by prepare
+
+        Returns:
+            (np.array): (N, len(FEATURE_NAMES)) model inputs, one row per recording
+        """
+        windows = [window for window, _ in prepared]
+        features = np.array([row for _, row in prepared])
+        features[:, :N_VGGISH_FEATURES] = self.__extract_vggish_features_batch(windows)
+        return features
+
+    def classify_features(self, features):
+        """Classify complete feature rows, e.g. as returned by complete_features or read from the feature store.
+
+        Args:
+            features (np.array): (N, len(FEATURE_NAMES)) model inputs
+
+        Returns:
+            (np.array): (N, n_classes) class probabilities, one row per recording
+        """
+        with timer('covid_predict_proba'):
+            result = self.model.predict_proba(features)
+        count('covid_predictions', len(features))
         return result
 
     def __extract_clinical_features(self, clinical_features):
@@ -41,7 +136,7 @@ class CovidClassifier:
         Args:
             clinical_features (dict): clinical features
         """
-        print(clinical_features)
+        logging.debug('Clinical features: %s', clinical_features)
         try:
             return np.array([
                 float(clinical_features['age']), 
@@ -63,55 +158,130 @@ class CovidClassifier:
             fs (int): sample rate
         """
         try:
-            resampled_audio = librosa.resample(audio, fs, 16000, res_type='kaiser_best')
-            cut_audio = resampled_audio.tolist()[-int(4.2*16000):]
-            embeddings = get_vggish_embedding(os.environ['GCP_PROJECT'], os.environ['GCP_MODEL'], cut_audio)[0]['output_0']
-            return np.mean(embeddings, axis=0)[VGGISH_EMBEDDING_INDEX]
+            cut_audio = self.__vggish_window(audio, fs)
+            project, model, version = self.__vggish_endpoint()
+            key = self.embedding_cache.key(cut_audio, vggish_model(project, model, version))
+            embedding = self.embedding_cache.get(key)
+            if embedding is None:
+                predictions = get_vggish_embedding(project, model, cut_audio, version)
+                embedding = self.__mean_embedding(predictions)
+                self.embedding_cache.put(key, embedding)
+            return self.__vggish_feature(embedding)
         except:
             logging.warning('Could not obtain VGGish embeddings. Check if AI Platform endpoint is enabled and credentials are set.')
             return np.array([MEAN_VGGISH_EMBEDDING])
 
-    def __extract_audio_features(self, signal, fs):
+    def __extract_vggish_features_batch(self, windows):
+        """Gets the VGGish features of many recordings, batching the requests to GCP.
+
+        Recordings whose embedding cannot be obtained get the mean embedding value.
+
+        Args:
+            windows (list): VGGish windows of the recordings, None for audio that could not be resampled
+
+        Returns:
+            (np.array): (N, 1) VGGish features
+        """
+        vggish_features = np.full((len(windows), N_VGGISH_FEATURES), MEAN_VGGISH_EMBEDDING)
+        if any(window is None for window in windows):
+            logging.warning('Could not obtain VGGish embeddings. Check if AI Platform endpoint is enabled and credentials are set.')
+
+        try:
+            project, model, version = self.__vggish_endpoint()
+            identity = vggish_model(project, model, version)
+            missing = {}  # key -> indices of the recordings with that audio window
+            for i, window in enumerate(windows):
+                if window is None:
+                    continue
+                key = self.embedding_cache.key(window, identity)
+                if key in missing:
+                    missing[key].append(i)
+                    continue
+                embedding = self.embedding_cache.get(key)
+                if embedding is None:
+                    missing[key] = [i]
+                else:
+                    vggish_features[i] = self.__vggish_feature(embedding)
+
+            # Only audio which is not cached yet reaches the endpoint, once per distinct window
+            if missing:
+                results = get_vggish_embeddings(project, model, [windows[indices[0]] for indices in missing.values()],
+                                                version)
+            else:
+                results = []
+        except Exception:
+            logging.warning('Could not obtain VGGish embeddings. Check if AI Platform endpoint is enabled and credentials are set.')
+            return vggish_features
+
+        for (key, indices), predictions in zip(missing.items(), results):
+            if isinstance(predictions, Exception):
+                logging.warning('Could not obtain VGGish embedding of recordings %s: %s', indices, predictions)
+                continue
+            embedding = self.__mean_embedding(predictions)
+            self.embedding_cache.put(key, embedding)
+            vggish_features[indices] = self.__vggish_feature(embedding)
+        return vggish_features
+
+    def __vggish_endpoint(self):
+        """Gets the project, model and version (None for the default one) of the VGGish endpoint."""
+        return os.environ['GCP_PROJECT'], os.environ['GCP_MODEL'], os.environ.get(GCP_MODEL_VERSION_ENV)
+
+    def __vggish_window(self, audio, fs):
+        """Resamples the audio to 16kHz and keeps the last 4.2 seconds accepted by the VGGish endpoint.
+
+        Integer WAV samples, as decoded by Recording, are scaled to floats in [-1, 1] first, which is
+        what librosa.load returns and VGGish expects.
+        """
+        if np.issubdtype(np.asarray(audio).dtype, np.integer):
+            audio = to_float(np.asarray(audio))
+        with timer('vggish_resample'):
+            resampled_audio = Resample.resample(audio, fs, 16000, quality='best')
+        return resampled_audio.tolist()[-int(4.2*16000):]
+
+    def __mean_embedding(self, predictions):
+        """Averages the frame embeddings returned by the VGGish endpoint."""
+        embeddings = predictions[0]['output_0']
+        return np.mean(embeddings, axis=0)
+
+    def __vggish_feature(self, embedding):
+        """Reduces the mean VGGish embedding to the feature used by the model."""
+        return np.atleast_1d(embedding[VGGISH_EMBEDDING_INDEX])
+
+    @timed('covid_audio_features')
+    def __extract_audio_features(self, signal, fs, analysis=None):
         """Extract part of handcrafted features from the input signal.
         :param signal: the signal the extract features from
         :type signal: numpy.ndarray
         :param signal_sr: the sample rate of the signal
         :type signal_sr: integer
+        :param analysis: spectral representations of the signal to reuse, computed here if None
+        :type analysis: AudioAnalysis
         :return: the populated feature vector
         :rtype: numpy.ndarray
         """
         try:
-          frame_len = int(fs / 10)  # 100 ms
-          hop = int(frame_len / 2)  # 50% overlap, meaning 5ms hop length
-
-          # normalise the sound signal before processing
-          signal = signal / np.max(np.abs(signal))
-
-          # trim the signal to the appropriate length
-          trimmed_signal, idc = librosa.effects.trim(signal, frame_length=frame_len, hop_length=hop)
+          # normalised and trimmed signal with its spectral representations, see AudioAnalysis
+          if analysis is None:
+              analysis = AudioAnalysis(signal, fs)
+          signal = analysis.signal
+          trimmed_signal = analysis.trimmed
 
           # extract the signal duration
           signal_duration = librosa.get_duration(y=trimmed_signal, sr=fs)
 
-          # find the onset strength of the trimmed signal
-          o_env = librosa.onset.onset_strength(trimmed_signal, sr=fs)
-
-          # find the frames of the onset
-          onset_frames = librosa.onset.onset_detect(onset_envelope=o_env, sr=fs)
+          # find the frames of the onset from the onset strength of the trimmed signal
+          onset_frames = librosa.onset.onset_detect(onset_envelope=analysis.onset_envelope, sr=fs)
 
           # keep only the first onset frame
           onsets = onset_frames.shape[0]
 
-          # decompose the signal into its magnitude and the phase components such that signal = mag * phase
-          mag, phase = librosa.magphase(librosa.stft(trimmed_signal, n_fft=frame_len, hop_length=hop))
-
-          # extract the rms from the magnitude component
-          rms = librosa.feature.rms(y=trimmed_signal)[0]
+          # extract the rms of the trimmed signal
+          rms = analysis.rms
           s = pd.Series(rms)
           rms_skew = s.skew()
 
-          # extract the spectral bandwith of the magnitude
-          spec_bandwidth = librosa.feature.spectral_bandwidth(S=mag)[0]
+          # extract the spectral bandwith of the magnitude of the 100 ms frames
+          spec_bandwidth = analysis.spectral_bandwidth
 
           # pack the extracted features into the feature vector to be returned
           signal_features = np.concatenate(
@@ -1 +1,2 @@
-from .CovidClassifier import CovidClassifier
\ No newline at end of file
+from .CovidClassifier import CovidClassifier
+from .audio_analysis import AudioAnalysis
\ No newline at end of file
@@ -0,0 +1,83 @@
+# Spectral representations of a recording shared between the Covid-19 classifier's audio features and the app
+
+from functools import lru_cache
+import librosa
+import numpy as np
+
+# librosa's defaults for melspectrogram, onset_strength and rms
+N_FFT = 2048
+HOP_LENGTH = 512
+N_MELS = 128
+
+@lru_cache(maxsize=16)
+def mel_basis(sr, n_fft=N_FFT, n_mels=N_MELS):
+    """Gets the mel filterbank of a sample rate and FFT size, built once per process.
+
+    Returns:
+        (np.array): read-only (n_mels, 1 + n_fft // 2) filterbank
+    """
+    basis = librosa.filters.mel(sr=sr, n_fft=n_fft, n_mels=n_mels)
+    basis.setflags(write=False)
+    return basis
+
+class AudioAnalysis:
+    """Normalized and trimmed recording with lazily computed, memoized spectral representations.
+
+    The mel spectrogram is computed once and shared by the onset envelope and the mel-spectrogram
+    view; each representation matches the librosa call it replaces. Nothing is computed before
+    it is first used, so creating an analysis never fails.
+
+    Example Usage:
+    >>> analysis = AudioAnalysis(audio, fs)
+    >>> onsets = librosa.onset.onset_detect(onset_envelope=analysis.onset_envelope, sr=fs)
+    >>> S_dB = librosa.power_to_db(analysis.mel_power, ref=np.max)
+    """
+    def __init__(self, audio, fs):
+        self.audio = audio
+        self.fs = fs
+        self.frame_length = int(fs / 10)  # 100 ms
+        self.hop_length = int(self.frame_length / 2)  # 50% overlap
+        self._memo = {}
+
+    def _memoized(self, name, compute):
+        if name not in self._memo:
+            self._memo[name] = compute()
+        return self._memo[name]
+
+    @property
+    def signal(self):
+        """(np.array) audio normalized to a peak amplitude of 1"""
+        return self._memoized('signal', lambda: self.audio / np.max(np.abs(self.audio)))
+
+    @property
+    def trimmed(self):
+        """(np.array) normalized audio without leading and trailing silence"""
+        return self._memoized('trimmed', lambda: librosa.effects.trim(
+            self.signal, frame_length=self.frame_length, hop_length=self.hop_length)[0])
+
+    @property
+    def mel_power(self):
+        """(np.array) mel power spectrogram of the trimmed audio, as librosa.feature.melspectrogram"""
+        def compute():
+            power = np.abs(librosa.stft(self.trimmed, n_fft=N_FFT, hop_length=HOP_LENGTH)) ** 2
+            return np.dot(mel_basis(self.fs), power)
+        return self._memoized('mel_power', compute)
+
+    @property
+    def onset_envelope(self):
+        """(np.array) onset strength of the trimmed audio, as librosa.onset.onset_strength"""
+        return self._memoized('onset_envelope', lambda: librosa.onset.onset_strength(
+            S=librosa.power_to_db(self.mel_power), sr=self.fs, n_fft=N_FFT, hop_length=HOP_LENGTH))
+
+    @property
+    def rms(self):
+        """(np.array) frame-wise RMS of the trimmed audio with librosa's default frames"""
+        return self._memoized('rms', lambda: librosa.feature.rms(y=self.trimmed)[0])
+
+    @property
+    def spectral_bandwidth(self):
+        """(np.array) spectral bandwidth of the trimmed audio's 100 ms frames"""
+        def compute():
+            magnitude = np.abs(librosa.stft(self.trimmed, n_fft=self.frame_length, hop_length=self.hop_length))
+            return librosa.feature.spectral_bandwidth(S=magnitude)[0]
+        return self._memoized('spectral_bandwidth', compute)
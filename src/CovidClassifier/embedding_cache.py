@@ -0,0 +1,147 @@
+import os
+import hashlib
+import logging
+import threading
+import numpy as np
+from collections import OrderedDict
+from ..Metrics import count
+
+VGGISH_CACHE_SIZE_ENV = 'VGGISH_CACHE_SIZE'
+VGGISH_CACHE_DIR_ENV = 'VGGISH_CACHE_DIR'
+DEFAULT_CACHE_SIZE = 1024
+
+class EmbeddingCache:
+    """Content-addressed cache of VGGish embeddings.
+
+    Embeddings are keyed by a hash of the model that computed them and the exact audio window sent
+    to it, so a new model, version or endpoint never gets the embeddings of the previous one. Recent
+    entries are kept in a bounded in-memory LRU; if a directory is given, entries are also written
+    to disk so they survive restarts.
+
+    Example Usage:
+    >>> cache = EmbeddingCache(max_entries=512, disk_dir='/tmp/vggish_cache')
+    >>> key = cache.key(window, vggish_model(project, model))
+    >>> embedding = cache.get(key)
+    >>> if embedding is None:
+    ...     cache.put(key, get_embedding(window))
+    """
+    def __init__(self, max_entries=DEFAULT_CACHE_SIZE, disk_dir=None):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        if disk_dir is not None:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @classmethod
+    def from_environment(cls):
+        """Creates a cache configured by the VGGISH_CACHE_SIZE and VGGISH_CACHE_DIR environment variables."""
+        max_entries = int(os.environ.get(VGGISH_CACHE_SIZE_ENV, DEFAULT_CACHE_SIZE))
+        return cls(max_entries=max_entries, disk_dir=os.environ.get(VGGISH_CACHE_DIR_ENV))
+
+    @staticmethod
+    def key(window, model):
+        """Computes the cache key of an audio window embedded by a model.
+
+        Args:
+            window (list or np.array): audio window sent to the endpoint
+            model (str): identity of the model, see gcp_inference.vggish_model
+
+        Returns:
+            (str): hex digest of the model identity and the window samples
+        """
+        samples = np.ascontiguousarray(window, dtype=np.float32)
+        digest = hashlib.blake2b(model.encode('utf-8') + b'\0', digest_size=16)
+        digest.update(samples.tobytes())
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Looks up an embedding, first in memory and then on disk.
+
+        Args:
+            key (str): cache key
+
+        Returns:
+            (np.array): the cached embedding, or None if it is not cached
+        """
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                count('vggish_cache_hit')
+                return embedding
+
+        embedding = self.__read_disk(key)
+        with self._lock:
+            if embedding is None:
+                self.misses += 1
+                count('vggish_cache_miss')
+                return None
+            self.disk_hits += 1
+            count('vggish_cache_disk_hit')
+            self.__insert(key, embedding)
+        return embedding
+
+    def put(self, key, embedding):
+        """Stores an embedding.
+
+        Args:
+            key (str): cache key
+            embedding (np.array): embedding to store
+        """
+        embedding = np.asarray(embedding)
+        with self._lock:
+            self.__insert(key, embedding)
+        self.__write_disk(key, embedding)
+
+    def stats(self):
+        """Gets the cache counters.
+
+        Returns:
+            (dict): hits, disk hits, misses and number of entries held in memory
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'entries': len(self._entries)
+            }
+
+    def __insert(self, key, embedding):
+        self._entries[key] = embedding
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __path(self, key):
+        return os.path.join(self.disk_dir, key[:2], f'{key}.npy')
+
+    def __read_disk(self, key):
+        if self.disk_dir is None:
+            return None
+        try:
+            return np.load(self.__path(key))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            logging.warning('Could not read cached VGGish embedding %s.', key)
+            return None
+
+    def __write_disk(self, key, embedding):
+        if self.disk_dir is None:
+            return
+        path = self.__path(key)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                np.save(f, embedding)
+            os.replace(tmp_path, path)
+        except OSError:
+            logging.warning('Could not write cached VGGish embedding %s.', key)
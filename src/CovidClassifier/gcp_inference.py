@@ -1,6 +1,185 @@
+import os
+import json
+import queue
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
 import googleapiclient.discovery
 from google.api_core.client_options import ClientOptions
+from requests.adapters import HTTPAdapter
+from ..Metrics import timed
 
+VGGISH_ENDPOINT_ENV = 'VGGISH_ENDPOINT'
+VGGISH_INSTANCES_PER_REQUEST_ENV = 'VGGISH_INSTANCES_PER_REQUEST'
+GCP_MODEL_VERSION_ENV = 'GCP_MODEL_VERSION'
+AI_PLATFORM_ENDPOINT = 'https://ml.googleapis.com'
+
+class DiscoveryTransport:
+    """Sends predict requests to AI Platform through reusable googleapiclient service objects.
+
+    Building a service object reads the discovery document and creates a new HTTP connection, so
+    service objects are built once and kept in a pool. A service object is only used by one thread
+    at a time, since its underlying httplib2 connection is not thread-safe.
+    """
+    def __init__(self, max_batch_size=100):
+        self.max_batch_size = max_batch_size
+        self.endpoint = AI_PLATFORM_ENDPOINT
+        self._services = queue.LifoQueue()
+
+    def predict(self, name, instances):
+        """Sends one predict request.
+
+        Args:
+            name (str): full resource name of the model or model version.
+            instances (list): instances of the request.
+        Returns:
+            dict: response of the endpoint.
+        """
+        service = self._acquire()
+        try:
+            return service.projects().predict(name=name, body={'instances': instances}).execute()
+        finally:
+            self._services.put(service)
+
+    def predict_many(self, name, instances_list):
+        """Sends several predict requests, multiplexed into batch HTTP requests.
+
+        Args:
+            name (str): full resource name of the model or model version.
+            instances_list ([list]): instances of every request.
+        Returns:
+            list: response of every request, or the exception raised for that request.
+        """
+        responses = [None] * len(instances_list)
+
+        def callback(request_id, response, exception):
+            responses[int(request_id)] = exception if exception is not None else response
+
+        service = self._acquire()
+        try:
+            for start in range(0, len(instances_list), self.max_batch_size):
+                batch = service.new_batch_http_request(callback=callback)
+                for index in range(start, min(start + self.max_batch_size, len(instances_list))):
+                    request = service.projects().predict(name=name, body={'instances': instances_list[index]})
+                    batch.add(request, request_id=str(index))
+                batch.execute()
+        finally:
+            self._services.put(service)
+
+        return responses
+
+    def _acquire(self):
+        try:
+            return self._services.get_nowait()
+        except queue.Empty:
+            return googleapiclient.discovery.build('ml', 'v1', cache_discovery=False)
+
+class HttpTransport:
+    """Sends predict requests as JSON over a pooled, keep-alive HTTP session.
+
+    Follows the AI Platform REST layout (POST {base_url}/v1/{name}:predict), which allows a local
+    stand-in server such as vggish_stub to replace the real endpoint in tests and benchmarks.
+    """
+    def __init__(self, base_url, pool_size=10, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.endpoint = self.base_url
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self._requests = None
+        self._executor_lock = threading.Lock()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def predict(self, name, instances):
+        """Sends one predict request, see DiscoveryTransport.predict."""
+        response = self.session.post(f'{self.base_url}/v1/{name}:predict',
+                                     data=json.dumps({'instances': instances}),
+                                     headers={'Content-Type': 'application/json'},
+                                     timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def predict_many(self, name, instances_list):
+        """Sends several predict requests concurrently over the pooled connections, see DiscoveryTransport.predict_many."""
+        def predict(instances):
+            try:
+                return self.predict(name, instances)
+            except Exception as e:
+                return e
+
+        if len(instances_list) <= 1:
+            return [predict(instances) for instances in instances_list]
+        return list(self._executor().map(predict, instances_list))
+
+    def _executor(self):
+        with self._executor_lock:
+            if self._requests is None:
+                self._requests = ThreadPoolExecutor(max_workers=self.pool_size)
+            return self._requests
+
+_transport = None
+_transport_lock = threading.Lock()
+
+def get_transport():
+    """Gets the process-wide transport, creating it on first use.
+
+    Uses an HttpTransport if the VGGISH_ENDPOINT environment variable is set, otherwise the
+    AI Platform DiscoveryTransport.
+
+    Returns:
+        transport used for predict requests.
+    """
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                endpoint = os.environ.get(VGGISH_ENDPOINT_ENV)
+                _transport = HttpTransport(endpoint) if endpoint else DiscoveryTransport()
+    return _transport
+
+def set_transport(transport):
+    """Replaces the process-wide transport.
+
+    Example Usage:
+    >>> set_transport(HttpTransport('http://localhost:8501'))
+
+    Args:
+        transport: object with predict(name, instances) and predict_many(name, instances_list) methods,
+            and optionally an endpoint attribute telling its embeddings apart in the cache, see vggish_model.
+    """
+    global _transport
+    with _transport_lock:
+        _transport = transport
+
+def vggish_model(project, model, version=None):
+    """Gets the identity of the model predict requests go to, e.g. to tell cached embeddings apart.
+
+    Example Usage:
+    >>> vggish_model('project', 'vggish', '2')
+    'https://ml.googleapis.com/projects/project/models/vggish/versions/2'
+
+    Args:
+        project (str): project where the Cloud ML Engine Model is deployed.
+        model (str): model name.
+        version (str): version of the model, None for its default version.
+    Returns:
+        str: endpoint of the process-wide transport followed by the full resource name of the model.
+    """
+    transport = get_transport()
+    endpoint = getattr(transport, 'endpoint', type(transport).__name__)
+    return f'{endpoint}/{_model_name(project, model, version)}'
+
+def _model_name(project, model, version=None):
+    name = 'projects/{}/models/{}'.format(project, model)
+
+    if version is not None:
+        name += '/versions/{}'.format(version)
+
+    return name
+
+@timed('vggish_remote')
 def get_vggish_embedding(project, model, instances, version=None):
     """Send json data to a deployed model for prediction.
 
@@ -16,19 +195,56 @@ def get_vggish_embedding(project, model, instances, version=None):
         Mapping[str: any]: dictionary of prediction results defined by the
             model.
     """
-    # Create the ML Engine service object.
-    service = googleapiclient.discovery.build('ml', 'v1')
-    name = 'projects/{}/models/{}'.format(project, model)
-
-    if version is not None:
-        name += '/versions/{}'.format(version)
-
-    response = service.projects().predict(
-        name=name,
-        body={'instances': instances}
-    ).execute()
+    response = get_transport().predict(_model_name(project, model, version), instances)
 
     if 'error' in response:
         raise RuntimeError(response['error'])
 
-    return response['predictions']
\ No newline at end of file
+    return response['predictions']
+
+@timed('vggish_remote_batch')
+def get_vggish_embeddings(project, model, instances_list, version=None, instances_per_request=None):
+    """Send several prediction requests to a deployed model using as few round trips as possible.
+
+    The currently deployed model consumes a whole instances list as a single waveform, so by default
+    each entry of instances_list is sent as its own predict request (multiplexed by the transport).
+    Models deployed with a batched signature accept several waveforms per body: setting
+    instances_per_request (or the VGGISH_INSTANCES_PER_REQUEST environment variable) packs that many
+    entries into one body, expecting one prediction per entry.
+
+    Args:
+        project (str): project where the Cloud ML Engine Model is deployed.
+        model (str): model name.
+        instances_list ([list]): instances of every prediction request, see get_vggish_embedding.
+        version: str, version of the model to target.
+        instances_per_request (int): number of entries packed into one predict body.
+    Returns:
+        list: prediction results of every entry, or the exception raised for that entry.
+    """
+    name = _model_name(project, model, version)
+    transport = get_transport()
+    if instances_per_request is None:
+        instances_per_request = int(os.environ.get(VGGISH_INSTANCES_PER_REQUEST_ENV, 1))
+
+    if instances_per_request <= 1:
+        return [_predictions(response) for response in transport.predict_many(name, instances_list)]
+
+    results = []
+    for start in range(0, len(instances_list), instances_per_request):
+        packed = instances_list[start:start + instances_per_request]
+        try:
+            predictions = _predictions(transport.predict(name, packed))
+        except Exception as e:
+            predictions = e
+        if isinstance(predictions, Exception):
+            results.extend([predictions] * len(packed))
+        else:
+            results.extend([[prediction] for prediction in predictions])
+    return results
+
+def _predictions(response):
+    if isinstance(response, Exception):
+        return response
+    if 'error' in response:
+        return RuntimeError(response['error'])
+    return response['predictions']
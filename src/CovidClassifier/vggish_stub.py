@@ -0,0 +1,83 @@
+# Local stand-in for the VGGish AI Platform endpoint
+#
+# Usage:
+#   python -m src.CovidClassifier.vggish_stub --port 8501
+#   export VGGISH_ENDPOINT=http://localhost:8501
+
+import json
+import time
+import logging
+import argparse
+import numpy as np
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+EMBEDDING_SIZE = 128
+FRAME_SAMPLES = 15600  # 0.975 s at 16kHz
+STUB_EMBEDDING_VALUE = 0.63299006
+
+def stub_embedding(waveform):
+    """Deterministic stand-in for a VGGish embedding, one row per 0.975 s frame.
+
+    Args:
+        waveform (list): audio at 16kHz
+
+    Returns:
+        (list): (n_frames, 128) embedding
+    """
+    n_frames = max(1, len(waveform) // FRAME_SAMPLES)
+    return np.full((n_frames, EMBEDDING_SIZE), STUB_EMBEDDING_VALUE).tolist()
+
+class VGGishStubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep connections alive like the real endpoint
+    delay = 0.0  # seconds added to every response to mimic the endpoint's latency
+
+    def do_POST(self):
+        if not self.path.endswith(':predict'):
+            self.send_error(404)
+            return
+
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        instances = body['instances']
+
+        # A flat list is one waveform, a list of lists packs several waveforms
+        if instances and isinstance(instances[0], list):
+            predictions = [{'output_0': stub_embedding(waveform)} for waveform in instances]
+        else:
+            predictions = [{'output_0': stub_embedding(instances)}]
+
+        payload = json.dumps({'predictions': predictions}).encode()
+        if self.delay:
+            time.sleep(self.delay)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        logging.debug(format, *args)
+
+def serve(host='127.0.0.1', port=8501, delay=0.0):
+    """Creates the stand-in server; call serve_forever() on the result to start it.
+
+    Args:
+        host (str): interface to bind to
+        port (int): port to listen on, 0 picks a free port
+        delay (float): seconds added to every response, e.g. the round trip time of the real endpoint
+
+    Returns:
+        (ThreadingHTTPServer): server
+    """
+    handler = type('DelayedVGGishStubHandler', (VGGishStubHandler,), {'delay': delay})
+    return ThreadingHTTPServer((host, port), handler)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local stand-in for the VGGish AI Platform endpoint.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8501)
+    parser.add_argument('--delay-ms', type=float, default=0, help='latency added to every response')
+    args = parser.parse_args()
+
+    server = serve(args.host, args.port, args.delay_ms / 1000)
+    print(f'VGGish stub listening on http://{args.host}:{server.server_port}')
+    server.serve_forever()
@@ -42,7 +42,7 @@ else:
 # `declare_component` and call it done. The wrapper allows us to customize
 # our component's API: we can pre-process its input args, post-process its
 # output value, and add a docstring for users.
-def CovidRecordButton(duration=5000.0, key=None):
+def CovidRecordButton(duration=5000.0, key=None, chunk_ms=0):
     """Create a new instance of "CovidRecordButton".
 
     Parameters
@@ -50,6 +50,9 @@ def CovidRecordButton(duration=5000.0, key=None):
     goal_duration: int or float
         The number of miliseconds the component should record for. Will only
         be approximated.
+    chunk_ms: int
+        If positive, the recording is also sent in chunks of about this many
+        miliseconds while it is being made, see `src.Utils.parse_chunk`.
     key: str or None
         An optional key that uniquely identifies this component. If this is
         None, and the component's arguments are changed, the component will
@@ -58,7 +61,12 @@ def CovidRecordButton(duration=5000.0, key=None):
     Returns
     -------
     recording
-        A 5 second cough recording stored as a WAV byte array.
+        A JSON string holding the 5 second cough recording as a base64
+        encoded WAV file ("wav") and a blob URL to play it back ("url").
+        Decode it with `src.Utils.parse_recording`. When streaming, the
+        recording also names its stream ("stream"), and until it is finished
+        the value is the latest chunk ({"stream": ..., "seq": ..., "chunk": ...},
+        with "last": true on the final one).
         (This is the value passed to `Streamlit.setComponentValue` on the
         frontend.)
 
@@ -70,7 +78,12 @@ def CovidRecordButton(duration=5000.0, key=None):
     # "default" is a special argument that specifies the initial return
     # value of the component before the user has interacted with it.
     approx_duration = duration + 600
-    recording = _component_func(duration=approx_duration, key=key, default=None)
+    recording = _component_func(duration=approx_duration, chunk_ms=chunk_ms, key=key, default=None)
+
+    # Streamed chunks drive the progress display, see NewUserPage
+    if recording == 'clicked' and chunk_ms > 0:
+        st.warning(f'Recording... 0.0/{duration / 1000:.1f}s')
+        return None
 
     # Check if button was clicked, otherwise, recording is delivered
     if recording == 'clicked':
@@ -1,6 +1,6 @@
 self.__precacheManifest = (self.__precacheManifest || []).concat([
   {
-    "revision": "329f464d59e8528f00d4745b28ae769d",
+    "revision": "32a7edd77fc31f858031748383865626",
     "url": "./index.html"
   },
   {
@@ -12,8 +12,8 @@ self.__precacheManifest = (self.__precacheManifest || []).concat([
     "url": "./static/js/2.54618dce.chunk.js.LICENSE.txt"
   },
   {
-    "revision": "0cb0faae9f5231528f17",
-    "url": "./static/js/main.6400d46d.chunk.js"
+    "revision": "60c1198e9a01b02b36ba",
+    "url": "./static/js/main.60c1198e.chunk.js"
   },
   {
     "revision": "7c26bca7e16783d14d15",
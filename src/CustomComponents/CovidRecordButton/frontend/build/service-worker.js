@@ -14,7 +14,7 @@
 importScripts("https://storage.googleapis.com/workbox-cdn/releases/4.3.1/workbox-sw.js");
 
 importScripts(
-  "./precache-manifest.a9aca4e7f42038b1a2ace416b9412388.js"
+  "./precache-manifest.d661af4133389a0e710c88422e33a2b2.js"
 );
 
 self.addEventListener('message', (event) => {
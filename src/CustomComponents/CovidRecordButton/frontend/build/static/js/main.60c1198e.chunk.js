@@ -0,0 +1,2 @@
+(this.webpackJsonpstreamlit_component_template=this.webpackJsonpstreamlit_component_template||[]).push([[0],{7:function(e,t,a){e.exports=a(8)},8:function(e,t,a){"use strict";a.r(t);var n=a(3),r=a(6);window.MediaRecorder=r.a;var o=document.body.appendChild(document.createElement("span")).appendChild(document.createElement("button"));o.classList.add("covid-button"),o.textContent="Start Recording";var i=null,d=5e3,s=null,l=0,u=null,p=[],f=!1,v=0,w=null,S=[];function y(){f||(v+=1,i.requestData())}function c(){f=!0,clearInterval(w),w=null,v+=1,i.stop(),o.textContent="Start Recording",i.stream.getTracks().forEach((function(e){return e.stop()}))}function m(e,t){var a=new FileReader;a.onload=function(e){t(e.target.result.split(",")[1])},a.readAsDataURL(e)}function h(e,t){m(e,(function(a){var r={wav:a,url:URL.createObjectURL(e)};null!==t&&(r.stream=t),n.a.setComponentValue(JSON.stringify(r))}))}function g(e,t,a,r){return new Promise((function(o){m(a,(function(a){if(e===u){var i={stream:e,seq:t,chunk:a};r&&(i.last=!0),n.a.setComponentValue(JSON.stringify(i))}o()}))}))}function b(e){return Promise.all(e.map((function(e){return e.arrayBuffer()}))).then((function(e){var t=e.reduce((function(e,t){return e+t.byteLength-44}),0),a=new Uint8Array(44+t);a.set(new Uint8Array(e[0],0,44));var n=44;e.forEach((function(e){a.set(new Uint8Array(e,44),n),n+=e.byteLength-44}));var r=new DataView(a.buffer);return r.setUint32(4,36+t,!0),r.setUint32(40,t,!0),new Blob([a],{type:"audio/wav"})}))}o.onclick=function(){navigator.mediaDevices.getUserMedia({audio:!0}).then((function(e){i=new MediaRecorder(e);var t=l>0?Date.now().toString(36)+Math.random().toString(36).slice(2):null;u=t,p=[],f=!1,v=0,S=[],i.addEventListener("dataavailable",(function(e){if(p.push(e.data),null!==t){var a=f&&p.length===v;S.push(g(t,p.length-1,e.data,a))}})),i.addEventListener("stop",(function(){p.length<v||(null===t?h(p[0],null):Promise.all(S).then((function(){return b(p)})).then((function(e){return h(e,t)})))})),null!==s&&clearTimeout(s),null!==w&&(clearInterval(w),w=null),i.start(),null!==t&&(w=setInterval(y,l)),o.textContent="Restart Recording",n.a.setComponentValue("clicked"),s=setTimeout(c,d)}))},n.a.events.addEventListener(n.a.RENDER_EVENT,(function(e){var t=e.detail;o.disabled=t.disabled,d=t.args.duration,l=t.args.chunk_ms||0,n.a.setFrameHeight()})),n.a.setComponentReady(),n.a.setFrameHeight()}},[[7,1,2]]]);
+//# sourceMappingURL=main.60c1198e.chunk.js.map
\ No newline at end of file
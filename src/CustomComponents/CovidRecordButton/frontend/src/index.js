@@ -15,31 +15,63 @@ let recorder = null;
 let duration = 5000;
 let timer = null;
 
+// Streaming: with chunkMs > 0 the audio is sent in chunks of about chunkMs while recording
+const WAV_HEADER_BYTES = 44;
+let chunkMs = 0;
+let streamId = null;
+let chunks = [];
+let stopping = false;
+// Every requested slice is answered by one dataavailable; the polyfill fires stop after each one
+// arriving once it is inactive, so only the stop following the last requested slice is final
+let requested = 0;
+let slicer = null;
+// Chunks being sent; the recording is sent after all of them, the last one included
+let sending = [];
+
 button.onclick = function() {
   // Streamlit via `Streamlit.setComponentValue`.
   // Request permissions to record audio
   navigator.mediaDevices.getUserMedia({ audio: true }).then(stream => {
     recorder = new MediaRecorder(stream) // MediaRecorder
-
-    // Set record to <audio> when recording will be finished
+    const id = chunkMs > 0 ? Date.now().toString(36) + Math.random().toString(36).slice(2) : null
+    streamId = id
+    chunks = []
+    stopping = false
+    requested = 0
+    sending = []
+
+    // Send every chunk while recording and the whole recording once it has stopped
     recorder.addEventListener('dataavailable', e => {
-      var arrayBuffer;
-      var reader = new FileReader();
-      reader.onload = function(event) {
-        arrayBuffer = new Uint8Array(event.target.result);
-        arrayBuffer = Array.from(arrayBuffer);
-        let blobURL = URL.createObjectURL(e.data)
-        Streamlit.setComponentValue(JSON.stringify({"data": arrayBuffer, "url": blobURL})) //     Object({'url': blobURL, 'data': }))
-      };
-      reader.readAsArrayBuffer(e.data);
+      chunks.push(e.data)
+      if (id !== null) {
+        const last = stopping && chunks.length === requested
+        sending.push(sendChunk(id, chunks.length - 1, e.data, last))
+      }
+    })
+    recorder.addEventListener('stop', () => {
+      if (chunks.length < requested) {
+        return
+      }
+      if (id === null) {
+        sendRecording(chunks[0], null)
+      } else {
+        Promise.all(sending).then(() => mergeWav(chunks)).then(wav => sendRecording(wav, id))
+      }
     })
 
     if (timer !== null) {
       clearTimeout(timer);
     }
+    if (slicer !== null) {
+      clearInterval(slicer);
+      slicer = null;
+    }
 
-    // Start recording
+    // Start recording, slicing it ourselves to know how many chunks are still to come
     recorder.start()
+    if (id !== null) {
+      slicer = setInterval(requestChunk, chunkMs)
+    }
     button.textContent = 'Restart Recording'
     Streamlit.setComponentValue('clicked')
 
@@ -48,8 +80,19 @@ button.onclick = function() {
   })
 }
 
+function requestChunk() {
+  if (!stopping) {
+    requested += 1
+    recorder.requestData()
+  }
+}
+
 function stopRecording() {
-  // Stop recording
+  // Stop recording, which requests the last chunk
+  stopping = true
+  clearInterval(slicer)
+  slicer = null
+  requested += 1
   recorder.stop()
   button.textContent = "Start Recording"
 
@@ -57,6 +100,61 @@ function stopRecording() {
   recorder.stream.getTracks().forEach(i => i.stop())
 }
 
+function readBase64(blob, callback) {
+  // Base64 payload of a blob (the part after "data:audio/wav;base64,")
+  var reader = new FileReader();
+  reader.onload = function(event) {
+    callback(event.target.result.split(',')[1])
+  };
+  reader.readAsDataURL(blob);
+}
+
+function sendRecording(blob, id) {
+  // Send the WAV as base64 instead of a list of byte values
+  readBase64(blob, wav => {
+    let blobURL = URL.createObjectURL(blob)
+    let recording = {"wav": wav, "url": blobURL}
+    if (id !== null) {
+      recording["stream"] = id
+    }
+    Streamlit.setComponentValue(JSON.stringify(recording))
+  })
+}
+
+function sendChunk(id, seq, blob, last) {
+  // "stream" must stay the first key, see src.Utils.parse_chunk
+  return new Promise(resolve => {
+    readBase64(blob, wav => {
+      if (id === streamId) {
+        let chunk = {"stream": id, "seq": seq, "chunk": wav}
+        if (last) {
+          chunk["last"] = true
+        }
+        Streamlit.setComponentValue(JSON.stringify(chunk))
+      }
+      resolve()
+    })
+  })
+}
+
+function mergeWav(blobs) {
+  // Every chunk is a complete WAV file; join their samples under the first chunk's header
+  return Promise.all(blobs.map(blob => blob.arrayBuffer())).then(buffers => {
+    const size = buffers.reduce((n, buffer) => n + buffer.byteLength - WAV_HEADER_BYTES, 0)
+    const wav = new Uint8Array(WAV_HEADER_BYTES + size)
+    wav.set(new Uint8Array(buffers[0], 0, WAV_HEADER_BYTES))
+    let offset = WAV_HEADER_BYTES
+    buffers.forEach(buffer => {
+      wav.set(new Uint8Array(buffer, WAV_HEADER_BYTES), offset)
+      offset += buffer.byteLength - WAV_HEADER_BYTES
+    })
+    const view = new DataView(wav.buffer)
+    view.setUint32(4, 36 + size, true)
+    view.setUint32(40, size, true)
+    return new Blob([wav], { type: 'audio/wav' })
+  })
+}
+
 /**
  * The component's render function. This will be called immediately after
  * the component is initially loaded, and then again every time the
@@ -71,6 +169,7 @@ function onRender(event) {
 
   // Get component recording duration
   duration = data.args["duration"]
+  chunkMs = data.args["chunk_ms"] || 0
 
   // We tell Streamlit to update our frameHeight after each render event, in
   // case it has changed. (This isn't strictly necessary for the example
@@ -0,0 +1,245 @@
+import os
+import csv
+import glob
+import time
+import uuid
+import atexit
+import logging
+import threading
+import numpy as np
+
+from .. import ModelRegistry
+from ..CoughDetector.CoughDetector import N_FEATURES as N_COUGH_FEATURES
+from ..CovidClassifier.CovidClassifier import FEATURE_NAMES as COVID_FEATURE_NAMES
+
+FEATURE_STORE_DIR_ENV = 'FEATURE_STORE_DIR'
+# Bump when columns are added, removed or change meaning; files of other versions are not mixed in
+SCHEMA_VERSION = 1
+SCHEMA_VERSION_KEY = b'feature_store.schema_version'
+PART_PATTERN = 'part-*.parquet'
+DEFAULT_FLUSH_ROWS = 64
+DEFAULT_FLUSH_INTERVAL = 60.0
+CLASS_NAMES = ['healthy', 'symptomatic', 'covid']
+RESCORE_COLUMNS = ['cough_uuid', 'model', 'model_checksum'] + [f'prob_{name}' for name in CLASS_NAMES]
+
+def schema():
+    """Gets the Arrow schema of the current schema version.
+
+    One row per donated recording: the cough detector's feature vector, the Covid-19 classifier's
+    inputs (VGGish scalar, handcrafted audio features, clinical fields) as named columns, and
+    when and at which sample rate the recording was made.
+    """
+    import pyarrow as pa
+    fields = [('cough_uuid', pa.string()), ('schema_version', pa.int32()), ('recorded_at', pa.float64()),
+              ('sample_rate', pa.int32()), ('cough_features', pa.list_(pa.float64(), N_COUGH_FEATURES))]
+    fields += [(name, pa.float64()) for name in COVID_FEATURE_NAMES]
+    return pa.schema(fields, metadata={SCHEMA_VERSION_KEY: str(SCHEMA_VERSION).encode()})
+
+class FeatureStore:
+    """Append-only columnar store of the features computed for donated recordings, keyed by cough UUID.
+
+    Rows are buffered and written as new Parquet files in the store's directory; existing files are
+    never modified, so several processes can append to the same store. A buffer is written once it
+    holds flush_rows rows, flush_interval seconds after its first row, and at exit. If a UUID is
+    appended more than once, its latest row wins when reading.
+
+    Example Usage:
+    >>> store = FeatureStore('feature_store')
+    >>> store.append(cough_uuid, cough_features, covid_features, rate)
+    >>> cough_uuids, cough_features, covid_features = store.load()
+
+    Args:
+        path (str): directory of the store's Parquet files
+        flush_rows (int): number of buffered rows written at once
+        flush_interval (float): seconds a row is buffered at most
+    """
+    def __init__(self, path, flush_rows=DEFAULT_FLUSH_ROWS, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        self.path = path
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self._rows = []
+        self._timer = None
+        self._lock = threading.Lock()
+        atexit.register(self.flush)
+
+    @classmethod
+    def from_environment(cls):
+        """Creates the store configured by FEATURE_STORE_DIR, or None if it is not set."""
+        path = os.environ.get(FEATURE_STORE_DIR_ENV)
+        return cls(path) if path else None
+
+    def append(self, cough_uuid, cough_features, covid_features, sample_rate, recorded_at=None):
+        """Adds the features of a recording.
+
+        Args:
+            cough_uuid (str): UUID of the donated cough
+            cough_features (np.array): cough detector features, None if they could not be extracted
+            covid_features (np.array): Covid-19 classifier inputs in the order of CovidClassifier.FEATURE_NAMES
+            sample_rate (int): sample rate of the recording
+            recorded_at (float): UNIX time of the recording, now by default
+        """
+        if cough_features is None or np.ndim(cough_features) == 0:
+            cough_features = np.full(N_COUGH_FEATURES, np.nan)
+        row = {'cough_uuid': cough_uuid, 'schema_version': SCHEMA_VERSION,
+               'recorded_at': time.time() if recorded_at is None else recorded_at,
+               'sample_rate': int(sample_rate),
+               'cough_features': np.ravel(cough_features).astype(float).tolist()}
+        row.update(zip(COVID_FEATURE_NAMES, np.ravel(covid_features).astype(float).tolist()))
+
+        with self._lock:
+            self._rows.append(row)
+            if len(self._rows) >= self.flush_rows:
+                self._write_buffer()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Writes the buffered rows."""
+        with self._lock:
+            self._write_buffer()
+
+    def _write_buffer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._rows:
+            return
+
+        import pyarrow as pa
+        table_schema = schema()
+        table = pa.table({field.name: [row[field.name] for row in self._rows] for field in table_schema},
+                         schema=table_schema)
+        try:
+            _write_part(self.path, table)
+            self._rows = []
+        except Exception as e:
+            logging.error('Could not write %d rows to feature store %s: %s', len(self._rows), self.path, e)
+
+    def read(self, columns=None):
+        """Reads the current schema version's rows, the latest one per cough UUID.
+
+        Files written with another schema version are skipped.
+
+        Args:
+            columns (list): columns to read besides cough_uuid and recorded_at, all by default
+
+        Returns:
+            (pyarrow.Table): rows ordered by cough UUID
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        files = self.files()
+        if columns is not None:
+            columns = ['cough_uuid', 'recorded_at'] + [column for column in columns
+                                                       if column not in ('cough_uuid', 'recorded_at')]
+        if not files:
+            table = schema().empty_table()
+            return table if columns is None else table.select(columns)
+
+        table = pa.concat_tables([pq.read_table(file, columns=columns) for file in files])
+        cough_uuids = np.array(table.column('cough_uuid').to_pylist(), dtype=object)
+        recorded_at = table.column('recorded_at').to_numpy()
+        # Sorted by UUID, then time: the last row of every UUID is the latest
+        order = np.lexsort((recorded_at, cough_uuids))
+        last = np.append(cough_uuids[order][1:] != cough_uuids[order][:-1], True)
+        return table.take(pa.array(order[last]))
+
+    def load(self):
+        """Reads the stored features as matrices.
+
+        Returns:
+            (tuple): cough UUIDs (list), (N, N_COUGH_FEATURES) cough detector features and
+                (N, len(FEATURE_NAMES)) Covid-19 classifier inputs
+        """
+        table = self.read()
+        cough_features = table.column('cough_features')
+        cough_matrix = np.concatenate([chunk.flatten().to_numpy(zero_copy_only=False) for chunk in cough_features.chunks]
+                                      or [np.empty(0)]).reshape(-1, N_COUGH_FEATURES)
+        covid_matrix = np.column_stack([table.column(name).to_numpy() for name in COVID_FEATURE_NAMES]) \
+            if table.num_rows else np.empty((0, len(COVID_FEATURE_NAMES)))
+        return table.column('cough_uuid').to_pylist(), cough_matrix, covid_matrix
+
+    def files(self):
+        """Gets the store's Parquet files of the current schema version, oldest first."""
+        import pyarrow.parquet as pq
+        files = []
+        for file in sorted(glob.glob(os.path.join(self.path, PART_PATTERN))):
+            metadata = pq.read_schema(file).metadata or {}
+            version = metadata.get(SCHEMA_VERSION_KEY, b'').decode()
+            if version == str(SCHEMA_VERSION):
+                files.append(file)
+            else:
+                logging.warning('Skipping feature store file %s with schema version %s.', file, version or 'unknown')
+        return files
+
+    def compact(self):
+        """Rewrites the current schema version's files into a single file holding the latest rows.
+
+        Files appended while compacting are kept as they are.
+
+        Returns:
+            (int): number of rows in the compacted file
+        """
+        self.flush()
+        files = self.files()
+        if len(files) <= 1:
+            return self.read().num_rows
+        table = self.read()
+        _write_part(self.path, table)
+        for file in files:
+            os.remove(file)
+        return table.num_rows
+
+def _write_part(path, table):
+    """Writes a table as a new part file; the file appears under its final name only once complete."""
+    import pyarrow.parquet as pq
+    os.makedirs(path, exist_ok=True)
+    name = f'part-{time.strftime("%Y%m%d-%H%M%S")}-{uuid.uuid4().hex[:8]}.parquet'
+    tmp_path = os.path.join(path, f'.{name}.tmp')
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, os.path.join(path, name))
+
+def rescore(store, output, model_name='gbc_ovo_roc_70_5'):
+    """Scores the stored Covid-19 classifier inputs with a model, without touching any audio.
+
+    Results are appended to a CSV file together with the model's checksum. Recordings the output
+    already holds a score for from the same model file are skipped, so after a model update only
+    the rescoring runs again, and after new donations only the new recordings are scored.
+    Recordings with missing (non-finite) inputs cannot be scored and are skipped.
+
+    Args:
+        store (FeatureStore): feature store
+        output (str): output CSV file
+        model_name (str): model in the models directory, see ModelRegistry.get_model
+
+    Returns:
+        (int): number of recordings scored
+    """
+    model = ModelRegistry.get_model(model_name)
+    model_checksum = ModelRegistry.checksum(model_name)
+
+    completed = set()
+    if os.path.isfile(output):
+        with open(output, newline='') as f:
+            completed = {row['cough_uuid'] for row in csv.DictReader(f) if row['model_checksum'] == model_checksum}
+
+    cough_uuids, _, covid_features = store.load()
+    pending = np.array([cough_uuid not in completed for cough_uuid in cough_uuids], dtype=bool)
+    finite = np.isfinite(covid_features).all(axis=1)
+    if (pending & ~finite).any():
+        logging.warning('Skipping %d recordings with missing Covid-19 classifier inputs.', (pending & ~finite).sum())
+    pending &= finite
+    if not pending.any():
+        return 0
+    probabilities = model.predict_proba(covid_features[pending])
+
+    new_file = not os.path.isfile(output) or os.path.getsize(output) == 0
+    with open(output, 'a', newline='') as f:
+        writer = csv.writer(f)
+        if new_file:
+            writer.writerow(RESCORE_COLUMNS)
+        for cough_uuid, row in zip(np.array(cough_uuids, dtype=object)[pending], probabilities):
+            writer.writerow([cough_uuid, model_name, model_checksum] + row.tolist())
+    return len(probabilities)
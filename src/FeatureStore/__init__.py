@@ -0,0 +1,4 @@
+from .FeatureStore import FeatureStore
+from .FeatureStore import rescore
+from .FeatureStore import schema
+from .FeatureStore import SCHEMA_VERSION
\ No newline at end of file
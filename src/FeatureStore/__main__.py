@@ -0,0 +1,30 @@
+import logging
+import argparse
+
+from .FeatureStore import FeatureStore, rescore
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m src.FeatureStore',
+                                     description='Maintains and re-scores the feature store of donated recordings.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    rescore_parser = subparsers.add_parser('rescore', help='score the stored features with a model, '
+                                                           'skipping recordings already scored by the same model file')
+    rescore_parser.add_argument('store', help='feature store directory')
+    rescore_parser.add_argument('output', help='output CSV file, appended to')
+    rescore_parser.add_argument('--model', default='gbc_ovo_roc_70_5',
+                                help='model file in the models directory, see MODEL_DIR (default: gbc_ovo_roc_70_5)')
+
+    compact_parser = subparsers.add_parser('compact', help='merge the store\'s files into one')
+    compact_parser.add_argument('store', help='feature store directory')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    store = FeatureStore(args.store)
+    if args.command == 'rescore':
+        logging.info('Scored %d recordings.', rescore(store, args.output, args.model))
+    else:
+        logging.info('Compacted %d recordings.', store.compact())
+
+if __name__ == '__main__':
+    main()
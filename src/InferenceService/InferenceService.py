@@ -0,0 +1,207 @@
+import json
+import time
+import asyncio
+import logging
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import tornado.web
+import tornado.ioloop
+import tornado.httpserver
+
+from .. import ModelRegistry
+from ..Utils import Recording, ArtifactCache, recording_id
+from ..CoughDetector import CoughDetector
+from ..CovidClassifier import CovidClassifier
+from .batching import MicroBatcher
+
+CLINICAL_FIELDS = ['age', 'respiratory_condition', 'fever_muscle_pain']
+CLASS_NAMES = ['healthy', 'symptomatic', 'covid']
+MAX_BODY_SIZE = 16 * 1024 * 1024
+DEFAULT_BATCH_WINDOW = 0.005
+DEFAULT_MAX_BATCH_SIZE = 32
+# Cough confidences kept so /v1/predict does not detect the cough /v1/cough just detected again
+COUGH_CACHE_SIZE = 4096
+
+_cough_detector = None
+_covid_classifier = None
+
+def _classifiers():
+    global _cough_detector, _covid_classifier
+    if _cough_detector is None:
+        _cough_detector, _covid_classifier = CoughDetector(), CovidClassifier()
+    return _cough_detector, _covid_classifier
+
+def prepare(wav_bytes, clinical_features=None, detect_cough=True):
+    """Runs the per-recording, CPU-bound part of inference: decoding and feature extraction.
+
+    Executed in the worker processes of the service, each of which keeps its own classifiers.
+    The model calls and the VGGish request are left to the batch stages in the main process.
+
+    Args:
+        wav_bytes (bytes): WAV file
+        clinical_features (dict): clinical features, None only prepares cough detection
+        detect_cough (bool): False skips the cough detection features, e.g. if the confidence is known
+
+    Returns:
+        (dict): cough detection features (if requested), prepared Covid-19 classifier inputs (if requested)
+            and timings
+    """
+    cough_detector, covid_classifier = _classifiers()
+
+    start = time.perf_counter()
+    rec = Recording(wav_bytes)
+    decoded = time.perf_counter()
+    prepared = {'timings': {'decode': decoded - start}}
+    extracted = decoded
+    if detect_cough:
+        cough_features = cough_detector.extract_features(rec.audio, rec.rate)
+        if np.ndim(cough_features) != 2:
+            raise ValueError('Could not extract cough detection features from the recording.')
+        extracted = time.perf_counter()
+        prepared['cough_features'] = cough_features[0]
+        prepared['timings']['cough_features'] = extracted - decoded
+
+    if clinical_features is not None:
+        prepared['covid'] = covid_classifier.prepare(rec.audio, rec.rate, clinical_features)
+        prepared['timings']['covid_features'] = time.perf_counter() - extracted
+    return prepared
+
+def classify_cough_batch(features):
+    """Batch stage of cough detection: one scaler and model call for all feature vectors."""
+    cough_detector, _ = _classifiers()
+    return cough_detector.classify_cough_batch(np.vstack(features)).tolist()
+
+def classify_covid_batch(prepared):
+    """Batch stage of Covid-19 classification: one VGGish round trip and one model call."""
+    _, covid_classifier = _classifiers()
+    return list(covid_classifier.classify_prepared_batch(prepared))
+
+class _PredictHandler(tornado.web.RequestHandler):
+    """POST a WAV file as the request body; clinical features are passed as query arguments."""
+    def initialize(self, executor, cough_batcher, covid_batcher, cough_cache, classify):
+        self.executor = executor
+        self.cough_batcher = cough_batcher
+        self.covid_batcher = covid_batcher
+        self.cough_cache = cough_cache
+        self.classify = classify
+
+    async def post(self):
+        wav_bytes = self.request.body
+        if not wav_bytes:
+            raise tornado.web.HTTPError(400, reason='Request body must be a WAV file.')
+
+        clinical_features = None
+        if self.classify:
+            # Unanswered fields are left out, the classifier then falls back like in the app
+            arguments = {field: self.get_query_argument(field, None) for field in CLINICAL_FIELDS}
+            try:
+                clinical_features = {field: float(value) for field, value in arguments.items() if value is not None}
+            except ValueError as e:
+                raise tornado.web.HTTPError(400, reason=f'Invalid clinical features: {e}')
+
+        rec_id = recording_id(wav_bytes)
+        cached_conf = self.cough_cache.get(rec_id, 'cough_conf')
+        try:
+            prepared = await tornado.ioloop.IOLoop.current().run_in_executor(
+                self.executor, prepare, wav_bytes, clinical_features, cached_conf is None)
+        except ValueError as e:
+            # Raised for malformed WAV files and recordings without usable audio
+            raise tornado.web.HTTPError(400, reason=str(e))
+
+        start = time.perf_counter()
+        result = {'recording_id': rec_id, 'timings': prepared['timings']}
+        if cached_conf is None:
+            cough_stage = self.cough_batcher.submit(prepared['cough_features'])
+        else:
+            cough_stage = asyncio.sleep(0, result=cached_conf)
+        if self.classify:
+            cough_conf, probabilities = await asyncio.gather(cough_stage, self.covid_batcher.submit(prepared['covid']))
+            result['probabilities'] = dict(zip(CLASS_NAMES, (_finite(p) for p in probabilities)))
+            result['prediction'] = int(np.argmax(probabilities)) if np.all(np.isfinite(probabilities)) else None
+        else:
+            cough_conf = await cough_stage
+        # NaN is not valid JSON, rows the cough detector could not score get null and the reason instead
+        result['cough_conf'] = _finite(cough_conf)
+        if result['cough_conf'] is None:
+            result['cough_error'] = 'The cough detection features of the recording cannot be scored, e.g. it is silent.'
+        else:
+            self.cough_cache.put(rec_id, 'cough_conf', cough_conf)
+        result['timings']['batched_inference'] = time.perf_counter() - start
+
+        self.set_header('Content-Type', 'application/json')
+        self.finish(json.dumps(result, allow_nan=False))
+
+    def write_error(self, status_code, **kwargs):
+        self.set_header('Content-Type', 'application/json')
+        self.finish(json.dumps({'error': self._reason}))
+
+def _finite(value):
+    """Converts a model output to a float for the JSON response, None if it is NaN or infinite."""
+    value = float(value)
+    return value if np.isfinite(value) else None
+
+class _HealthHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.finish({'status': 'ok'})
+
+def make_app(executor, batch_window=DEFAULT_BATCH_WINDOW, max_batch_size=DEFAULT_MAX_BATCH_SIZE):
+    """Builds the tornado application of the service.
+
+    Routes:
+        POST /v1/cough: cough confidence of the WAV body, null with a cough_error if it cannot be scored
+        POST /v1/predict?age=..&respiratory_condition=..&fever_muscle_pain=..: cough confidence
+            and Covid-19 class probabilities of the WAV body
+        GET /healthz: liveness check
+
+    Feature extraction runs per request on the executor. Model calls and VGGish requests of
+    requests arriving within batch_window seconds are batched, see MicroBatcher. Cough
+    confidences are cached by recording ID, so /v1/predict after /v1/cough of the same audio
+    only runs the Covid-19 classifier.
+
+    Args:
+        executor (concurrent.futures.Executor): pool running the CPU-bound feature extraction
+        batch_window (float): seconds a batch waits for more requests
+        max_batch_size (int): maximum number of requests per batch
+
+    Returns:
+        (tornado.web.Application): application
+    """
+    cough_batcher = MicroBatcher(classify_cough_batch, ThreadPoolExecutor(max_workers=1), batch_window,
+                                 max_batch_size, name='cough')
+    covid_batcher = MicroBatcher(classify_covid_batch, ThreadPoolExecutor(max_workers=1), batch_window,
+                                 max_batch_size, name='covid')
+    handler_args = {'executor': executor, 'cough_batcher': cough_batcher, 'covid_batcher': covid_batcher,
+                    'cough_cache': ArtifactCache(max_recordings=COUGH_CACHE_SIZE)}
+    return tornado.web.Application([
+        (r'/v1/cough', _PredictHandler, dict(handler_args, classify=False)),
+        (r'/v1/predict', _PredictHandler, dict(handler_args, classify=True)),
+        (r'/healthz', _HealthHandler),
+    ])
+
+def serve(host='127.0.0.1', port=8502, workers=2, batch_window=DEFAULT_BATCH_WINDOW,
+          max_batch_size=DEFAULT_MAX_BATCH_SIZE):
+    """Runs the inference service until interrupted.
+
+    The models are loaded before the worker processes are forked so that all workers share them.
+
+    Args:
+        host (str): interface to bind to
+        port (int): port to listen on
+        workers (int): number of worker processes extracting features
+        batch_window (float): seconds a batch waits for more requests
+        max_batch_size (int): maximum number of requests per batch
+    """
+    ModelRegistry.preload()
+    executor = ProcessPoolExecutor(max_workers=workers)
+    # Fork the workers now rather than on the first request
+    executor.submit(int).result()
+    app = make_app(executor, batch_window, max_batch_size)
+    server = tornado.httpserver.HTTPServer(app, max_body_size=MAX_BODY_SIZE)
+    server.listen(port, address=host)
+    logging.info('Inference service listening on http://%s:%d with %d workers, batch window %.1f ms, '
+                 'max batch size %d.', host, port, workers, 1000 * batch_window, max_batch_size)
+    try:
+        tornado.ioloop.IOLoop.current().start()
+    finally:
+        executor.shutdown()
@@ -0,0 +1,3 @@
+from .InferenceService import make_app
+from .InferenceService import serve
+from .client import InferenceClient
\ No newline at end of file
@@ -0,0 +1,19 @@
+import logging
+import argparse
+
+from .InferenceService import serve, DEFAULT_BATCH_WINDOW, DEFAULT_MAX_BATCH_SIZE
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='python -m src.InferenceService',
+                                     description='Headless HTTP service running the cough detector and Covid-19 classifier.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8502)
+    parser.add_argument('--workers', type=int, default=2, help='number of worker processes (default: 2)')
+    parser.add_argument('--batch-window-ms', type=float, default=1000 * DEFAULT_BATCH_WINDOW,
+                        help='milliseconds a batch waits for more requests, 0 only batches simultaneous requests (default: %(default)s)')
+    parser.add_argument('--max-batch-size', type=int, default=DEFAULT_MAX_BATCH_SIZE,
+                        help='maximum number of requests per batch, 1 disables batching (default: %(default)s)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    serve(args.host, args.port, args.workers, args.batch_window_ms / 1000, args.max_batch_size)
@@ -0,0 +1,91 @@
+import asyncio
+import logging
+
+from ..Metrics import count
+
+class MicroBatcher:
+    """Gathers items submitted within a short window and processes them as one batch.
+
+    The first item arriving at an idle batcher opens a window of `window` seconds; everything
+    submitted until it closes, or until max_batch_size items are waiting, is handed to
+    process_batch in a single call on the executor. Each caller then receives its own result.
+    Only one batch runs at a time: items submitted meanwhile wait and form the next batch as soon
+    as it finishes, so batches grow with the load instead of queueing up in the executor.
+
+    Example Usage:
+    >>> batcher = MicroBatcher(classify_batch, ThreadPoolExecutor(1), window=0.005, max_batch_size=32)
+    >>> result = await batcher.submit(features)
+
+    Args:
+        process_batch (callable): takes a list of items and returns a list of results in the same order
+        executor (concurrent.futures.Executor): executor running process_batch
+        window (float): seconds to wait for more items after the first one
+        max_batch_size (int): maximum number of items per batch
+        name (str): name used for the batch counters, see Metrics.count
+    """
+    def __init__(self, process_batch, executor, window=0.005, max_batch_size=32, name='batch'):
+        self.process_batch = process_batch
+        self.executor = executor
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.name = name
+        self._pending = []
+        self._timer = None
+        self._running = False
+
+    async def submit(self, item):
+        """Adds an item to the next batch and waits for its result.
+
+        Args:
+            item (any): item passed to process_batch as part of a list
+
+        Returns:
+            the result of the item
+        """
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if self._running:
+            pass  # flushed when the running batch finishes
+        elif len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        if self._running or not self._pending:
+            return
+        batch = self._pending[:self.max_batch_size]
+        self._pending = self._pending[self.max_batch_size:]
+        count(f'{self.name}_batches')
+        count(f'{self.name}_batch_items', len(batch))
+        self._running = True
+        task = asyncio.get_event_loop().run_in_executor(self.executor, self.process_batch, [item for item, _ in batch])
+        task.add_done_callback(lambda task: self._finish(batch, task))
+
+    def _finish(self, batch, task):
+        self._running = False
+        self._resolve(batch, task)
+        # Items that arrived meanwhile have waited at least as long as the batch ran
+        self._flush()
+
+    def _resolve(self, batch, task):
+        futures = [future for _, future in batch]
+        if task.exception() is not None:
+            logging.error('Batch of %d %s items failed: %s', len(batch), self.name, task.exception())
+            results = [task.exception()] * len(batch)
+        else:
+            results = task.result()
+
+        for future, result in zip(futures, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
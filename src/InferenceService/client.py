@@ -0,0 +1,69 @@
+import os
+import requests
+import numpy as np
+from requests.adapters import HTTPAdapter
+
+from .InferenceService import CLASS_NAMES
+
+INFERENCE_SERVICE_URL_ENV = 'INFERENCE_SERVICE_URL'
+
+class InferenceClient:
+    """Calls the inference service over a pooled, keep-alive HTTP session.
+
+    Mirrors CoughDetector and CovidClassifier so that pages can use either interchangeably.
+
+    Example Usage:
+    >>> client = InferenceClient('http://localhost:8502')
+    >>> cough_conf = client.detect_cough(rec.wav_bytes)
+    """
+    def __init__(self, base_url, pool_size=10, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    @classmethod
+    def from_environment(cls):
+        """Creates a client for INFERENCE_SERVICE_URL, or returns None if it is not set."""
+        base_url = os.environ.get(INFERENCE_SERVICE_URL_ENV)
+        return cls(base_url) if base_url else None
+
+    def detect_cough(self, wav_bytes):
+        """Gets the probability that a recording contains a cough.
+
+        Raises a ValueError for recordings that are rejected or cannot be scored, like CoughDetector.classify_cough.
+
+        Args:
+            wav_bytes (bytes): WAV file
+
+        Returns:
+            (float): cough confidence
+        """
+        result = self.__post('/v1/cough', wav_bytes)
+        if result['cough_conf'] is None:
+            raise ValueError(result['cough_error'])
+        return result['cough_conf']
+
+    def classify_cough(self, wav_bytes, clinical_features):
+        """Gets the Covid-19 class probabilities of a recording.
+
+        Args:
+            wav_bytes (bytes): WAV file
+            clinical_features (dict): clinical features, unanswered (None) fields are left out
+
+        Returns:
+            (np.array): (1, 3) class probabilities, as returned by CovidClassifier.classify_cough
+        """
+        params = {field: float(value) for field, value in clinical_features.items() if value is not None}
+        result = self.__post('/v1/predict', wav_bytes, params)
+        return np.array([[result['probabilities'][name] for name in CLASS_NAMES]])
+
+    def __post(self, path, wav_bytes, params=None):
+        response = self.session.post(self.base_url + path, data=wav_bytes, params=params,
+                                     headers={'Content-Type': 'audio/wav'}, timeout=self.timeout)
+        if response.status_code == 400:
+            raise ValueError(response.json().get('error'))
+        response.raise_for_status()
+        return response.json()
@@ -0,0 +1,65 @@
+# Load generator for the inference service, used to compare batch window settings
+#
+# Usage:
+#   python -m src.InferenceService.loadtest http://localhost:8502 cough.wav --concurrency 1 4 16 64
+
+import time
+import argparse
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+from .client import InferenceClient
+
+CLINICAL_FEATURES = {'age': 35, 'respiratory_condition': 0, 'fever_muscle_pain': 1}
+
+def run_load(base_url, wav_bytes, concurrency, n_requests, endpoint='predict'):
+    """Sends n_requests requests from `concurrency` closed-loop clients.
+
+    Args:
+        base_url (str): URL of the inference service
+        wav_bytes (bytes): WAV file sent with every request
+        concurrency (int): number of clients sending requests back to back
+        n_requests (int): total number of requests
+        endpoint (str): 'cough' or 'predict'
+
+    Returns:
+        (dict): throughput in requests per second and latency percentiles in milliseconds
+    """
+    local = threading.local()
+
+    def request(_):
+        if not hasattr(local, 'client'):
+            local.client = InferenceClient(base_url)
+        start = time.perf_counter()
+        if endpoint == 'cough':
+            local.client.detect_cough(wav_bytes)
+        else:
+            local.client.classify_cough(wav_bytes, CLINICAL_FEATURES)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = np.array(list(executor.map(request, range(n_requests))))
+    elapsed = time.perf_counter() - start
+
+    p50, p95, p99 = 1000 * np.percentile(latencies, [50, 95, 99])
+    return {'concurrency': concurrency, 'throughput': n_requests / elapsed, 'p50': p50, 'p95': p95, 'p99': p99}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measures latency and throughput of the inference service.')
+    parser.add_argument('url', help='URL of the inference service')
+    parser.add_argument('wav', help='WAV file sent with every request')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16, 64])
+    parser.add_argument('--requests', type=int, default=200, help='requests per concurrency level')
+    parser.add_argument('--endpoint', choices=['cough', 'predict'], default='predict')
+    args = parser.parse_args()
+
+    with open(args.wav, 'rb') as f:
+        wav_bytes = f.read()
+
+    print(f'{"clients":>8}{"req/s":>10}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}')
+    for concurrency in args.concurrency:
+        result = run_load(args.url, wav_bytes, concurrency, args.requests, args.endpoint)
+        print(f'{result["concurrency"]:>8}{result["throughput"]:>10.1f}{result["p50"]:>10.1f}'
+              f'{result["p95"]:>10.1f}{result["p99"]:>10.1f}')
@@ -0,0 +1,293 @@
+import os
+import time
+import bisect
+import logging
+import tempfile
+import threading
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_ENV = 'PIPELINE_METRICS'
+METRICS_PORT_ENV = 'PIPELINE_METRICS_PORT'
+METRICS_FILE_ENV = 'PIPELINE_METRICS_FILE'
+
+STAGE_METRIC = 'covid_pipeline_stage_seconds'
+EVENT_METRIC = 'covid_pipeline_events_total'
+GAUGE_METRIC = 'covid_pipeline_gauge'
+
+# Upper bounds in seconds, from sub-millisecond feature methods up to slow remote calls
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_enabled = False
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+_gauges = {}
+_exporters_started = False
+
+class _Histogram:
+    __slots__ = ('bucket_counts', 'sum', 'count')
+
+    def __init__(self):
+        self.bucket_counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+class _Timer:
+    __slots__ = ('stage', 'start')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.stage, time.perf_counter() - self.start)
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+def enable(flag=True):
+    """Turns the pipeline timers and counters on or off for this process."""
+    global _enabled
+    _enabled = flag
+
+def enabled():
+    """Tells whether the pipeline timers and counters are on."""
+    return _enabled
+
+def timer(stage):
+    """Times a block of code as one observation of a pipeline stage.
+
+    When metrics are disabled this returns a shared no-op context manager, so an instrumented
+    block only pays for the function call.
+
+    Example Usage:
+    >>> with Metrics.timer('decode'):
+    >>>     rate, audio = wavfile.read(f)
+
+    Args:
+        stage (str): stage name, used as the stage label of the histogram
+
+    Returns:
+        context manager
+    """
+    if not _enabled:
+        return _NULL_TIMER
+    return _Timer(stage)
+
+def timed(stage):
+    """Decorator timing every call of a function as one observation of a pipeline stage.
+
+    Args:
+        stage (str): stage name, used as the stage label of the histogram
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                observe(stage, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+def observe(stage, seconds):
+    """Records the duration of one run of a stage in its histogram.
+
+    Args:
+        stage (str): stage name
+        seconds (float): duration
+    """
+    if not _enabled:
+        return
+    index = bisect.bisect_left(BUCKETS, seconds)
+    with _lock:
+        histogram = _histograms.get(stage)
+        if histogram is None:
+            histogram = _histograms[stage] = _Histogram()
+        histogram.bucket_counts[index] += 1
+        histogram.sum += seconds
+        histogram.count += 1
+
+def count(event, n=1):
+    """Increments the counter of an event, e.g. a processed recording or a cache hit.
+
+    Args:
+        event (str): event name, used as the event label of the counter
+        n (int): increment
+    """
+    if not _enabled:
+        return
+    with _lock:
+        _counters[event] = _counters.get(event, 0) + n
+
+def gauge(name, value):
+    """Sets the current value of a gauge, e.g. the number of live sessions.
+
+    Args:
+        name (str): gauge name, used as the gauge label
+        value (float): current value
+    """
+    if not _enabled:
+        return
+    with _lock:
+        _gauges[name] = value
+
+def reset():
+    """Clears all recorded observations, counters and gauges."""
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+        _gauges.clear()
+
+def collect():
+    """Takes and clears everything recorded so far, e.g. in a worker process to hand it to its parent.
+
+    Returns:
+        (tuple): picklable histograms, counters and gauges, see merge()
+    """
+    with _lock:
+        histograms = {stage: (list(h.bucket_counts), h.sum, h.count) for stage, h in _histograms.items()}
+        collected = (histograms, dict(_counters), dict(_gauges))
+        _histograms.clear()
+        _counters.clear()
+        _gauges.clear()
+    return collected
+
+def merge(collected):
+    """Adds metrics collected in another process, see collect(), to this process's.
+
+    Args:
+        collected (tuple): histograms, counters and gauges as returned by collect()
+    """
+    if not _enabled:
+        return
+    histograms, counters, gauges = collected
+    with _lock:
+        for stage, (bucket_counts, total, n) in histograms.items():
+            histogram = _histograms.get(stage)
+            if histogram is None:
+                histogram = _histograms[stage] = _Histogram()
+            histogram.bucket_counts = [a + b for a, b in zip(histogram.bucket_counts, bucket_counts)]
+            histogram.sum += total
+            histogram.count += n
+        for event, n in counters.items():
+            _counters[event] = _counters.get(event, 0) + n
+        _gauges.update(gauges)
+
+def render_prometheus():
+    """Renders all histograms, counters and gauges in the Prometheus text exposition format.
+
+    Returns:
+        (str): exposition text
+    """
+    with _lock:
+        histograms = {stage: (list(h.bucket_counts), h.sum, h.count) for stage, h in _histograms.items()}
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+
+    lines = [f'# HELP {STAGE_METRIC} Time spent in each stage of the inference pipeline.',
+             f'# TYPE {STAGE_METRIC} histogram']
+    for stage in sorted(histograms):
+        bucket_counts, total, n = histograms[stage]
+        cumulative = 0
+        for bound, bucket_count in zip(BUCKETS + ('+Inf',), bucket_counts):
+            cumulative += bucket_count
+            lines.append(f'{STAGE_METRIC}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+        lines.append(f'{STAGE_METRIC}_sum{{stage="{stage}"}} {total!r}')
+        lines.append(f'{STAGE_METRIC}_count{{stage="{stage}"}} {n}')
+
+    lines += [f'# HELP {EVENT_METRIC} Number of events in the inference pipeline.',
+              f'# TYPE {EVENT_METRIC} counter']
+    for event in sorted(counters):
+        lines.append(f'{EVENT_METRIC}{{event="{event}"}} {counters[event]}')
+
+    lines += [f'# HELP {GAUGE_METRIC} Current values of the app and pipeline state.',
+              f'# TYPE {GAUGE_METRIC} gauge']
+    for name in sorted(gauges):
+        lines.append(f'{GAUGE_METRIC}{{gauge="{name}"}} {gauges[name]!r}')
+    return '\n'.join(lines) + '\n'
+
+def dump(path):
+    """Writes the metrics to a file atomically, e.g. for node_exporter's textfile collector.
+
+    Args:
+        path (str): output file, conventionally ending in .prom
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        f.write(render_prometheus())
+    os.replace(tmp_path, path)
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        payload = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        logging.debug(format, *args)
+
+def serve(port, host='127.0.0.1'):
+    """Serves the metrics at http://host:port/metrics from a daemon thread.
+
+    Args:
+        port (int): port to listen on
+        host (str): interface to bind to
+
+    Returns:
+        (ThreadingHTTPServer): the running server
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def _dump_periodically(path, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            dump(path)
+        except OSError:
+            logging.exception('Could not write pipeline metrics to %s.', path)
+
+def from_environment():
+    """Enables metrics if PIPELINE_METRICS is set and starts the configured exporters.
+
+    PIPELINE_METRICS_PORT serves the metrics over HTTP and PIPELINE_METRICS_FILE dumps them to a
+    file every 15 seconds. Calling it again has no further effect.
+    """
+    global _exporters_started
+    if os.environ.get(METRICS_ENV, '').lower() not in ('1', 'true', 'yes'):
+        return
+    enable()
+    with _lock:
+        if _exporters_started:
+            return
+        _exporters_started = True
+
+    port = os.environ.get(METRICS_PORT_ENV)
+    if port:
+        serve(int(port))
+    path = os.environ.get(METRICS_FILE_ENV)
+    if path:
+        threading.Thread(target=_dump_periodically, args=(path, 15), daemon=True).start()
@@ -0,0 +1,14 @@
+from .Metrics import enable
+from .Metrics import enabled
+from .Metrics import timer
+from .Metrics import timed
+from .Metrics import observe
+from .Metrics import count
+from .Metrics import gauge
+from .Metrics import reset
+from .Metrics import collect
+from .Metrics import merge
+from .Metrics import render_prometheus
+from .Metrics import dump
+from .Metrics import serve
+from .Metrics import from_environment
\ No newline at end of file
@@ -0,0 +1,130 @@
+import gc
+import os
+import time
+import pickle
+import hashlib
+import logging
+import threading
+
+from .tree_ensemble import TreeEnsemble
+
+MODEL_DIR_ENV = 'MODEL_DIR'
+DEFAULT_MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'models')
+CHECKSUM_FILE = 'SHA256SUMS'
+TREE_EVALUATOR_ENV = 'TREE_EVALUATOR'
+
+MODEL_NAMES = ['cough_classifier', 'cough_classification_scaler', 'gbc_ovo_roc_70_5']
+# Models converted on load instead of unpickled as is, unless TREE_EVALUATOR=sklearn
+COMPILED_LOADERS = {'gbc_ovo_roc_70_5': TreeEnsemble.from_pickle}
+
+_models = {}
+_timings = {}
+_checksums = {}
+_lock = threading.Lock()
+_model_locks = {name: threading.Lock() for name in MODEL_NAMES}
+
+def get_model(name):
+    """Gets a model, loading it on first use.
+
+    Each model is unpickled and checksum-verified at most once per process; all callers share
+    the same object.
+
+    Example Usage:
+    >>> model = ModelRegistry.get_model('gbc_ovo_roc_70_5')
+
+    Args:
+        name (str): file name of the model in the models directory
+
+    Returns:
+        the unpickled model
+    """
+    model = _models.get(name)
+    if model is not None:
+        return model
+
+    with _model_lock(name):
+        if name not in _models:
+            _models[name] = _load(name)
+    return _models[name]
+
+def preload(names=None, freeze=True):
+    """Loads models ahead of time, e.g. in a parent process before it forks workers.
+
+    With freeze, the loaded objects are moved out of the garbage collector's generations so that
+    collections in forked workers do not write to (and thereby copy) the pages holding them.
+
+    Args:
+        names (list): models to load, all registered models by default
+        freeze (bool): freeze the garbage collector after loading
+    """
+    for name in names or MODEL_NAMES:
+        get_model(name)
+    if freeze and hasattr(gc, 'freeze'):
+        gc.collect()
+        gc.freeze()
+
+def load_timings():
+    """Gets how long loading each model took.
+
+    Returns:
+        (dict): seconds spent reading, verifying and unpickling each loaded model
+    """
+    return dict(_timings)
+
+def checksum(name):
+    """Gets the SHA-256 digest of a model's file, loading the model on first use.
+
+    Identifies the exact model version, e.g. to tell which model produced a stored prediction.
+
+    Args:
+        name (str): file name of the model in the models directory
+
+    Returns:
+        (str): hex SHA-256 digest of the model file
+    """
+    get_model(name)
+    return _checksums[name]
+
+def _model_lock(name):
+    with _lock:
+        if name not in _model_locks:
+            _model_locks[name] = threading.Lock()
+        return _model_locks[name]
+
+def _model_dir():
+    return os.environ.get(MODEL_DIR_ENV, DEFAULT_MODEL_DIR)
+
+def _expected_checksums():
+    path = os.path.join(_model_dir(), CHECKSUM_FILE)
+    checksums = {}
+    if not os.path.isfile(path):
+        return checksums
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                checksum, filename = line.split()
+                checksums[filename.lstrip('*')] = checksum
+    return checksums
+
+def _loader(name):
+    if os.environ.get(TREE_EVALUATOR_ENV, 'compiled') == 'sklearn':
+        return pickle.loads
+    return COMPILED_LOADERS.get(name, pickle.loads)
+
+def _load(name):
+    start = time.perf_counter()
+    with open(os.path.join(_model_dir(), name), 'rb') as f:
+        data = f.read()
+
+    digest = hashlib.sha256(data).hexdigest()
+    expected = _expected_checksums().get(name)
+    if expected is None:
+        logging.warning('No checksum listed for model %s, loading it unverified.', name)
+    elif digest != expected:
+        raise RuntimeError(f'Checksum mismatch for model {name}, refusing to load it.')
+
+    model = _loader(name)(data)
+    _checksums[name] = digest
+    _timings[name] = time.perf_counter() - start
+    logging.info('Loaded model %s in %.3f s.', name, _timings[name])
+    return model
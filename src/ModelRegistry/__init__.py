@@ -0,0 +1,5 @@
+from .ModelRegistry import get_model
+from .ModelRegistry import preload
+from .ModelRegistry import load_timings
+from .ModelRegistry import checksum
+from .tree_ensemble import TreeEnsemble
\ No newline at end of file
@@ -0,0 +1,164 @@
+import io
+import pickle
+import numpy as np
+
+TREE_LEAF = -1
+
+class _PickledObject:
+    """Stand-in for a scikit-learn class, keeping the constructor arguments and pickled state."""
+    def __init__(self, *args):
+        self.args = args
+        self.state = {}
+
+    def __setstate__(self, state):
+        self.state = state
+
+class _EstimatorUnpickler(pickle.Unpickler):
+    """Unpickles scikit-learn estimators without importing scikit-learn.
+
+    Every scikit-learn class (and numpy's RandomState, which fitted estimators carry along) is
+    replaced by a _PickledObject, so the pickle loads whatever scikit-learn version is installed.
+    Only numpy arrays and dtypes are reconstructed for real; anything else is refused.
+    """
+    _NUMPY_GLOBALS = {
+        ('numpy', 'ndarray'), ('numpy', 'dtype'),
+        ('numpy.core.multiarray', '_reconstruct'), ('numpy._core.multiarray', '_reconstruct'),
+        ('numpy.core.multiarray', 'scalar'), ('numpy._core.multiarray', 'scalar'),
+    }
+
+    def find_class(self, module, name):
+        if module.split('.')[0] == 'sklearn' or module.startswith('numpy.random'):
+            return type(name, (_PickledObject,), {'__module__': module})
+        if (module, name) in self._NUMPY_GLOBALS:
+            return super().find_class(module, name)
+        raise pickle.UnpicklingError(f'Refusing to load {module}.{name} from a model file.')
+
+class TreeEnsemble:
+    """Gradient-boosted tree ensemble flattened into NumPy node arrays.
+
+    All trees of the ensemble share one set of node arrays (feature, threshold, left, right,
+    value), so a batch is scored by advancing every (row, tree) pair one level per step instead of
+    walking the estimators in Python. Leaves point to themselves, which lets every tree take the
+    same number of steps.
+
+    predict_proba reproduces scikit-learn 0.22's multi-class GradientBoostingClassifier exactly: features are
+    compared as float32 like in DecisionTreeRegressor, stage contributions are accumulated in
+    stage order, and the multinomial deviance's softmax uses the same logsumexp.
+
+    Example Usage:
+    >>> with open('models/gbc_ovo_roc_70_5', 'rb') as f:
+    >>>     model = TreeEnsemble.from_pickle(f.read())
+    >>> probabilities = model.predict_proba(features)
+    """
+    def __init__(self, feature, threshold, left, right, value, roots, n_stages, classes, n_features,
+                 init_raw_predictions, max_depth):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.n_stages = n_stages
+        self.classes_ = classes
+        self.n_features_ = n_features
+        self.init_raw_predictions = init_raw_predictions
+        self.max_depth = max_depth
+
+    @classmethod
+    def from_pickle(cls, data):
+        """Builds the ensemble from a pickled scikit-learn GradientBoostingClassifier.
+
+        Args:
+            data (bytes): pickle of a fitted multi-class GradientBoostingClassifier with deviance loss and prior init
+
+        Returns:
+            (TreeEnsemble): flattened ensemble
+        """
+        gbc = _EstimatorUnpickler(io.BytesIO(data)).load()
+        state = gbc.state
+        loss = type(state['loss_']).__name__
+        if loss != 'MultinomialDeviance':
+            raise ValueError(f'Unsupported gradient boosting loss {loss}, expected MultinomialDeviance.')
+        init = state['init_']
+        if init == 'zero' or type(init).__name__ != 'DummyClassifier' or init.state.get('_strategy') != 'prior':
+            raise ValueError('Only gradient boosting models initialised with the class prior are supported.')
+
+        estimators = state['estimators_']
+        n_stages, n_trees_per_stage = estimators.shape
+        trees = [estimator.state['tree_'].state for estimator in estimators.ravel()]
+
+        offsets = np.cumsum([0] + [tree['node_count'] for tree in trees])
+        nodes = np.concatenate([tree['nodes'] for tree in trees])
+        node_offsets = np.repeat(offsets[:-1], [tree['node_count'] for tree in trees])
+        is_leaf = nodes['left_child'] == TREE_LEAF
+        own_index = np.arange(len(nodes))
+
+        feature = np.where(is_leaf, 0, nodes['feature']).astype(np.intp)
+        threshold = np.where(is_leaf, np.inf, nodes['threshold'])
+        left = np.where(is_leaf, own_index, nodes['left_child'] + node_offsets).astype(np.intp)
+        right = np.where(is_leaf, own_index, nodes['right_child'] + node_offsets).astype(np.intp)
+        # Scaled once here, with the same product the staged prediction computes per leaf
+        value = state['learning_rate'] * np.concatenate([tree['values'][:, 0, 0] for tree in trees])
+
+        class_prior = init.state['class_prior_']
+        eps = np.finfo(np.float32).eps
+        init_raw_predictions = np.log(np.clip(class_prior, eps, 1 - eps)).astype(np.float64)
+
+        return cls(feature, threshold, left, right, value, offsets[:-1].astype(np.intp), n_stages,
+                   state['classes_'], state['n_features_'], init_raw_predictions,
+                   max(tree['max_depth'] for tree in trees))
+
+    def decision_function(self, X):
+        """Computes the raw predictions (log-odds per class) of a batch.
+
+        Args:
+            X (np.array): (N, n_features) feature matrix
+
+        Returns:
+            (np.array): (N, n_classes) raw predictions
+        """
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features_:
+            raise ValueError(f'Expected a 2-D array with {self.n_features_} features, got shape {X.shape}.')
+        # Rejected like scikit-learn's input validation, instead of silently following the right branches
+        if not np.isfinite(X).all():
+            raise ValueError("Input contains NaN, infinity or a value too large for dtype('float32').")
+
+        n_rows = X.shape[0]
+        rows = np.arange(n_rows)[:, np.newaxis]
+        node = np.broadcast_to(self.roots, (n_rows, len(self.roots)))
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[node]] <= self.threshold[node]
+            node = np.where(go_left, self.left[node], self.right[node])
+
+        n_classes = len(self.init_raw_predictions)
+        contributions = self.value[node].reshape(n_rows, self.n_stages, n_classes)
+        # cumsum adds stage by stage, in the order the staged prediction accumulates them
+        steps = np.concatenate((np.broadcast_to(self.init_raw_predictions, (n_rows, 1, n_classes)),
+                                contributions), axis=1)
+        return np.cumsum(steps, axis=1)[:, -1, :]
+
+    def predict_proba(self, X):
+        """Computes the class probabilities of a batch.
+
+        Args:
+            X (np.array): (N, n_features) feature matrix
+
+        Returns:
+            (np.array): (N, n_classes) class probabilities
+        """
+        raw_predictions = self.decision_function(X)
+        return np.nan_to_num(np.exp(raw_predictions - _logsumexp(raw_predictions)[:, np.newaxis]))
+
+    def predict(self, X):
+        """Predicts the class of every row of a batch."""
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1))
+
+def _logsumexp(a):
+    """Row-wise logsumexp computed like scipy.special.logsumexp in the pinned scipy version."""
+    a_max = np.amax(a, axis=1, keepdims=True)
+    a_max[~np.isfinite(a_max)] = 0
+    s = np.sum(np.exp(a - a_max), axis=1)
+    with np.errstate(divide='ignore'):
+        out = np.log(s)
+    return out + a_max[:, 0]
@@ -1,23 +1,26 @@
 import io
 import os
-import time
+import copy
 import json
 import uuid
 import requests
 import logging
 import numpy as np
 import streamlit as st
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_agg import RendererAgg
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import streamlit.components.v1 as components
 import librosa
 import librosa.display
 
 # App modules
 import src.Utils as Utils
-from src.CovidClassifier import CovidClassifier
-from src.CoughDetector import CoughDetector
+from src.CovidClassifier import CovidClassifier, AudioAnalysis
+from src.CoughDetector import CoughDetector, CoughStream
+from src.InferenceService import InferenceClient
+from src.FeatureStore import FeatureStore
 from src.CustomComponents import CovidRecordButton
+from src.PhraseStore import PhraseStore
 from src.MockData.KeyPhrases import KEY_PHRASES
 
 # Audio recording + processing
@@ -62,44 +65,129 @@ SYMPTOMS = [
 COUGH_DETECTOR = CoughDetector()
 COVID_CLASSIFIER = CovidClassifier()
 
-# Prevent Matplotlib Bug
-_lock = RendererAgg.lock
+# Remote inference service used instead of the local classifiers if INFERENCE_SERVICE_URL is set
+INFERENCE_CLIENT = InferenceClient.from_environment()
 
+# Phrases linking returning users' PCR results to their coughs, shared by all sessions and processes
+PHRASE_STORE = PhraseStore.from_environment(seed=KEY_PHRASES)
 
-@st.cache(show_spinner=False)
-def detect_cough(recording, sr):
+# Donated coughs are uploaded in the background, see UPLOAD_BACKEND for a local stand-in
+UPLOAD_QUEUE = Utils.UploadQueue.from_environment(COUGH_STORAGE_BUCKET)
+
+# Features of donated recordings are kept for retraining and re-scoring if FEATURE_STORE_DIR is set
+FEATURE_STORE = FeatureStore.from_environment()
+
+# Artifacts derived from recordings (decoded audio, predictions, features), keyed by recording ID
+RECORDING_ARTIFACTS = Utils.ArtifactCache(max_recordings=int(os.environ.get('RECORDING_CACHE_SIZE', 64)))
+
+# Recordings are streamed in chunks of RECORDING_CHUNK_MS for live cough detection, unless it runs remotely
+RECORDING_DURATION_MS = 5000
+RECORDING_CHUNK_MS = 0 if INFERENCE_CLIENT is not None else int(os.environ.get('RECORDING_CHUNK_MS', 1000))
+
+
+def get_recording(recording):
+    """
+    Decodes a recording, reusing the decoded audio on reruns.
+
+    Args:
+      recording (str): JSON string of recording
+    Returns:
+      rec (Recording): decoded recording
+    """
+    wav_bytes, url, stream_id = Utils.read_payload(recording)
+    rec_id = Utils.recording_id(wav_bytes)
+    rec = RECORDING_ARTIFACTS.get_or_compute(rec_id, 'recording', lambda: Utils.Recording(wav_bytes, url, rec_id, stream_id))
+    if (rec.url, rec.stream_id) != (url, stream_id):
+        # Same audio delivered again: share its decoded views, but play back this delivery's blob
+        rec = copy.copy(rec)
+        rec.url, rec.stream_id = url, stream_id
+    return rec
+
+def detect_cough(rec):
     """
     Predicts whether a cough is present in the recording using model stored in app.
 
     Args:
-      recording (np.array): user recording.
-      sr (int): sample rate
+      rec (Recording): user recording.
     Returns:
       pred_conf (float): predicted confidence of cough existence.
     """
-    features = COUGH_DETECTOR.extract_features(recording, sr)
-    pred_conf = COUGH_DETECTOR.classify_cough(features)[0]
-    logging.info('Cough Detection Prediction:', pred_conf)
-    return pred_conf
+    def compute():
+        if INFERENCE_CLIENT is not None:
+            pred_conf = INFERENCE_CLIENT.detect_cough(rec.wav_bytes)
+        else:
+            pred_conf = COUGH_DETECTOR.classify_cough(cough_features(rec))[0]
+        logging.info('Cough Detection Prediction: %s', pred_conf)
+        return pred_conf
+
+    return RECORDING_ARTIFACTS.get_or_compute(rec.recording_id, 'cough_conf', compute)
+
+def cough_features(rec):
+    """Gets the cough detection features of a recording, computing them once per recording."""
+    def compute():
+        stream = RECORDING_ARTIFACTS.get(rec.stream_id, 'cough_stream') if rec.stream_id else None
+        if stream is not None:
+            return stream.finish(rec.audio)
+        return COUGH_DETECTOR.extract_features(rec.audio, rec.rate)
+
+    return RECORDING_ARTIFACTS.get_or_compute(rec.recording_id, 'cough_features', compute)
+
+def follow_stream(chunk):
+    """
+    Feeds a chunk of a recording in progress to its cough stream and shows the progress.
 
-@st.cache(show_spinner=False)
-def predict_covid(recording, sr, clinical_features):
+    Args:
+      chunk (tuple): stream ID, sequence number, sample rate, samples and last flag, see Utils.parse_chunk
+    """
+    stream_id, seq, rate, audio, last = chunk
+    stream = RECORDING_ARTIFACTS.get_or_compute(stream_id, 'cough_stream', lambda: CoughStream(COUGH_DETECTOR, rate))
+    stream.push(seq, audio, last)
+
+    duration = RECORDING_DURATION_MS / 1000
+    recorded = min(stream.n_samples / rate, duration)
+    st.warning(f'Recording... {recorded:.1f}/{duration:.1f}s')
+    st.progress(recorded / duration)
+    coughs = len(stream.segments)
+    if stream.provisional is not None and stream.provisional[1] >= 0.50:
+        st.info(f'We can hear {coughs} coughs.' if coughs > 1 else 'We can hear a cough.')
+
+def audio_analysis(rec):
+    """Gets the spectral analysis of a recording shared by the Covid-19 classifier and the mel-spectrogram view."""
+    return RECORDING_ARTIFACTS.get_or_compute(rec.recording_id, 'audio_analysis', lambda: AudioAnalysis(rec.audio, rec.rate))
+
+def covid_features(rec, clinical_features):
+    """Gets the Covid-19 classifier inputs of a recording, computing them once per recording and answers."""
+    def compute():
+        prepared = COVID_CLASSIFIER.prepare(rec.audio, rec.rate, clinical_features, audio_analysis(rec))
+        return COVID_CLASSIFIER.complete_features([prepared])[0]
+
+    artifact = ('covid_features',) + tuple(sorted(clinical_features.items()))
+    return RECORDING_ARTIFACTS.get_or_compute(rec.recording_id, artifact, compute)
+
+def predict_covid(rec, clinical_features):
     """Predicts if the cough is healthy, symptomatic (could be any class), or Covid-19.
 
     Args:
-        recording (np.array): cough recording
-        sr (int): cough's sample rate
+        rec (Recording): cough recording
+        clinical_features (dict): clinical features
     """
-    pred_conf = COVID_CLASSIFIER.classify_cough(recording, sr, clinical_features)
-    logging.info('Covid Predictions:', pred_conf.tolist())
-    return np.argmax(pred_conf)
-
-def review_recording(recording_url, cough_conf, rate, audio):
+    def compute():
+        if INFERENCE_CLIENT is not None:
+            pred_conf = INFERENCE_CLIENT.classify_cough(rec.wav_bytes, clinical_features)
+        else:
+            pred_conf = COVID_CLASSIFIER.classify_features(covid_features(rec, clinical_features)[np.newaxis])
+        logging.info('Covid Predictions: %s', pred_conf.tolist())
+        return np.argmax(pred_conf)
+
+    artifact = ('covid_prediction',) + tuple(sorted(clinical_features.items()))
+    return RECORDING_ARTIFACTS.get_or_compute(rec.recording_id, artifact, compute)
+
+def review_recording(rec, cough_conf):
     """
     Loads the recorded cough sound and allows user to review.
 
     Args:
-      recording_url (str): url to audio blob file
+      rec (Recording): recording
       cough_conf (float): cough detection model confidence
     """
 
@@ -114,8 +202,8 @@ def review_recording(recording_url, cough_conf, rate, audio):
         st.success('Cough sucessfully recorded.')
 
     # Display audio
-    inject_audio_spectogram(rate, audio)
-    inject_audio_player(recording_url)
+    inject_audio_spectogram(rec)
+    inject_audio_player(rec.url)
 
 
 def hide_menu():
@@ -142,37 +230,30 @@ def inject_audio_player(blob_url):
     st.markdown(audio_display, unsafe_allow_html=True)
 
 
-def inject_audio_spectogram(rate, audio):
+def inject_audio_spectogram(rec):
     """
-    Adds audio spectogram.
+    Adds audio spectogram, rendered once per recording.
 
     Args:
-      rate (int): frequency of the audio.
-      audio (): audio recording.
+      rec (Recording): recording
     """
-    x_values = np.arange(len(audio)) / rate
+    image = RECORDING_ARTIFACTS.get_or_compute(rec.recording_id, 'waveform_png',
+                                               lambda: Utils.waveform_png([rec.audio], rec.rate))
+    st.image(image, use_column_width=True)
 
-    with _lock:
-        fig = plt.figure(figsize=(10, 3))
-        ax = fig.add_subplot(1, 1, 1)
-        ax.plot(x_values, audio)
-        ax.set_xlabel("Time (s) ")
-        ax.set_ylabel("Amplitude")
-        st.pyplot(fig)
 
-
-def check_for_new_recording(recording, session_state):
+def check_for_new_recording(rec, session_state):
     """
     Checks if a new recoding was made.
 
     Args:
-      recording (str): JSON string of recording
+      rec (Recording): recording
       session_state (SessionState): session state
     """
-    if session_state.recording_hash != hash(recording):
+    if session_state.recording_hash != rec.recording_id:
         # session_state.cough_donated = False
         session_state.cough_uuid = str(uuid.uuid4())
-        session_state.recording_hash = hash(recording)
+        session_state.recording_hash = rec.recording_id
 
 
 def pcr_test_phrase(session_state):
@@ -195,97 +276,116 @@ def pcr_test_phrase(session_state):
         phrase_set_button = st.button('Set Phrase')
 
         if phrase_set_button:
-            if phrase.strip() in KEY_PHRASES:
-                st.error("""
-                The phrase you typed is already in use. Can you select a different phrase?
-                """)
+            try:
+                added = PHRASE_STORE.add(phrase, session_state.cough_uuid)
+            except Exception:
+                logging.exception('Could not store phrase.')
+                st.error('An error occured setting your phrase. Please try again.')
             else:
-                with st.spinner('Setting your phrase ...'):
-                    try:
-                        KEY_PHRASES.append(phrase.strip())
-                        time.sleep(2) # TODO replace with actual upload
-                        st.success(
-                        f"""
-                        Successfully set your phrase. When you return, please
-                        select the returning user option in the dropdown on
-                        top of the page, then enter the phrase {phrase} when asked.
-                        """)
-                    except:
-                        st.error('An error occured setting your phrase. Please try again.')
-
-def inject_segmented_spectrogram(x, fs):
+                if not added:
+                    st.error("""
+                    The phrase you typed is already in use. Can you select a different phrase?
+                    """)
+                else:
+                    st.success(
+                    f"""
+                    Successfully set your phrase. When you return, please
+                    select the returning user option in the dropdown on
+                    top of the page, then enter the phrase {phrase} when asked.
+                    """)
+
+def inject_segmented_spectrogram(rec, x, fs):
     """Inserts a cough-segmented spectrogram.
 
     Args:
+        rec (Recording): recording the audio was derived from
         signal (np.array): audio as a 1-D numpy array
         fs (int): sample rate
     """
-    max_signal = np.max(np.abs(x))
-    normalized_audio = Utils.normalize_audio(x, fs, shouldTrim=False)
-    cough_segments, cough_mask = Utils.segment_cough(normalized_audio, fs)
+    def segment():
+        normalized_audio = Utils.normalize_audio(x, fs, shouldTrim=False)
+        return normalized_audio, Utils.segment_cough(normalized_audio, fs)
+
+    def render():
+        max_signal = np.max(np.abs(x))
+        return Utils.waveform_png([x, cough_mask * max_signal], fs)
+
+    normalized_audio, (cough_segments, cough_mask) = RECORDING_ARTIFACTS.get_or_compute(
+        rec.recording_id, ('segmentation', fs), segment)
     
     if np.max(cough_mask) == 0:
         st.error('We did not detect strong coughs to segment.')
 
-    cough_mask = cough_mask * max_signal
-    x_values = np.arange(len(normalized_audio)) / fs
-
-    with _lock:
-        seg_fig = plt.figure(figsize=(10, 3))
-        ax = seg_fig.add_subplot(1, 1, 1)
-        ax.plot(x_values, x)
-        ax.plot(x_values, cough_mask)
-        ax.set_xlabel("Time (s) ")
-        ax.set_ylabel("Amplitude")
-        st.pyplot(seg_fig)
+    image = RECORDING_ARTIFACTS.get_or_compute(rec.recording_id, ('segmentation_png', fs), render)
+    st.image(image, use_column_width=True)
 
-def detail_recording(x, fs):
+def detail_recording(rec):
     """
     Loads the recorded cough sound and allows user to review.
 
     Args:
-    recording_url (str): url to audio blob file
-    cough_conf (float): cough detection model confidence
+    rec (Recording): recording
     """
+    x, fs = rec.resampled(Utils.LIBROSA_SAMPLE_RATE)
     st.write('In order to create features for our model, we look at the cough segments recognized in your audio, as \
               displayed below.')
     # Display audio
-    inject_segmented_spectrogram(x, fs)
+    inject_segmented_spectrogram(rec, x, fs)
     st.write('An important step we take before analyzing your audio is applying a Fourier transformation which \
               in simple terms displays the frequencies that are present in your cough in a logarithmic scale.\
               Displayed below is what your audio looks like after this transformation.')
-    inject_mel_spectrogram(x, fs)
+    inject_mel_spectrogram(rec)
 
-def inject_mel_spectrogram(x, fs):
-    """Displays a mel-spectrogram.
+def inject_mel_spectrogram(rec):
+    """Displays the mel-spectrogram the Covid-19 classifier's onset features are computed from.
 
     Args:
-        x (np.array): audio input as 1-D numpy array
-        fs (int): sample rate
+        rec (Recording): recording
     """
-    S = librosa.feature.melspectrogram(y=x, sr=fs)
-
-    with _lock:
-        mel_fig, ax = plt.subplots()
-        S_dB = librosa.power_to_db(S, ref=np.max)
+    def render():
+        analysis = audio_analysis(rec)
+        mel_fig = Figure()
+        FigureCanvasAgg(mel_fig)
+        ax = mel_fig.add_subplot(1, 1, 1)
+        S_dB = librosa.power_to_db(analysis.mel_power, ref=np.max)
         img = librosa.display.specshow(S_dB, x_axis='time',
-                                    y_axis='mel', sr=fs)
+                                    y_axis='mel', sr=analysis.fs, ax=ax)
         mel_fig.colorbar(img, ax=ax, format='%+2.0f dB')
         ax.set(title='Mel-frequency spectrogram')
-        st.pyplot(mel_fig)
+        buffer = io.BytesIO()
+        mel_fig.savefig(buffer, format='png', dpi=200, bbox_inches='tight')
+        return buffer.getvalue()
+
+    image = RECORDING_ARTIFACTS.get_or_compute(rec.recording_id, 'mel_spectrogram_png', render)
+    st.image(image, use_column_width=True)
 
-def prediction_explanation(session_state, x, fs):
+def prediction_explanation(session_state, rec):
     st.subheader('Learn more about your prediction')
     st.write('We make our predictions using a model that combines both the cough recording \
               and the extra information you have provided. Click below to learn how our model is deriving your \
               risk factor.')
     learn_more = st.button('Learn more')
     if learn_more:
-        detail_recording(x, fs)
+        detail_recording(rec)
 
     # TODO John, extra personalized prediction info here.
 
-def consent(session_state, recording, cough_conf):
+def store_features(session_state, rec, extra_information):
+    """Adds the features of a donated recording to the feature store, if one is configured.
+
+    Features computed for the prediction are reused; with a remote inference service they are
+    computed here.
+    """
+    if FEATURE_STORE is None:
+        return
+    try:
+        features = cough_features(rec)
+        FEATURE_STORE.append(session_state.cough_uuid, features if np.ndim(features) == 2 else None,
+                             covid_features(rec, extra_information), rec.rate)
+    except Exception:
+        logging.exception('Could not store the features of cough %s.', session_state.cough_uuid)
+
+def consent(session_state, rec, cough_conf, extra_information):
     # Consent
     st.subheader('Contribute to Research')
     st.info("""
@@ -297,14 +397,14 @@ def consent(session_state, recording, cough_conf):
     consent_cough = st.checkbox('I agree to anonymously donate my cough and extra information provided for research purposes.')
     if consent_cough and not session_state.cough_donated:
         if cough_conf > 0.5:
-            with st.spinner('Uploading information ...'):
-                Utils.upload_blob(COUGH_STORAGE_BUCKET, recording, f'user_cough_data/{session_state.cough_uuid}.wav')
-        st.success('Successfully uploaded!')
+            UPLOAD_QUEUE.submit(f'user_cough_data/{session_state.cough_uuid}.wav', rec.wav_bytes)
+            store_features(session_state, rec, extra_information)
+        st.success('Thank you for contributing!')
         session_state.cough_donated = True
         session_state.symptoms_donated = True
     # TODO: Implement revoking consent
 
-def risk_evaluation(session_state, recording, audio, sr, extra_information):
+def risk_evaluation(session_state, rec, extra_information):
     # Get Covid-19 Risk Evaluation
     st.subheader('Covid-19 Risk Evaluation')
     st.write(
@@ -314,7 +414,7 @@ def risk_evaluation(session_state, recording, audio, sr, extra_information):
     if request_prediction:
       with st.spinner('Requesting risk evaluation ...'):
           try:
-              covid_pred = predict_covid(audio, sr, extra_information)
+              covid_pred = predict_covid(rec, extra_information)
               if covid_pred == 2:
                   st.error('Based off your cough sample and background information we do believe you are at risk for having Covid.')
               elif covid_pred == 1:
@@ -340,17 +440,22 @@ def app(session_state):
     st.write('Please minimize any background noise.')
 
     # Custom Streamlit component using javascript to query client-side microphone devices
-    recording = CovidRecordButton(duration=5000)
+    recording = CovidRecordButton(duration=RECORDING_DURATION_MS, chunk_ms=RECORDING_CHUNK_MS)
+
+    # Recording still in progress
+    chunk = Utils.parse_chunk(recording)
+    if chunk is not None:
+        follow_stream(chunk)
+        return
 
     if recording and recording is not None:
         # Get recording and display audio bar
-        rec = json.loads(recording)
-        x, fs = librosa.load(io.BytesIO(bytes(rec['data'])))
-        logging.info('Audio recorded:', x[:10])
-        rate, audio = wavfile.read(io.BytesIO(bytes(rec['data'])))
+        rec = get_recording(recording)
+        rate, audio = rec.rate, rec.audio
+        logging.info('Audio recorded: %d samples at %d Hz', len(audio), rate)
         
         try:
-            cough_conf = detect_cough(audio, rate)
+            cough_conf = detect_cough(rec)
             logging.info('Successfully recorded cough.')
 
         except ValueError:
@@ -358,10 +463,10 @@ def app(session_state):
             logging.error('Error recording cough.')
             st.error('An error occured recording your cough. Please try again using a different input device.')
             
-        review_recording(rec['url'], cough_conf, rate, audio)
+        review_recording(rec, cough_conf)
 
         # Check if new recording was submitted and adjust session state.
-        check_for_new_recording(recording, session_state)
+        check_for_new_recording(rec, session_state)
 
         # Share extra information
         st.subheader('Share Extra Information')
@@ -382,8 +487,8 @@ def app(session_state):
         }
 
         # Get risk evaluation
-        risk_evaluation(session_state, recording, audio, rate, extra_information)
+        risk_evaluation(session_state, rec, extra_information)
         if session_state.successful_prediction:
-            prediction_explanation(session_state, x, fs)
-            consent(session_state, recording, cough_conf)
+            prediction_explanation(session_state, rec)
+            consent(session_state, rec, cough_conf, extra_information)
             pcr_test_phrase(session_state)
@@ -1,6 +1,13 @@
-import time
+import logging
 import streamlit as st
-from src.MockData.KeyPhrases import KEY_PHRASES
+from src.PhraseStore import PhraseStore, PcrResultStore
+
+# Same database as the new user page, see PHRASE_STORE_PATH
+PHRASE_STORE = PhraseStore.from_environment()
+# Results are committed in the background, in batches
+PCR_RESULTS = PcrResultStore.from_environment()
+# Seconds to wait for the commit of a submitted result, which usually takes well below a second
+SUBMIT_TIMEOUT = 5
 
 def app(session_state):
   st.subheader('Upload Your PCR Result')
@@ -11,19 +18,18 @@ def app(session_state):
 
   phrase = st.text_input('Type your phrase', key='returningUserPhrase')
   test_date = st.date_input("Enter the date of the PCR Test")
-  st.selectbox('What was your PCR test result?', ['Negative', 'Positive'])
+  test_result = st.selectbox('What was your PCR test result?', ['Negative', 'Positive'])
   upload_button = st.button('Upload PCR Test Result')
   if upload_button:
-    if phrase.strip() not in KEY_PHRASES:
+    if phrase not in PHRASE_STORE:
         st.error("""
         We couldn't find a cough sample linked to the provided phrase. Are you
         sure you typed your phrase correctly?
         """)
     else:
-      with st.spinner('Uploading the PCR test results ...'):
-        try:
-          time.sleep(2) # TODO replace with actual upload
-          st.success('Successfully uploaded the PCR result!')
-        except:
-          st.error('An error occured while uploading the PCR result. Please try again.')
-          print(e)
+      try:
+        PCR_RESULTS.submit(phrase, test_date, test_result).result(timeout=SUBMIT_TIMEOUT)
+        st.success('Successfully uploaded the PCR result!')
+      except Exception:
+        logging.exception('Could not submit PCR result.')
+        st.error('An error occured while uploading the PCR result. Please try again.')
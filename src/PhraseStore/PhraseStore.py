@@ -0,0 +1,104 @@
+import os
+import time
+import sqlite3
+import threading
+
+PHRASE_STORE_PATH_ENV = 'PHRASE_STORE_PATH'
+DEFAULT_PATH = 'phrases.db'
+BUSY_TIMEOUT_MS = 5000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS phrases (
+    phrase TEXT PRIMARY KEY,
+    cough_uuid TEXT,
+    created_at REAL NOT NULL
+) WITHOUT ROWID
+"""
+
+def normalize(phrase):
+    """Normalizes a phrase the way users are expected to retype it."""
+    return phrase.strip()
+
+class PhraseStore:
+    """Persistent set of the phrases returning users identify themselves with, in a SQLite database.
+
+    Phrases are the table's primary key, so lookups are a single index probe whose depth barely
+    grows with millions of phrases, and add() is an atomic insert-if-absent. The database runs in
+    WAL mode: readers never block, and writers in other threads or processes wait for each other
+    for up to BUSY_TIMEOUT_MS. Every thread uses its own connection.
+
+    Example Usage:
+    >>> phrases = PhraseStore('phrases.db')
+    >>> if not phrases.add('i am a rabbit', cough_uuid):
+    >>>     st.error('The phrase you typed is already in use.')
+
+    Args:
+        path (str): database file, created if missing
+    """
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute(SCHEMA)
+
+    @classmethod
+    def from_environment(cls, seed=()):
+        """Opens the store at PHRASE_STORE_PATH (default phrases.db) and adds the seed phrases."""
+        store = cls(os.environ.get(PHRASE_STORE_PATH_ENV, DEFAULT_PATH))
+        store.add_many(seed)
+        return store
+
+    def add(self, phrase, cough_uuid=None):
+        """Adds a phrase unless it is already taken.
+
+        Args:
+            phrase (str): phrase chosen by the user
+            cough_uuid (str): UUID of the cough the phrase refers to
+
+        Returns:
+            (bool): True if the phrase was added, False if it was already in use
+        """
+        with self._connection() as connection:
+            cursor = connection.execute('INSERT OR IGNORE INTO phrases (phrase, cough_uuid, created_at) VALUES (?, ?, ?)',
+                                        (normalize(phrase), cough_uuid, time.time()))
+        return cursor.rowcount == 1
+
+    def add_many(self, phrases):
+        """Adds phrases without cough UUIDs in one transaction, skipping those already taken."""
+        now = time.time()
+        with self._connection() as connection:
+            connection.executemany('INSERT OR IGNORE INTO phrases (phrase, cough_uuid, created_at) VALUES (?, ?, ?)',
+                                   ((normalize(phrase), None, now) for phrase in phrases))
+
+    def cough_uuid(self, phrase):
+        """Gets the UUID of the cough a phrase refers to.
+
+        Args:
+            phrase (str): phrase
+
+        Returns:
+            (str): cough UUID, None if the phrase is unknown or was added without one
+        """
+        row = self._connection().execute('SELECT cough_uuid FROM phrases WHERE phrase = ?',
+                                         (normalize(phrase),)).fetchone()
+        return row[0] if row is not None else None
+
+    def __contains__(self, phrase):
+        row = self._connection().execute('SELECT 1 FROM phrases WHERE phrase = ?', (normalize(phrase),)).fetchone()
+        return row is not None
+
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM phrases').fetchone()[0]
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = connect(self.path)
+        return connection
+
+def connect(path):
+    """Opens a connection to a WAL-mode database, waiting up to BUSY_TIMEOUT_MS for other writers."""
+    connection = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    return connection
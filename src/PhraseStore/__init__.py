@@ -0,0 +1,3 @@
+from .PhraseStore import PhraseStore
+from .PhraseStore import normalize
+from .pcr_results import PcrResultStore
\ No newline at end of file
@@ -0,0 +1,204 @@
+import os
+import time
+import queue
+import atexit
+import logging
+import threading
+import numpy as np
+from contextlib import closing
+from concurrent import futures
+
+from .PhraseStore import SCHEMA as PHRASES_SCHEMA, PHRASE_STORE_PATH_ENV, DEFAULT_PATH, connect, normalize
+from ..Metrics import count, observe
+
+RESULTS = {'Negative': 0, 'Positive': 1}
+
+_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS pcr_results (
+        phrase TEXT NOT NULL,
+        cough_uuid TEXT,
+        test_date TEXT NOT NULL,
+        result INTEGER NOT NULL,
+        submitted_at REAL NOT NULL,
+        PRIMARY KEY (phrase, test_date)
+    ) WITHOUT ROWID
+    """,
+    'CREATE INDEX IF NOT EXISTS pcr_results_cough_uuid ON pcr_results (cough_uuid)',
+]
+# The cough UUID is looked up from the phrase, it stays NULL for phrases added without one
+_INSERT = """
+INSERT OR REPLACE INTO pcr_results (phrase, cough_uuid, test_date, result, submitted_at)
+VALUES (?, (SELECT cough_uuid FROM phrases WHERE phrase = ?), ?, ?, ?)
+"""
+
+class PcrResultStore:
+    """PCR test results of returning users, stored next to their phrases and linked to their coughs.
+
+    submit() only queues a result; a background writer commits everything queued within
+    commit_interval seconds (up to batch_size results) in one transaction, so a burst of returning
+    users costs a few commits instead of one blocking write each. A batch that fails to commit is
+    retried up to max_retries times with backoff, then committed result by result, so only the
+    results that cannot be stored fail. Resubmitting a result for the same phrase and test date
+    replaces it. Results are linked to the cough stored with the phrase, never to the submitting
+    session's, which may belong to another user of the same browser.
+
+    Example Usage:
+    >>> results = PcrResultStore('phrases.db')
+    >>> results.submit(phrase, test_date, 'Positive').result(timeout=5)
+    >>> cough_uuids, cough_features, covid_features, labels = results.labelled_features(feature_store)
+
+    Args:
+        path (str): database file, usually the phrase store's
+        batch_size (int): maximum number of results per transaction
+        commit_interval (float): seconds the writer waits for more results before committing
+        max_retries (int): retries of a batch that failed to commit
+        retry_backoff (float): seconds before the first retry, doubled for every further one
+    """
+    def __init__(self, path=DEFAULT_PATH, batch_size=256, commit_interval=0.05, max_retries=3, retry_backoff=0.1):
+        self.path = path
+        self.batch_size = batch_size
+        self.commit_interval = commit_interval
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        with closing(connect(path)) as connection, connection:
+            connection.execute(PHRASES_SCHEMA)
+            for statement in _SCHEMA:
+                connection.execute(statement)
+        self._queue = queue.Queue()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='pcr-result-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    @classmethod
+    def from_environment(cls):
+        """Opens the store in the phrase store's database, see PHRASE_STORE_PATH."""
+        return cls(os.environ.get(PHRASE_STORE_PATH_ENV, DEFAULT_PATH))
+
+    def submit(self, phrase, test_date, result):
+        """Queues a PCR result for the next group commit.
+
+        Args:
+            phrase (str): phrase of the returning user
+            test_date (datetime.date): date of the PCR test
+            result (str): 'Negative' or 'Positive'
+
+        Returns:
+            (concurrent.futures.Future): resolved once the result is committed
+        """
+        future = futures.Future()
+        phrase = normalize(phrase)
+        self._queue.put(((phrase, phrase, test_date.isoformat(), RESULTS[result], time.time()), future))
+        count('pcr_results_queued')
+        return future
+
+    def flush(self, timeout=None):
+        """Waits until every queued result is committed.
+
+        Returns:
+            (bool): False if results were still pending after timeout seconds
+        """
+        marker = futures.Future()
+        self._queue.put((None, marker))
+        try:
+            marker.result(timeout)
+            return True
+        except futures.TimeoutError:
+            return False
+
+    def close(self, timeout=5.0):
+        """Commits the queued results and stops the writer."""
+        if self._stopped.is_set():
+            return
+        self.flush(timeout)
+        self._stopped.set()
+        self._thread.join(timeout)
+
+    def labelled_features(self, feature_store):
+        """Joins the stored features of donated coughs with their PCR results, for retraining.
+
+        A cough with several results is labelled with the one of its latest test date.
+
+        Args:
+            feature_store (FeatureStore): feature store of the donated coughs
+
+        Returns:
+            (tuple): cough UUIDs (list), (N, N_COUGH_FEATURES) cough detector features,
+                (N, len(FEATURE_NAMES)) Covid-19 classifier inputs and (N,) PCR results (1 positive)
+        """
+        cough_uuids, cough_features, covid_features = feature_store.load()
+        labels = self.results(cough_uuids)
+        labelled = np.array([cough_uuid in labels for cough_uuid in cough_uuids], dtype=bool)
+        labelled_uuids = [cough_uuid for cough_uuid, keep in zip(cough_uuids, labelled) if keep]
+        return (labelled_uuids, cough_features[labelled], covid_features[labelled],
+                np.array([labels[cough_uuid] for cough_uuid in labelled_uuids], dtype=int))
+
+    def results(self, cough_uuids=None):
+        """Gets the latest PCR result of coughs.
+
+        Args:
+            cough_uuids (list): coughs to look up through the cough UUID index, all linked coughs by default
+
+        Returns:
+            (dict): cough UUID -> PCR result (1 positive), for coughs with a result
+        """
+        query = 'SELECT cough_uuid, result FROM pcr_results WHERE cough_uuid IS NOT NULL'
+        with closing(connect(self.path)) as connection:
+            if cough_uuids is None:
+                rows = connection.execute(f'{query} ORDER BY test_date, submitted_at')
+                return dict(rows.fetchall())
+            connection.execute('CREATE TEMP TABLE lookup (cough_uuid TEXT PRIMARY KEY)')
+            connection.executemany('INSERT OR IGNORE INTO lookup VALUES (?)', ((u,) for u in cough_uuids))
+            rows = connection.execute(f'{query} AND cough_uuid IN (SELECT cough_uuid FROM lookup) '
+                                      'ORDER BY test_date, submitted_at')
+            return dict(rows.fetchall())
+
+    def _run(self):
+        connection = connect(self.path)
+        while not self._stopped.is_set() or not self._queue.empty():
+            try:
+                batch = [self._queue.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+            deadline = time.monotonic() + self.commit_interval
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=max(0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            self._commit(connection, batch)
+        connection.close()
+
+    def _commit(self, connection, batch):
+        rows = [row for row, _ in batch if row is not None]
+        start = time.perf_counter()
+        for attempt in range(self.max_retries + 1):
+            try:
+                with connection:
+                    connection.executemany(_INSERT, rows)
+                break
+            except Exception as e:
+                logging.warning('Could not store %d PCR results (attempt %d): %s', len(rows), attempt + 1, e)
+                if attempt < self.max_retries:
+                    time.sleep(self.retry_backoff * 2 ** attempt)
+        else:
+            # Commit one by one, so only the results that cannot be stored fail
+            for row, future in batch:
+                if row is None:
+                    future.set_result(None)
+                    continue
+                try:
+                    with connection:
+                        connection.execute(_INSERT, row)
+                    count('pcr_results_committed')
+                    future.set_result(None)
+                except Exception as e:
+                    logging.error('Could not store PCR result: %s', e)
+                    count('pcr_results_failed')
+                    future.set_exception(e)
+            return
+        observe('pcr_results_commit', time.perf_counter() - start)
+        count('pcr_results_committed', len(rows))
+        for _, future in batch:
+            future.set_result(None)
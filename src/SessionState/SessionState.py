@@ -1,5 +1,17 @@
+import os
+import sys
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
 from streamlit.report_thread import get_report_ctx
-import streamlit as st
+
+from ..Metrics import count, gauge
+
+SESSION_TTL_ENV = 'SESSION_TTL'
+SESSION_MEMORY_CAP_ENV = 'SESSION_MEMORY_CAP_MB'
+DEFAULT_TTL = 3600
+DEFAULT_MEMORY_CAP_MB = 256
 
 
 class SessionState(object):
@@ -24,9 +36,123 @@ class SessionState(object):
             setattr(self, key, val)
 
 
-@st.cache(allow_output_mutation=True)
-def get_session(id, **kwargs):
-    return SessionState(**kwargs)
+def estimate_size(value, depth=3):
+    """Estimates the memory held by a value, following containers and attributes a few levels deep.
+
+    NumPy arrays count their buffer. Objects shared with other sessions are counted for each of
+    them, so the estimate errs on the high side.
+
+    Parameters
+    ----------
+    value : any
+        Value to measure.
+    depth : int
+        Number of levels of nested containers and object attributes to follow.
+
+    """
+    if isinstance(value, np.ndarray):
+        return sys.getsizeof(value) if value.base is None else sys.getsizeof(value) + value.nbytes
+    size = sys.getsizeof(value)
+    if depth == 0 or isinstance(value, (str, bytes, bytearray)):
+        return size
+    if isinstance(value, dict):
+        return size + sum(estimate_size(k, depth - 1) + estimate_size(v, depth - 1) for k, v in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return size + sum(estimate_size(item, depth - 1) for item in value)
+    if hasattr(value, '__dict__'):
+        return size + estimate_size(vars(value), depth - 1)
+    return size
+
+
+class SessionStore(object):
+    """Session states of the current process with expiry and a memory cap.
+
+    Sessions not used for ttl seconds are dropped, and when the estimated size of all sessions
+    exceeds memory_cap bytes the least recently used ones are evicted. A session's size is
+    measured when it is accessed, i.e. at the start of each of its reruns, which also accounts
+    for whatever the previous rerun attached to it. The session being accessed is never evicted.
+
+    Parameters
+    ----------
+    ttl : float
+        Seconds after which an unused session expires.
+    memory_cap : int
+        Bytes all sessions may hold together.
+
+    Example
+    -------
+    >>> store = SessionStore(ttl=3600, memory_cap=256 * 1024 * 1024)
+    >>> session_state = store.get(ctx.session_id, user_name='')
+
+    """
+    def __init__(self, ttl=DEFAULT_TTL, memory_cap=DEFAULT_MEMORY_CAP_MB * 1024 * 1024):
+        self.ttl = ttl
+        self.memory_cap = memory_cap
+        self._sessions = OrderedDict()  # id -> [state, last access, size], least recently used first
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_environment(cls):
+        """Creates a store configured by SESSION_TTL (seconds) and SESSION_MEMORY_CAP_MB."""
+        return cls(float(os.environ.get(SESSION_TTL_ENV, DEFAULT_TTL)),
+                   int(float(os.environ.get(SESSION_MEMORY_CAP_ENV, DEFAULT_MEMORY_CAP_MB)) * 1024 * 1024))
+
+    def get(self, id, **kwargs):
+        """Gets the state of a session, creating it with the given defaults if needed.
+
+        Parameters
+        ----------
+        id : str
+            Session ID.
+        **kwargs : any
+            Default values of a new session state.
+
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._sessions.get(id)
+            if entry is None:
+                entry = self._sessions[id] = [SessionState(**kwargs), now, 0]
+                count('sessions_created')
+            else:
+                self._sessions.move_to_end(id)
+                entry[1] = now
+
+            size = estimate_size(entry[0])
+            self._bytes += size - entry[2]
+            entry[2] = size
+            self._evict(keep=id)
+            gauge('sessions_live', len(self._sessions))
+            gauge('session_bytes', self._bytes)
+            return entry[0]
+
+    def stats(self):
+        """Gets the number of live sessions and the bytes they hold, as last measured."""
+        with self._lock:
+            return {'sessions': len(self._sessions), 'bytes': self._bytes}
+
+    def _expire(self, now):
+        while self._sessions:
+            id, (_, last_access, size) = next(iter(self._sessions.items()))
+            if now - last_access < self.ttl:
+                break
+            del self._sessions[id]
+            self._bytes -= size
+            count('sessions_expired')
+
+    def _evict(self, keep):
+        for id in list(self._sessions):
+            if self._bytes <= self.memory_cap:
+                break
+            if id == keep:
+                continue
+            self._bytes -= self._sessions.pop(id)[2]
+            count('sessions_evicted')
+
+
+_store = SessionStore.from_environment()
 
 
 def get(**kwargs):
@@ -58,4 +184,4 @@ def get(**kwargs):
     """
     ctx = get_report_ctx()
     id = ctx.session_id
-    return get_session(id, **kwargs)
\ No newline at end of file
+    return _store.get(id, **kwargs)
\ No newline at end of file
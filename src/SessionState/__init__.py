@@ -1,2 +1,4 @@
 from .SessionState import SessionState
-from .SessionState import get
\ No newline at end of file
+from .SessionState import get
+from .SessionState import SessionStore
+from .SessionState import estimate_size
\ No newline at end of file
@@ -0,0 +1,96 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_RECORDINGS = 64
+
+def recording_id(data):
+    """Computes a content hash identifying a recording.
+
+    Hash the WAV bytes rather than the component's JSON value, which also holds a blob URL that
+    differs every time the same audio is delivered.
+
+    Args:
+        data (str or bytes): WAV bytes of the recording
+
+    Returns:
+        (str): hex BLAKE2 digest of the data
+    """
+    if isinstance(data, str):
+        data = data.encode()
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+class ArtifactCache:
+    """Bounded LRU of artifacts derived from recordings, keyed by recording ID.
+
+    Every recording holds a dictionary of named artifacts (decoded audio, predictions, feature
+    vectors, ...). Whole recordings are evicted least recently used first, so memory stays capped
+    no matter how many sessions submit recordings.
+
+    Example Usage:
+    >>> cache = ArtifactCache(max_recordings=64)
+    >>> cough_conf = cache.get_or_compute(rec_id, 'cough_conf', lambda: detect(audio))
+    """
+    def __init__(self, max_recordings=DEFAULT_MAX_RECORDINGS):
+        self.max_recordings = max_recordings
+        self._recordings = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, rec_id, name, default=None):
+        """Looks up an artifact of a recording.
+
+        Args:
+            rec_id (str): recording ID
+            name (hashable): artifact name
+            default (any): value returned if the artifact is not cached
+
+        Returns:
+            the cached artifact or default
+        """
+        with self._lock:
+            artifacts = self._recordings.get(rec_id)
+            if artifacts is None:
+                return default
+            self._recordings.move_to_end(rec_id)
+            return artifacts.get(name, default)
+
+    def put(self, rec_id, name, value):
+        """Stores an artifact of a recording, evicting the least recently used recordings if needed.
+
+        Args:
+            rec_id (str): recording ID
+            name (hashable): artifact name
+            value (any): artifact
+        """
+        with self._lock:
+            artifacts = self._recordings.get(rec_id)
+            if artifacts is None:
+                artifacts = self._recordings[rec_id] = {}
+            self._recordings.move_to_end(rec_id)
+            artifacts[name] = value
+            while len(self._recordings) > self.max_recordings:
+                self._recordings.popitem(last=False)
+
+    def get_or_compute(self, rec_id, name, compute):
+        """Gets an artifact of a recording, computing and storing it if it is not cached.
+
+        Exceptions raised by compute propagate and nothing is stored.
+
+        Args:
+            rec_id (str): recording ID
+            name (hashable): artifact name
+            compute (callable): function without arguments computing the artifact
+
+        Returns:
+            the artifact
+        """
+        missing = object()
+        value = self.get(rec_id, name, missing)
+        if value is missing:
+            value = compute()
+            self.put(rec_id, name, value)
+        return value
+
+    def __len__(self):
+        with self._lock:
+            return len(self._recordings)
@@ -0,0 +1,63 @@
+import io
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+# Same size and resolution as the figures previously shown with st.pyplot
+FIGURE_SIZE = (10, 3)
+DPI = 200
+
+def minmax_envelope(x, n_bins):
+    """Reduces a signal to the minimum and maximum of each of n_bins equally long bins.
+
+    Drawn as a line, the 2 * n_bins points cover exactly the pixels the full signal would at a
+    width of n_bins pixels, so plotting cost no longer depends on the recording length.
+
+    Args:
+        x (np.array): 1-D signal
+        n_bins (int): number of bins, usually the plot width in pixels
+
+    Returns:
+        (tuple): sample positions and values of the envelope, the signal itself if it is short enough
+    """
+    x = np.asarray(x)
+    if len(x) <= 2 * n_bins:
+        return np.arange(len(x)), x
+    starts = np.linspace(0, len(x), n_bins + 1).astype(int)
+    centers = (starts[:-1] + starts[1:] - 1) / 2
+    values = np.empty(2 * n_bins, dtype=x.dtype)
+    values[0::2] = np.minimum.reduceat(x, starts[:-1])
+    values[1::2] = np.maximum.reduceat(x, starts[:-1])
+    return np.repeat(centers, 2), values
+
+def waveform_png(signals, fs, figsize=FIGURE_SIZE, dpi=DPI):
+    """Renders signals over time as a PNG image.
+
+    The figure is not registered with pyplot and is freed with its last reference, so rendering
+    needs neither pyplot's global state nor RendererAgg.lock and can run in any session's thread.
+
+    Example Usage:
+    >>> st.image(Utils.waveform_png([audio], rate), use_column_width=True)
+
+    Args:
+        signals (list): 1-D signals of the same sample rate, drawn in order
+        fs (int): sample rate
+        figsize (tuple): figure size in inches
+        dpi (int): resolution in pixels per inch
+
+    Returns:
+        (bytes): PNG image
+    """
+    fig = Figure(figsize=figsize, dpi=dpi)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(1, 1, 1)
+    n_bins = int(figsize[0] * dpi)
+    for signal in signals:
+        positions, values = minmax_envelope(signal, n_bins)
+        ax.plot(positions / fs, values)
+    ax.set_xlabel("Time (s) ")
+    ax.set_ylabel("Amplitude")
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', bbox_inches='tight')
+    return buffer.getvalue()
@@ -0,0 +1,123 @@
+import io
+import json
+import base64
+import librosa
+import numpy as np
+from scipy.io import wavfile
+from . import Resample
+from ..Metrics import timer
+
+LIBROSA_SAMPLE_RATE = 22050
+
+# Chunks of a streamed recording are JSON objects starting with their stream ID
+CHUNK_PREFIX = '{"stream":'
+
+class Recording:
+    """A WAV recording decoded once into its canonical sample array.
+
+    Other views of the audio (float samples, other sample rates) are derived from the decoded
+    samples on first use and memoized.
+
+    Example Usage:
+    >>> rec = parse_recording(CovidRecordButton(duration=5000))
+    >>> rec.rate, rec.audio
+    >>> x, fs = rec.resampled(22050)
+    """
+    def __init__(self, wav_bytes, url=None, recording_id=None, stream_id=None):
+        self.wav_bytes = wav_bytes
+        self.url = url
+        self.recording_id = recording_id
+        self.stream_id = stream_id
+        with timer('decode'):
+            self.rate, self.audio = wavfile.read(io.BytesIO(wav_bytes))
+        self._float_audio = None
+        self._resampled = {}
+
+    @property
+    def float_audio(self):
+        """(np.array) mono float32 samples scaled to [-1, 1], as returned by librosa.load"""
+        if self._float_audio is None:
+            self._float_audio = to_float(self.audio)
+        return self._float_audio
+
+    def resampled(self, sr=LIBROSA_SAMPLE_RATE):
+        """Gets the float audio at another sample rate.
+
+        Args:
+            sr (int): target sample rate
+
+        Returns:
+            (tuple): audio as a 1-D numpy array and its sample rate
+        """
+        if sr == self.rate:
+            return self.float_audio, sr
+        if sr not in self._resampled:
+            self._resampled[sr] = Resample.resample(self.float_audio, self.rate, sr, quality='best').astype(np.float32)
+        return self._resampled[sr], sr
+
+def read_payload(recording):
+    """Extracts the WAV file and its metadata from the JSON value delivered by CovidRecordButton.
+
+    Accepts the base64 payload ({"wav": ..., "url": ...}, with "stream" if it was streamed) as well
+    as the older list of byte values ({"data": [...], "url": ...}).
+
+    Args:
+        recording (str): JSON string of the recording
+
+    Returns:
+        (tuple): WAV bytes, blob URL and stream ID (None unless streamed)
+    """
+    rec = json.loads(recording)
+    if 'wav' in rec:
+        wav_bytes = base64.b64decode(rec['wav'])
+    else:
+        wav_bytes = bytes(rec['data'])
+    return wav_bytes, rec.get('url'), rec.get('stream')
+
+def parse_recording(recording, recording_id=None):
+    """Decodes the JSON value delivered by CovidRecordButton, see read_payload.
+
+    Args:
+        recording (str): JSON string of the recording
+        recording_id (str): ID of the recording, see ArtifactCache.recording_id
+
+    Returns:
+        (Recording): decoded recording
+    """
+    wav_bytes, url, stream_id = read_payload(recording)
+    return Recording(wav_bytes, url, recording_id, stream_id)
+
+def parse_chunk(value):
+    """Decodes a chunk CovidRecordButton sends while streaming a recording.
+
+    Every chunk ({"stream": ..., "seq": ..., "chunk": ...}) holds a complete base64 WAV file of the
+    audio recorded since the previous chunk. The final chunk, sent right before the recording, is
+    marked with "last": true.
+
+    Args:
+        value (str): value returned by CovidRecordButton
+
+    Returns:
+        (tuple): stream ID, sequence number, sample rate, 1-D samples and whether it is the final chunk,
+            None if value is no chunk
+    """
+    if not isinstance(value, str) or not value.startswith(CHUNK_PREFIX):
+        return None
+    chunk = json.loads(value)
+    rate, audio = wavfile.read(io.BytesIO(base64.b64decode(chunk['chunk'])))
+    if audio.ndim > 1:
+        audio = audio.mean(axis=1)
+    return chunk['stream'], chunk['seq'], rate, audio, chunk.get('last', False)
+
+def to_float(audio):
+    """Converts WAV samples to mono float32 in [-1, 1] the way soundfile does."""
+    if audio.dtype == np.uint8:
+        audio = (audio.astype(np.float32) - 128) / 128
+    elif np.issubdtype(audio.dtype, np.integer):
+        audio = audio.astype(np.float32) / -float(np.iinfo(audio.dtype).min)
+    else:
+        audio = audio.astype(np.float32)
+
+    if audio.ndim > 1:
+        audio = librosa.to_mono(audio.T)
+    return audio
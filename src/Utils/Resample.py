@@ -0,0 +1,92 @@
+from math import gcd
+from functools import lru_cache
+
+import numpy as np
+from scipy import signal
+from scipy.signal import butter, filtfilt, firwin, resample_poly
+
+# Polyphase filter settings per quality tier: (zero crossings of the sinc on each side, Kaiser beta,
+# cutoff relative to the lower Nyquist frequency). They follow resampy's kaiser_best and kaiser_fast
+# filters, which librosa used before.
+QUALITY_TIERS = {
+    'best': (64, 14.769656459379492, 0.9475937167399596),
+    'fast': (16, 8.555504641634386, 0.85)
+}
+
+def resample(x, src_rate, dst_rate, quality='best'):
+    """Resamples a signal with a polyphase filter that is designed once per rate pair.
+
+    Example Usage:
+    >>> resampled_audio = Resample.resample(audio, 44100, 16000)
+
+    Args:
+        x (np.array): audio as a 1-D floating-point numpy array
+        src_rate (int): sample rate of the signal
+        dst_rate (int): target sample rate
+        quality (str): one of QUALITY_TIERS, trading accuracy for speed
+
+    Returns:
+        (np.array): resampled audio, ceil(len(x) * dst_rate / src_rate) samples long
+    """
+    if not np.issubdtype(np.asarray(x).dtype, np.floating):
+        raise ValueError('Audio data must be floating-point.')
+    if src_rate == dst_rate:
+        return x
+    up, down, h = polyphase_filter(src_rate, dst_rate, quality)
+    return resample_poly(x, up, down, window=h)
+
+@lru_cache(maxsize=32)
+def polyphase_filter(src_rate, dst_rate, quality='best'):
+    """Designs the anti-aliasing FIR filter for a rate conversion.
+
+    Args:
+        src_rate (int): sample rate of the signal
+        dst_rate (int): target sample rate
+        quality (str): one of QUALITY_TIERS
+
+    Returns:
+        (tuple): upsampling factor, downsampling factor and filter coefficients
+    """
+    if quality not in QUALITY_TIERS:
+        raise ValueError(f'Unknown resampling quality {quality}, expected one of {list(QUALITY_TIERS)}.')
+    zero_crossings, beta, rolloff = QUALITY_TIERS[quality]
+
+    divisor = gcd(int(src_rate), int(dst_rate))
+    up = int(dst_rate) // divisor
+    down = int(src_rate) // divisor
+    max_rate = max(up, down)
+    half_len = zero_crossings * max_rate
+    h = firwin(2 * half_len + 1, rolloff / max_rate, window=('kaiser', beta))
+    h.setflags(write=False)
+    return up, down, h
+
+def decimate(x, fs, fs_target, quality='legacy'):
+    """Lowpass filters and downsamples a signal by the integer factor int(fs / fs_target).
+
+    The 'legacy' tier reproduces the cough detector's original preprocessing exactly: a 4th order
+    Butterworth lowpass at fs_target / 2 followed by scipy.signal.decimate, which filters a second
+    time. The other tiers apply a single polyphase anti-aliasing filter.
+
+    Args:
+        x (np.array): audio as a 1-D numpy array
+        fs (int): sample rate of the signal
+        fs_target (int): sample rate the cutoff is derived from
+        quality (str): 'legacy' or one of QUALITY_TIERS
+
+    Returns:
+        (np.array): filtered and downsampled signal
+    """
+    q = int(fs / fs_target)
+    if quality == 'legacy':
+        b, a = _legacy_lowpass(fs, fs_target)
+        x = filtfilt(b, a, x)
+        return signal.decimate(x, q)
+
+    if q <= 1:
+        return x
+    up, down, h = polyphase_filter(q, 1, quality)
+    return resample_poly(x, up, down, window=h)
+
+@lru_cache(maxsize=32)
+def _legacy_lowpass(fs, fs_target):
+    return butter(4, fs_target/fs, btype='lowpass')
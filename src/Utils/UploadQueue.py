@@ -0,0 +1,324 @@
+import os
+import time
+import queue
+import random
+import atexit
+import logging
+import tempfile
+import threading
+from urllib.parse import quote, unquote
+
+from ..Metrics import count
+
+UPLOAD_BACKEND_ENV = 'UPLOAD_BACKEND'
+UPLOAD_DIR_ENV = 'UPLOAD_DIR'
+UPLOAD_SPILL_DIR_ENV = 'UPLOAD_SPILL_DIR'
+DEFAULT_SPILL_DIR = os.path.join(tempfile.gettempdir(), 'upload_spill')
+# Spilled objects a process is retrying are moved to its own claim directory, see _claim_spilled
+CLAIM_PREFIX = '.claimed-'
+
+class GcsBackend:
+    """Uploads objects to a GCP Storage bucket through one client and bucket handle, created on first use."""
+    def __init__(self, bucket_name, client=None):
+        self.bucket_name = bucket_name
+        self._client = client
+        self._bucket = None
+
+    @property
+    def bucket(self):
+        if self._bucket is None:
+            if self._client is None:
+                from google.cloud import storage
+                self._client = storage.Client()
+            self._bucket = self._client.bucket(self.bucket_name)
+        return self._bucket
+
+    def upload(self, name, data):
+        self.bucket.blob(name).upload_from_string(data)
+
+class LocalBackend:
+    """Stores objects as files below a local directory, a stand-in for GCP Storage."""
+    def __init__(self, root):
+        self.root = root
+
+    def upload(self, name, data):
+        path = os.path.join(self.root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _write_atomic(path, data)
+
+class UploadQueue:
+    """Uploads objects on a background thread so that callers return immediately.
+
+    Submitted objects are uploaded in batches of up to batch_size through one backend, which
+    keeps its client and connection between uploads. Failed uploads are retried with exponential
+    backoff; objects which still fail, or which do not fit into the bounded queue, are spilled to
+    spill_dir and uploaded again once the queue is idle, also after a restart. Several processes
+    can share a spill directory: each claims a spilled object by renaming it into its own
+    subdirectory before retrying it, and objects claimed by a process that died are released again.
+
+    Example Usage:
+    >>> uploads = UploadQueue(GcsBackend('cs329s-covid-user-coughs'))
+    >>> uploads.submit('user_cough_data/user_cough.wav', wav_bytes)
+
+    Args:
+        backend (GcsBackend or LocalBackend): storage backend, any object with upload(name, data)
+        max_queue (int): maximum number of objects waiting in memory
+        batch_size (int): maximum number of objects uploaded per batch
+        max_retries (int): retries of a failed upload before it is spilled
+        backoff (float): seconds before the first retry, doubled for every further one
+        max_backoff (float): maximum seconds between retries
+        spill_dir (str): directory for objects which could not be uploaded, None drops them
+        spill_retry_interval (float): seconds the queue has to be idle before spilled objects are retried
+    """
+    def __init__(self, backend, max_queue=256, batch_size=16, max_retries=4, backoff=0.5, max_backoff=30.0,
+                 spill_dir=DEFAULT_SPILL_DIR, spill_retry_interval=60.0):
+        self.backend = backend
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.spill_dir = spill_dir
+        self.spill_retry_interval = spill_retry_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='upload-queue', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    @classmethod
+    def from_environment(cls, bucket_name):
+        """Creates a queue uploading to bucket_name, configured by environment variables.
+
+        UPLOAD_BACKEND selects 'gcs' (default) or 'local', which writes below UPLOAD_DIR
+        (default ./uploads/<bucket_name>). UPLOAD_SPILL_DIR overrides the spill directory.
+        """
+        if os.environ.get(UPLOAD_BACKEND_ENV, 'gcs') == 'local':
+            backend = LocalBackend(os.environ.get(UPLOAD_DIR_ENV, os.path.join('uploads', bucket_name)))
+        else:
+            backend = GcsBackend(bucket_name)
+        return cls(backend, spill_dir=os.environ.get(UPLOAD_SPILL_DIR_ENV, DEFAULT_SPILL_DIR))
+
+    def submit(self, name, data):
+        """Queues an object for upload without waiting for it.
+
+        Args:
+            name (str): destination path of the object, e.g. the blob name
+            data (bytes): content of the object
+
+        Returns:
+            (bool): False if the object could neither be queued nor spilled
+        """
+        if self._stopped.is_set():
+            return self._spill(name, data)
+        try:
+            self._queue.put_nowait((name, data, None))
+            count('uploads_queued')
+            return True
+        except queue.Full:
+            logging.warning('Upload queue is full, spilling %s.', name)
+            return self._spill(name, data)
+
+    def flush(self, timeout=None):
+        """Waits until every queued object has been uploaded or spilled.
+
+        Args:
+            timeout (float): maximum seconds to wait, None waits indefinitely
+
+        Returns:
+            (bool): False if objects were still pending after the timeout
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self, timeout=5.0):
+        """Stops the background thread, spilling objects which were not uploaded within timeout seconds."""
+        if self._stopped.is_set():
+            return
+        self.flush(timeout)
+        self._stopped.set()
+        self._thread.join(timeout)
+
+    @property
+    def claim_dir(self):
+        """(str) subdirectory of spill_dir holding the spilled objects this process is retrying"""
+        return os.path.join(self.spill_dir, f'{CLAIM_PREFIX}{os.getpid()}')
+
+    def _run(self):
+        self._release_claims(orphaned_only=False)
+        self._requeue_spilled()
+        while not self._stopped.is_set():
+            # The thread must outlive any error, or submitted objects would pile up unnoticed
+            try:
+                self._run_once()
+            except Exception:
+                logging.exception('Unexpected error in the upload queue.')
+
+        # Whatever is still queued at shutdown is kept on disk for the next start
+        while True:
+            try:
+                name, data, spill_path = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if spill_path is None:
+                self._spill(name, data)
+            else:
+                self._release(spill_path)
+            self._queue.task_done()
+        if self.spill_dir is not None:
+            _remove_empty_dir(self.claim_dir)
+
+    def _run_once(self):
+        try:
+            batch = [self._queue.get(timeout=self.spill_retry_interval)]
+        except queue.Empty:
+            self._release_claims(orphaned_only=True)
+            self._requeue_spilled()
+            return
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+        try:
+            self._upload(batch)
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+
+    def _upload(self, batch):
+        pending = batch
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                delay = min(self.max_backoff, self.backoff * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+                if self._stopped.wait(delay):
+                    break
+            failed = []
+            for item in pending:
+                name, data, spill_path = item
+                try:
+                    self.backend.upload(name, data)
+                except Exception as e:
+                    logging.warning('Upload of %s failed (attempt %d): %s', name, attempt + 1, e)
+                    failed.append(item)
+                    continue
+                logging.info('File uploaded to %s.', name)
+                count('uploads')
+                if spill_path is not None:
+                    try:
+                        os.remove(spill_path)
+                    except OSError as e:
+                        logging.warning('Could not remove uploaded spill file %s: %s', spill_path, e)
+            pending = failed
+            if not pending:
+                return
+
+        count('upload_failures', len(pending))
+        for name, data, spill_path in pending:
+            if spill_path is None:
+                self._spill(name, data)
+            else:
+                self._release(spill_path)
+
+    def _spill(self, name, data):
+        if self.spill_dir is None:
+            logging.error('Dropping upload of %s, no spill directory is configured.', name)
+            count('uploads_dropped')
+            return False
+        try:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            _write_atomic(os.path.join(self.spill_dir, quote(name, safe='')), data)
+        except OSError as e:
+            logging.error('Dropping upload of %s, could not spill it: %s', name, e)
+            count('uploads_dropped')
+            return False
+        count('uploads_spilled')
+        return True
+
+    def _requeue_spilled(self):
+        if self.spill_dir is None or not os.path.isdir(self.spill_dir):
+            return
+        for entry in sorted(os.scandir(self.spill_dir), key=lambda entry: entry.name):
+            if self._queue.full():
+                return
+            if not entry.is_file() or entry.name.startswith('.'):
+                continue
+            claimed_path = self._claim_spilled(entry)
+            if claimed_path is None:
+                continue
+            try:
+                with open(claimed_path, 'rb') as f:
+                    data = f.read()
+            except OSError as e:
+                logging.warning('Could not read spill file %s: %s', claimed_path, e)
+                continue
+            try:
+                self._queue.put_nowait((unquote(entry.name), data, claimed_path))
+            except queue.Full:
+                self._release(claimed_path)
+                return
+
+    def _claim_spilled(self, entry):
+        """Moves a spilled object into this process's claim directory, None if another process was faster."""
+        claimed_path = os.path.join(self.claim_dir, entry.name)
+        try:
+            os.makedirs(self.claim_dir, exist_ok=True)
+            os.rename(entry.path, claimed_path)
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logging.warning('Could not claim spill file %s: %s', entry.path, e)
+            return None
+        return claimed_path
+
+    def _release(self, claimed_path):
+        """Moves a claimed object back to the spill directory for a later retry."""
+        try:
+            os.replace(claimed_path, os.path.join(self.spill_dir, os.path.basename(claimed_path)))
+        except OSError as e:
+            logging.warning('Could not release spill file %s: %s', claimed_path, e)
+
+    def _release_claims(self, orphaned_only):
+        """Releases objects claimed by processes which no longer run, and at startup by a previous run of this PID."""
+        if self.spill_dir is None or not os.path.isdir(self.spill_dir):
+            return
+        for entry in os.scandir(self.spill_dir):
+            if not entry.is_dir() or not entry.name.startswith(CLAIM_PREFIX):
+                continue
+            try:
+                pid = int(entry.name[len(CLAIM_PREFIX):])
+            except ValueError:
+                continue
+            if pid == os.getpid() and orphaned_only or pid != os.getpid() and _is_running(pid):
+                continue
+            for claimed in os.scandir(entry.path):
+                self._release(claimed.path)
+            if pid != os.getpid():
+                _remove_empty_dir(entry.path)
+
+def _remove_empty_dir(path):
+    try:
+        os.rmdir(path)
+    except OSError:
+        pass
+
+def _is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _write_atomic(path, data):
+    tmp_path = os.path.join(os.path.dirname(path), f'.{os.path.basename(path)}.{os.getpid()}.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(data if isinstance(data, bytes) else data.encode())
+    os.replace(tmp_path, path)
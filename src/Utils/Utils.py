@@ -3,9 +3,10 @@ import librosa
 import sounddevice as sd
 import googleapiclient.discovery
 from google.api_core.client_options import ClientOptions
-from google.cloud import storage
 import numpy as np
 
+from .UploadQueue import GcsBackend
+
 def segment_cough(x, fs, cough_padding=0.2, min_cough_len=0.1, th_l_multiplier=0.1, th_h_multiplier=0.5):
     """Preprocess the data by segmenting each file into individual coughs using a hysteresis comparator on the signal power
 
@@ -21,46 +22,204 @@ def segment_cough(x, fs, cough_padding=0.2, min_cough_len=0.1, th_l_multiplier=0
     *coughSegments (np.array of np.arrays): a list of cough signal arrays corresponding to each cough
     cough_mask (np.array): an array of booleans that are True at the indices where a cough is in progress"""
 
-    cough_mask = np.array([False] * len(x))
-
-    # Define hysteresis thresholds
     rms = np.sqrt(np.mean(np.square(x)))
-    seg_th_l = th_l_multiplier * rms
-    seg_th_h = th_h_multiplier * rms
-
-    # Segment coughs
-    coughSegments = []
-    padding = round(fs * cough_padding)
-    min_cough_samples = round(fs * min_cough_len)
-    cough_start = 0
-    cough_end = 0
-    cough_in_progress = False
-    tolerance = round(0.01 * fs)
-    below_th_counter = 0
-
-    for i, sample in enumerate(x ** 2):
-        if cough_in_progress:
-            if sample < seg_th_l:
-                below_th_counter += 1
-                if below_th_counter > tolerance:
-                    cough_end = i + padding if (i + padding < len(x)) else len(x) - 1
-                    cough_in_progress = False
-                    if (cough_end + 1 - cough_start - 2 * padding > min_cough_samples):
-                        coughSegments.append(x[cough_start:cough_end + 1])
-                        cough_mask[cough_start:cough_end + 1] = True
-            elif i == (len(x) - 1):
-                cough_end = i
-                cough_in_progress = False
-                if (cough_end + 1 - cough_start - 2 * padding > min_cough_samples):
-                    coughSegments.append(x[cough_start:cough_end + 1])
-            else:
-                below_th_counter = 0
+    segmenter = CoughSegmenter(fs, rms, cough_padding=cough_padding, min_cough_len=min_cough_len,
+                               th_l_multiplier=th_l_multiplier, th_h_multiplier=th_h_multiplier)
+    segmenter.push(x)
+    segmenter.finish()
+
+    return segmenter.segments, segmenter.cough_mask()
+
+def _hysteresis_scan(power, offset, seg_th_l, seg_th_h, tolerance, state):
+    """Runs the hysteresis comparator over a block of signal power without a per-sample loop.
+
+    Threshold crossings and the lengths of below-threshold runs are found with array operations, so the
+    Python-level work is proportional to the number of coughs rather than the number of samples.
+
+    Args:
+        power (np.array): squared samples of the block as float64
+        offset (int): index of the first sample of the block within the whole signal
+        seg_th_l (float): lower threshold of the comparator
+        seg_th_h (float): higher threshold of the comparator
+        tolerance (int): number of samples the power may stay below the lower threshold before a cough ends
+        state (tuple): (cough_in_progress, below_th_counter, cough_trigger) carried over from the previous block
+
+    Returns:
+        coughs (list): (trigger_index, end_index) pairs of the coughs that ended within the block
+        state (tuple): comparator state after the last sample of the block
+    """
+    cough_in_progress, below_th_counter, cough_trigger = state
+    n = len(power)
+    below = power < seg_th_l
+    above = np.flatnonzero(power > seg_th_h)
+
+    # run[i]: number of consecutive below-threshold samples ending at i
+    idx = np.arange(n)
+    run = idx - np.maximum.accumulate(np.where(below, -1, idx))
+
+    # First sample of every below-threshold run that outlasts the tolerance
+    run_hits = np.flatnonzero(run == tolerance + 1)
+
+    coughs = []
+    pos = 0
+    while pos < n:
+        if not cough_in_progress:
+            k = np.searchsorted(above, pos)
+            if k == len(above):
+                break
+            cough_trigger = offset + above[k]
+            cough_in_progress = True
+            pos = above[k] + 1
+            continue
+
+        # Either the run starting at pos pushes the carried-over counter past the tolerance,
+        # or a later run (after the counter was reset) does
+        cough_end = n
+        first = pos + max(0, tolerance - below_th_counter)
+        if first < n and run[first] > first - pos:
+            cough_end = first
+        k = np.searchsorted(run_hits, pos + tolerance, side='right')
+        if k < len(run_hits) and run_hits[k] < cough_end:
+            cough_end = run_hits[k]
+
+        if cough_end == n:
+            below_th_counter = below_th_counter + n - pos if run[n - 1] >= n - pos else run[n - 1]
+            break
+
+        coughs.append((cough_trigger, offset + cough_end))
+        below_th_counter = tolerance + 1
+        cough_in_progress = False
+        pos = cough_end + 1
+
+    return coughs, (cough_in_progress, below_th_counter, cough_trigger)
+
+class CoughSegmenter:
+    """Streaming variant of segment_cough which accepts the signal chunk by chunk.
+
+    Since the hysteresis thresholds are relative to the RMS energy of the signal, the RMS has to be
+    known in advance (e.g. from a calibration or a previous recording). Feeding the whole signal with
+    its own RMS gives exactly the same segments as segment_cough.
+
+    Example Usage:
+    >>> segmenter = CoughSegmenter(fs, rms)
+    >>> for chunk in chunks:
+    ...     new_segments = segmenter.push(chunk)
+    >>> new_segments = segmenter.finish()
+    """
+    def __init__(self, fs, rms, cough_padding=0.2, min_cough_len=0.1, th_l_multiplier=0.1, th_h_multiplier=0.5):
+        self.seg_th_l = th_l_multiplier * rms
+        self.seg_th_h = th_h_multiplier * rms
+        self.padding = round(fs * cough_padding)
+        self.min_cough_samples = round(fs * min_cough_len)
+        self.tolerance = round(0.01 * fs)
+
+        self.segments = []
+        self.bounds = []  # (cough_start, cough_end, masked) of each accepted cough
+        self.n_samples = 0
+
+        self._state = (False, 0, 0)
+        self._pending = []  # (cough_start, cough_end, masked) waiting for padding samples
+        self._buffer = None
+        self._buffer_start = 0
+        self._last_below = False
+        self._finished = False
+
+    def push(self, chunk):
+        """Feeds the next chunk of the signal.
+
+        Args:
+            chunk (np.array): next samples of the cough signal
+
+        Returns:
+            (list): cough signal arrays which were completed by this chunk
+        """
+        if self._finished:
+            raise RuntimeError('Cannot push audio to a finished CoughSegmenter.')
+
+        chunk = np.asarray(chunk)
+        if len(chunk) == 0:
+            return []
+
+        offset = self.n_samples
+        self.n_samples += len(chunk)
+        if self._buffer is None or len(self._buffer) == 0:
+            self._buffer, self._buffer_start = chunk, offset
         else:
-            if sample > seg_th_h:
-                cough_start = i - padding if (i - padding >= 0) else 0
-                cough_in_progress = True
+            self._buffer = np.concatenate((self._buffer, chunk))
+
+        power = np.asarray(chunk ** 2, dtype=np.float64)
+        coughs, self._state = _hysteresis_scan(power, offset, self.seg_th_l, self.seg_th_h, self.tolerance, self._state)
+        self._last_below = power[-1] < self.seg_th_l
+
+        for cough_trigger, cough_end in coughs:
+            cough_start = cough_trigger - self.padding if (cough_trigger - self.padding >= 0) else 0
+            self._pending.append((cough_start, cough_end + self.padding, True))
+
+        completed = self._emit(final=False)
+        self._trim_buffer()
+        return completed
 
-    return coughSegments, cough_mask
+    def finish(self):
+        """Marks the end of the signal and flushes coughs still waiting for padding samples.
+
+        Returns:
+            (list): cough signal arrays which were completed by the end of the signal
+        """
+        if self._finished:
+            return []
+        self._finished = True
+
+        # A cough still in progress on a non-silent last sample ends there, but is not added to the mask
+        cough_in_progress, _, cough_trigger = self._state
+        last = self.n_samples - 1
+        if cough_in_progress and cough_trigger < last and not self._last_below:
+            cough_start = cough_trigger - self.padding if (cough_trigger - self.padding >= 0) else 0
+            self._pending.append((cough_start, last, False))
+
+        return self._emit(final=True)
+
+    def cough_mask(self):
+        """Gets the cough mask of the samples pushed so far.
+
+        Returns:
+            (np.array): an array of booleans that are True at the indices where a cough is in progress
+        """
+        cough_mask = np.zeros(self.n_samples, dtype=bool)
+        for cough_start, cough_end, masked in self.bounds:
+            if masked:
+                cough_mask[cough_start:cough_end + 1] = True
+        return cough_mask
+
+    def _emit(self, final):
+        completed = []
+        waiting = []
+        last = self.n_samples - 1
+        for cough_start, cough_end, masked in self._pending:
+            if cough_end > last:
+                if not final:
+                    waiting.append((cough_start, cough_end, masked))
+                    continue
+                cough_end = last
+            if (cough_end + 1 - cough_start - 2 * self.padding > self.min_cough_samples):
+                segment = self._buffer[cough_start - self._buffer_start:cough_end + 1 - self._buffer_start]
+                self.segments.append(segment)
+                self.bounds.append((cough_start, cough_end, masked))
+                completed.append(segment)
+        self._pending = waiting
+        return completed
+
+    def _trim_buffer(self):
+        # Keep only the samples a pending or future cough can still start at
+        keep_from = self.n_samples - self.padding
+        cough_in_progress, _, cough_trigger = self._state
+        if cough_in_progress:
+            keep_from = min(keep_from, cough_trigger - self.padding)
+        for cough_start, _, _ in self._pending:
+            keep_from = min(keep_from, cough_start)
+        keep_from = max(keep_from, self._buffer_start)
+        if keep_from > self._buffer_start:
+            self._buffer = self._buffer[keep_from - self._buffer_start:]
+            self._buffer_start = keep_from
 
 def normalize_audio(signal, fs, shouldTrim=True):
     """Normalizes and trims the audio.
@@ -84,9 +243,12 @@ def normalize_audio(signal, fs, shouldTrim=True):
 
     return signal
 
+# Storage clients reused across uploads, one per bucket
+_gcs_backends = {}
+
 def upload_blob(bucket_name, source_object, destination_blob_name):
     """
-    Uploads a file object to the bucket.
+    Uploads a file object to the bucket, waiting for the upload. See UploadQueue for background uploads.
     
     Example Usage:
     >>> Utils.upload_blob('cs329s-covid-user-coughs', recording, 'temp_data/user_cough.wav')
@@ -96,9 +258,7 @@ def upload_blob(bucket_name, source_object, destination_blob_name):
       source_object (any): object to be saved to GCP Storage
       destination_blob_name (str): path and filename to save object to
     """
-    storage_client = storage.Client()
-    bucket = storage_client.bucket(bucket_name)
-    blob = bucket.blob(destination_blob_name)
-
-    blob.upload_from_string(source_object)
-    logging.info('File uploaded.', destination_blob_name)
+    if bucket_name not in _gcs_backends:
+        _gcs_backends[bucket_name] = GcsBackend(bucket_name)
+    _gcs_backends[bucket_name].upload(destination_blob_name, source_object)
+    logging.info('File uploaded to %s.', destination_blob_name)
@@ -1,3 +1,18 @@
 from .Utils import upload_blob
 from .Utils import segment_cough
-from .Utils import normalize_audio
\ No newline at end of file
+from .Utils import CoughSegmenter
+from .Utils import normalize_audio
+from .Recording import Recording
+from .Recording import parse_recording
+from .Recording import read_payload
+from .Recording import parse_chunk
+from .Recording import to_float
+from .Recording import LIBROSA_SAMPLE_RATE
+from . import Resample
+from .ArtifactCache import ArtifactCache
+from .ArtifactCache import recording_id
+from .UploadQueue import UploadQueue
+from .UploadQueue import GcsBackend
+from .UploadQueue import LocalBackend
+from .Plots import waveform_png
+from .Plots import minmax_envelope
\ No newline at end of file